@@ -32,3 +32,34 @@ YT_COOKIES = os.getenv("YT_COOKIES", YTUB_COOKIES)
 INSTA_COOKIES = os.getenv("INSTA_COOKIES", INST_COOKIES)
 FREEMIUM_LIMIT = int(os.getenv("FREEMIUM_LIMIT", "0"))
 PREMIUM_LIMIT = int(os.getenv("PREMIUM_LIMIT", "500"))
+
+# Batch tuning
+BATCH_PREFETCH_WINDOW = int(os.getenv("BATCH_PREFETCH_WINDOW", "200")) # message IDs per get_messages call (max 200)
+BATCH_PREFETCH_AHEAD = int(os.getenv("BATCH_PREFETCH_AHEAD", "3")) # windows buffered ahead of the batch cursor
+BATCH_DOWNLOAD_WORKERS = int(os.getenv("BATCH_DOWNLOAD_WORKERS", "2")) # concurrent downloads per batch
+BATCH_PROCESS_WORKERS = int(os.getenv("BATCH_PROCESS_WORKERS", "1")) # concurrent rename/probe/thumbnail jobs per batch
+BATCH_QUEUE_DEPTH = int(os.getenv("BATCH_QUEUE_DEPTH", "3")) # max downloaded items waiting for upload (bounds disk use)
+MAX_CONCURRENT_BATCHES = int(os.getenv("MAX_CONCURRENT_BATCHES", "5")) # batch/single jobs running at once across all users
+SHUTDOWN_GRACE = int(os.getenv("SHUTDOWN_GRACE", "25")) # seconds in-flight uploads get to finish after SIGTERM before checkpoints are saved
+PARALLEL_DOWNLOAD_CONNECTIONS = int(os.getenv("PARALLEL_DOWNLOAD_CONNECTIONS", "4")) # media-DC connections per large download (1 = sequential)
+PARALLEL_DOWNLOAD_MIN_MB = int(os.getenv("PARALLEL_DOWNLOAD_MIN_MB", "20")) # smaller files use the plain sequential download
+RELAY_MODE = os.getenv("RELAY_MODE", "true").lower() == "true" # stream media straight from source to destination without a local copy
+RELAY_BUFFER_MB = int(os.getenv("RELAY_BUFFER_MB", "4")) # per-item ring buffer between the source stream and upload parts
+MEDIA_CACHE = os.getenv("MEDIA_CACHE", "true").lower() == "true" # reuse file_ids of earlier uploads of the same source media
+DISK_CACHE_DIR = os.getenv("DISK_CACHE_DIR", "cache") # downloaded media kept by file_unique_id for retries and reruns
+DISK_CACHE_MB = int(os.getenv("DISK_CACHE_MB", "2048")) # byte budget of the disk cache, least recently used files go first (0 = off)
+PEER_NEGATIVE_TTL = int(os.getenv("PEER_NEGATIVE_TTL", "600")) # seconds a chat that could not be resolved is reported inaccessible without retrying
+SETTINGS_CACHE_SIZE = int(os.getenv("SETTINGS_CACHE_SIZE", "10000")) # user documents kept in memory (0 = read Mongo every time)
+SETTINGS_CACHE_TTL = int(os.getenv("SETTINGS_CACHE_TTL", "300")) # seconds a cached user document is trusted
+SETTINGS_CHANGE_STREAM = os.getenv("SETTINGS_CHANGE_STREAM", "false").lower() == "true" # invalidate cached settings on writes from other replicas (needs a replica set)
+PROBE_WORKERS = int(os.getenv("PROBE_WORKERS", "2")) # threads reading video container headers, also caps concurrent ffprobe runs
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2")) # ffmpeg processes grabbing video thumbnails at once
+THUMB_CACHE_ENTRIES = int(os.getenv("THUMB_CACHE_ENTRIES", "512")) # custom thumbnails (~20 KB each) kept in memory by each replica
+PREMIUM_SESSIONS = os.getenv("PREMIUM_SESSIONS", "").split() # extra premium session strings (space separated) that upload files over 2 GB alongside STRING
+PREMIUM_SESSION_UPLOADS = int(os.getenv("PREMIUM_SESSION_UPLOADS", "2")) # concurrent large uploads per premium session
+LARGE_UPLOAD_ATTEMPTS = int(os.getenv("LARGE_UPLOAD_ATTEMPTS", "3")) # premium sessions tried before a large upload fails
+UPLOAD_CONNECTIONS = int(os.getenv("UPLOAD_CONNECTIONS", "4")) # concurrent upload-part connections per file for the bot clients
+PREMIUM_UPLOAD_CONNECTIONS = int(os.getenv("PREMIUM_UPLOAD_CONNECTIONS", "8")) # same for the premium sessions uploading files over 2 GB
+PARALLEL_UPLOAD_MIN_MB = int(os.getenv("PARALLEL_UPLOAD_MIN_MB", "10")) # smaller files use Pyrogram's sequential upload
+YTDL_WORKERS = int(os.getenv("YTDL_WORKERS", "2")) # yt-dlp worker processes shared by /dl and /adl
+YTDL_INFO_TTL = int(os.getenv("YTDL_INFO_TTL", "300")) # seconds extracted yt-dlp info is reused; stream URLs expire after a few hours
@@ -6,11 +6,14 @@ import asyncio
 from shared_client import start_client
 import importlib
 import os
+import signal
 import sys
 
 # Explicitly import custom_filters module early to ensure filters are defined
 import utils.custom_filters
 
+PLUGIN_MODULES = [] # Imported plugin modules, used for the optional initialize()/shutdown() hooks
+
 async def load_and_run_plugins():
     """
     Starts the Telegram clients and dynamically loads and initializes plugins
@@ -29,14 +32,11 @@ async def load_and_run_plugins():
         try:
             # Import the plugin module
             module = importlib.import_module(f"plugins.{plugin}")
+            PLUGIN_MODULES.append(module)
             print(f"Successfully imported plugin: {plugin}") # Optional: log successful import
 
-            # The original code looked for a run_<plugin>_plugin function,
-            # but your plugins define handlers directly using decorators.
-            # Importing the module is enough to register the handlers with Pyrogram/Telethon clients.
-            # If plugins had specific initialization logic beyond handler registration,
-            # you would call it here if it existed (e.g., if hasattr(module, 'initialize'): await module.initialize()).
-            # Based on the provided code, simple import is sufficient to register handlers.
+            # Plugins define handlers directly using decorators, so importing the module
+            # is enough to register them with the Pyrogram/Telethon clients.
 
         except Exception as e:
             # Log errors during plugin import
@@ -44,19 +44,45 @@ async def load_and_run_plugins():
             # Depending on severity, you might want to exit or continue
             # sys.exit(1) # Uncomment if a failed plugin import should stop the bot
 
+    # Run optional initialize() hooks once every plugin is imported (e.g. batch resumes interrupted jobs)
+    for module in PLUGIN_MODULES:
+        if hasattr(module, 'initialize'):
+            try:
+                await module.initialize()
+            except Exception as e:
+                print(f"Error initializing plugin {module.__name__}: {e}", file=sys.stderr)
+
     # The clients are running and handlers are registered.
     # The bot will now listen for incoming updates.
 
 
+async def shutdown_plugins():
+    """Runs optional shutdown() hooks so plugins can drain work and persist state."""
+    for module in reversed(PLUGIN_MODULES):
+        if hasattr(module, 'shutdown'):
+            try:
+                await module.shutdown()
+            except Exception as e:
+                print(f"Error shutting down plugin {module.__name__}: {e}", file=sys.stderr)
+
+
 async def main():
     """Main function to load plugins and keep the bot running."""
     await load_and_run_plugins()
     print("Bot is running. Press Ctrl+C to stop.")
     # Keep the main loop running to allow the clients to process updates
     # The Pyrogram/Telethon clients have their own internal loops listening for updates.
-    # This sleep loop prevents the main asyncio event loop from closing.
-    while True:
-        await asyncio.sleep(3600) # Sleep for a long time, bot is event-driven
+    # Waiting on the stop event keeps the main asyncio event loop alive until SIGTERM/SIGINT.
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass # Not supported on Windows; Ctrl+C still raises KeyboardInterrupt there
+    await stop_event.wait()
+    print("Shutdown signal received, finishing in-flight work...")
+    await shutdown_plugins()
 
 if __name__ == "__main__":
     print("Starting clients ...")
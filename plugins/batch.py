@@ -4,24 +4,44 @@
 
 import os, re, time, asyncio
 import json
-from typing import Dict, Any, Optional
+import functools
+import uuid
+from typing import Dict, Any, List, Optional
 from pyrogram import Client, filters
-from pyrogram.types import Message
-from pyrogram.errors import UserNotParticipant, MessageNotModified, RPCError
+from pyrogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo, InputMediaAudio, InputMediaDocument
+from pyrogram.errors import UserNotParticipant, MessageNotModified, RPCError, BadRequest
 from config import API_ID, API_HASH, LOG_GROUP, STRING, FORCE_SUB, FREEMIUM_LIMIT, PREMIUM_LIMIT
-from utils.func import get_user_data, screenshot, thumbnail, get_video_metadata
-from utils.func import get_user_data_key, process_text_with_rules, is_premium_user, E, get_display_name
+from config import BATCH_PREFETCH_WINDOW, BATCH_PREFETCH_AHEAD, BATCH_DOWNLOAD_WORKERS, BATCH_PROCESS_WORKERS, BATCH_QUEUE_DEPTH, MAX_CONCURRENT_BATCHES, SHUTDOWN_GRACE
+from config import RELAY_MODE, RELAY_BUFFER_MB, MEDIA_CACHE, PREMIUM_SESSION_UPLOADS, LARGE_UPLOAD_ATTEMPTS, PREMIUM_UPLOAD_CONNECTIONS
+from utils.func import get_user_data, thumbnail, thumbnail_version, get_video_metadata
+from utils.func import get_user_data_key, process_text_with_rules, is_premium_user, E, get_display_name, settings_cache
 # Import app, userbot, UB, and UC from shared_client
-from shared_client import app as X, userbot as Y, UB, UC # Import caches from shared_client
-from plugins.settings import rename_file # Import rename_file from settings
+from shared_client import app as X, userbot as Y, premium_userbots, UB, UC # Import caches from shared_client
+from plugins.settings import rename_file, get_renamed_file_name # Import rename helpers from settings
 from plugins.start import subscribe # Import subscribe from start
 from utils.custom_filters import login_in_progress # Import the custom filter
 from utils.encrypt import dcs
+from utils.prefetch import MessagePrefetcher, group_albums
+from utils.pipeline import OrderedPipeline
+from utils.scheduler import BatchScheduler, Job
+from utils.ratelimit import limiter
+from utils.downloader import download_media as fast_download, session_pool, get_media, media_file_name, target_path
+from utils.relay import RelayFile, UploadedFile, install_save_file_hook
+from utils.media_cache import media_cache
+from utils.disk_cache import disk_cache
+from utils.planner import BatchPlan, plan_batch, trim_plan, format_plan, throughput
+from utils.ledger import ledger, result_code
+from utils.peer_cache import peer_cache, normalize_chat
+from utils.thumbs import as_upload, source_thumbnail, thumbnailer
+from utils.uploader_pool import UploaderPool
+from utils.uploader import ParallelUpload, upload_source, set_upload_connections
 import logging
 
 # Removed UB and UC definitions - they are now in shared_client
 
 emp: Dict[Any, bool] = {} # Cache for empty chat status {chat_id: bool}
+P: Dict[int, int] = {} # Last reported progress step per progress message {message_id: step}
+Z: Dict[int, Dict[str, Any]] = {} # Command sequence state for /batch and /single {user_id: state}
 
 ACTIVE_USERS: Dict[str, Dict[str, Any]] = {} # Track active batch/single tasks {user_id: task_info}
 ACTIVE_USERS_FILE = "active_users.json"
@@ -31,7 +51,8 @@ ACTIVE_USERS_FILE = "active_users.json"
 async def edit_message_safely(message: Message, text: str, reply_markup=None):
     """Helper function to edit message and handle errors like MessageNotModified"""
     try:
-        await message.edit_text(text, reply_markup=reply_markup)
+        # Status edits are paced per chat but never retried; a FloodWait just drops this edit
+        await limiter.call(message._client, 'edit_message_text', message.chat.id, message.edit_text, text, reply_markup=reply_markup, retry=False)
     except MessageNotModified:
         pass # Ignore if the message hasn't changed
     except RPCError as e:
@@ -61,16 +82,22 @@ def load_active_users():
         print(f"Error loading active users: {e}")
         return {} # Return empty dict on error
 
+def _write_active_users(data: str):
+    """Writes the state file atomically so a crash mid-write never leaves a truncated file behind."""
+    tmp_path = f"{ACTIVE_USERS_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, ACTIVE_USERS_FILE)
+
 async def save_active_users_to_file():
     """Saves active users data to a JSON file."""
     try:
-        # Use asyncio.to_thread for file operations to not block event loop
-        await asyncio.to_thread(
-            json.dump,
-            ACTIVE_USERS,
-            open(ACTIVE_USERS_FILE, 'w'),
-            indent=4 # Pretty print for readability
-        )
+        data = json.dumps(ACTIVE_USERS, indent=4) # Snapshot on the loop; writers may mutate ACTIVE_USERS meanwhile
+        async with SAVE_LOCK:
+            # Use asyncio.to_thread for file operations to not block event loop
+            await asyncio.to_thread(_write_active_users, data)
     except Exception as e:
         print(f"Error saving active users: {e}")
 
@@ -83,12 +110,14 @@ def is_user_active(user_id: int) -> bool:
     """Checks if a user has an active batch/single task."""
     return str(user_id) in ACTIVE_USERS
 
-async def update_batch_progress(user_id: int, current: int, success: int):
-    """Updates the progress of an active batch task."""
+async def update_batch_progress(user_id: int, current: int, success: int, last_done: Optional[int] = None):
+    """Updates the progress of an active batch task; last_done is the resume checkpoint (last message ID delivered in order)."""
     user_str = str(user_id)
     if user_str in ACTIVE_USERS:
         ACTIVE_USERS[user_str]["current"] = current
         ACTIVE_USERS[user_str]["success"] = success
+        if last_done is not None:
+            ACTIVE_USERS[user_str]["last_done"] = last_done
         # Only save to file periodically or on significant changes to reduce I/O
         # For simplicity here, saving on every update, but can be optimized
         await save_active_users_to_file()
@@ -118,21 +147,11 @@ def get_batch_info(user_id: int) -> Optional[Dict[str, Any]]:
     """Gets information about an active batch task."""
     return ACTIVE_USERS.get(str(user_id))
 
-# Load active users on startup
+# Load active users on startup; unfinished tasks are resumed by initialize()
 ACTIVE_USERS = load_active_users()
+SAVE_LOCK = asyncio.Lock()
 
 # --- Telegram Client and Message Fetching ---
-async def upd_dlg(c: Client):
-    """Updates dialogs for a Pyrogram client."""
-    try:
-        # Iterating through dialogs helps ensure the client has cached chat information
-        async for _ in c.get_dialogs(limit=100):
-            pass
-        return True
-    except Exception as e:
-        print(f'Failed to update dialogs for client {c.me.id if c.me else "unknown"}: {e}')
-        return False
-
 async def get_msg(bot_client: Client, user_client: Optional[Client], chat_identifier: Any, message_id: int, link_type: str) -> Optional[Message]:
     """
     Fetches a message using either the bot client or a user client.
@@ -142,10 +161,11 @@ async def get_msg(bot_client: Client, user_client: Optional[Client], chat_identi
         # Prioritize user client if available and link is private or requires user context
         if user_client and user_client.is_connected and (link_type == 'private' or chat_identifier in UC.keys()): # Check if user_client is connected
              try:
-                 # Ensure user client dialogs are updated for private chats
-                 await upd_dlg(user_client)
-                 # Pyrogram's get_messages is robust with various chat identifiers
-                 return await user_client.get_messages(chat_identifier, message_id)
+                 # Resolve just this peer (cached per client); chats known to be inaccessible fail without an RPC
+                 if not await peer_cache.resolve(user_client, chat_identifier):
+                     print(f"User client cannot access {chat_identifier}")
+                     return None
+                 return await limiter.call(user_client, 'get_messages', None, user_client.get_messages, normalize_chat(chat_identifier), message_id)
              except Exception as e:
                  print(f"Attempt with user client failed for {chat_identifier}/{message_id}: {e}")
                  # Fallback or indicate failure? For private, user client is usually necessary.
@@ -157,16 +177,17 @@ async def get_msg(bot_client: Client, user_client: Optional[Client], chat_identi
         elif bot_client and bot_client.is_connected: # Check if bot_client is connected
             try:
                  # Use bot client for public links or if user client is not available/connected
-                 xm = await bot_client.get_messages(chat_identifier, message_id)
+                 xm = await limiter.call(bot_client, 'get_messages', None, bot_client.get_messages, chat_identifier, message_id)
                  emp[chat_identifier] = getattr(xm, "empty", False) # Cache empty status
                  if emp[chat_identifier]:
                      # If message is empty (maybe due to joining), try joining and refetching with user client if possible
                      if user_client and user_client.is_connected: # Check if user_client is available and connected
                          try: await user_client.join_chat(chat_identifier) # Join with user client
                          except Exception: pass # Ignore join errors
+                         peer_cache.forget(user_client, chat_identifier) # A cached "inaccessible" may no longer hold
                          # Try fetching with user client after joining
                          try:
-                             xm = await user_client.get_messages((await user_client.get_chat(chat_identifier)).id, message_id)
+                             xm = await limiter.call(user_client, 'get_messages', None, user_client.get_messages, (await user_client.get_chat(chat_identifier)).id, message_id)
                          except Exception as e:
                              print(f"Re-fetch with user client after empty failed: {e}")
                              pass # Keep the original xm (likely None or Empty)
@@ -185,6 +206,27 @@ async def get_msg(bot_client: Client, user_client: Optional[Client], chat_identi
         print(f'General Error in get_msg for {chat_identifier}/{message_id}: {e}')
         return None
 
+async def get_fetch_client(bot_client: Client, user_client: Optional[Client], chat_identifier: Any, first_id: int, link_type: str):
+    """
+    Picks the client (and chat reference) used to bulk-fetch a batch, following the same rules as get_msg
+    but paying the peer resolution / join probe once per batch instead of once per message.
+    Returns (client, chat) or (None, chat_identifier) if no client is usable.
+    """
+    if user_client and user_client.is_connected and (link_type == 'private' or chat_identifier in UC.keys()):
+        if not await peer_cache.resolve(user_client, chat_identifier):
+            raise RuntimeError(f'Your account cannot access chat {chat_identifier}.')
+        return user_client, normalize_chat(chat_identifier)
+    if bot_client and bot_client.is_connected:
+        # Probe the first message; get_msg records whether the bot sees the chat as empty and joins with the user client if so
+        await get_msg(bot_client, user_client, chat_identifier, first_id, link_type)
+        if emp.get(chat_identifier) and user_client and user_client.is_connected:
+            try:
+                return user_client, (await user_client.get_chat(chat_identifier)).id
+            except Exception as e:
+                print(f"Could not switch batch fetching to user client for {chat_identifier}: {e}")
+        return bot_client, chat_identifier
+    return None, chat_identifier
+
 # UB and UC are now imported from shared_client
 
 async def get_ubot(uid: int) -> Optional[Client]:
@@ -224,7 +266,7 @@ async def get_uclient(uid: int) -> Optional[Client]:
             # Ensure unique session name for each user client
             gg = Client(f'{uid}_user_client', api_id=API_ID, api_hash=API_HASH, device_model="v3saver", session_string=ss, in_memory=True)
             await gg.start()
-            # await upd_dlg(gg) # Update dialogs for the new client - done within get_msg if needed
+            # Peers are resolved on demand through peer_cache
             UC[uid] = gg
             return gg
         except Exception as e:
@@ -257,6 +299,8 @@ async def prog(current: int, total: int, client: Client, chat_id: int, message_i
 
     # Only edit if a significant step is reached or at the beginning/end
     if message_id not in P or P[message_id] != step or p >= 99: # Use 99 to ensure final update
+        if not limiter.allow(client, 'edit_message_text', chat_id):
+            return # Chat is being throttled; skip this update, a later callback will catch up
         P[message_id] = step
         c_mb = current / (1024 * 1024)
         t_mb = total / (1024 * 1024)
@@ -294,31 +338,31 @@ async def send_direct(c: Client, m: Message, target_chat_id: int, caption_text:
     """Sends a message directly using file_id if available."""
     try:
         if m.video:
-            await c.send_video(target_chat_id, m.video.file_id, caption=caption_text, duration=m.video.duration, width=m.video.width, height=m.video.height, reply_to_message_id=reply_to_message_id)
+            await limiter.call(c, 'send', target_chat_id, c.send_video, target_chat_id, m.video.file_id, caption=caption_text, duration=m.video.duration, width=m.video.width, height=m.video.height, reply_to_message_id=reply_to_message_id)
         elif m.video_note:
-            await c.send_video_note(target_chat_id, m.video_note.file_id, reply_to_message_id=reply_to_message_id)
+            await limiter.call(c, 'send', target_chat_id, c.send_video_note, target_chat_id, m.video_note.file_id, reply_to_message_id=reply_to_message_id)
         elif m.voice:
-            await c.send_voice(target_chat_id, m.voice.file_id, reply_to_message_id=reply_to_message_id)
+            await limiter.call(c, 'send', target_chat_id, c.send_voice, target_chat_id, m.voice.file_id, reply_to_message_id=reply_to_message_id)
         elif m.sticker:
              # Stickers might have limitations on direct forwarding/sending by ID
              # Attempting to send by file_id might not work like other media
              # Fallback to copy or download/upload might be needed if this fails
              # For now, keeping the original logic but noting potential issue
-            await c.send_sticker(target_chat_id, m.sticker.file_id, reply_to_message_id=reply_to_message_id)
+            await limiter.call(c, 'send', target_chat_id, c.send_sticker, target_chat_id, m.sticker.file_id, reply_to_message_id=reply_to_message_id)
         elif m.audio:
-            await c.send_audio(target_chat_id, m.audio.file_id, caption=caption_text, duration=m.audio.duration, performer=m.audio.performer, title=m.audio.title, reply_to_message_id=reply_to_message_id)
+            await limiter.call(c, 'send', target_chat_id, c.send_audio, target_chat_id, m.audio.file_id, caption=caption_text, duration=m.audio.duration, performer=m.audio.performer, title=m.audio.title, reply_to_message_id=reply_to_message_id)
         elif m.photo:
             # Photos can have multiple sizes, using the largest one
             photo_id = m.photo.file_id if hasattr(m.photo, 'file_id') else m.photo.sizes[-1].file_id if hasattr(m.photo, 'sizes') and m.photo.sizes else None
             if photo_id:
-                 await c.send_photo(target_chat_id, photo_id, caption=caption_text, reply_to_message_id=reply_to_message_id)
+                 await limiter.call(c, 'send', target_chat_id, c.send_photo, target_chat_id, photo_id, caption=caption_text, reply_to_message_id=reply_to_message_id)
             else:
                  print(f"Could not get file_id for photo in message {m.id}")
                  return False
         elif m.document:
-            await c.send_document(target_chat_id, m.document.file_id, caption=caption_text, file_name=m.document.file_name, reply_to_message_id=reply_to_message_id)
+            await limiter.call(c, 'send', target_chat_id, c.send_document, target_chat_id, m.document.file_id, caption=caption_text, file_name=m.document.file_name, reply_to_message_id=reply_to_message_id)
         elif m.text: # Handle text messages explicitly if needed for direct send (though process_msg handles text too)
-             await c.send_message(target_chat_id, m.text.markdown, reply_to_message_id=reply_to_message_id)
+             await limiter.call(c, 'send', target_chat_id, c.send_message, target_chat_id, m.text.markdown, reply_to_message_id=reply_to_message_id)
         else:
             return False # No media or recognized content to send directly
         return True
@@ -327,332 +371,1020 @@ async def send_direct(c: Client, m: Message, target_chat_id: int, caption_text:
         return False
 
 # --- Message Processing (Download, Rename, Upload) ---
-async def process_msg(bot_client: Client, user_client: Optional[Client], message: Message, destination_chat_id: str, link_type: str, user_id: int, source_chat_identifier: Any) -> str:
-    """Processes a single message: downloads, renames, and uploads."""
-    download_progress_msg = None # Initialize to None
-    renamed_file = None # Initialize to None
-    thumb_path = None # Initialize to None
+# process_msg is split into stages so the batch runner can pipeline them:
+#   download_item -> process_item (rename, probe, thumbnail) -> deliver_msg (upload/post, in order)
+# Only deliver_msg posts content to the destination chat.
+VIDEO_FILE_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mpeg', '.mpg', '.3gp')
+
+install_save_file_hook() # Lets send_* upload RelayFile objects, which stream instead of reading a path
+uploader_pool = UploaderPool(PREMIUM_SESSION_UPLOADS) # Premium sessions for files over 2GB, filled by initialize()
+
+async def can_relay(item: Dict[str, Any]) -> bool:
+    """True when an item can be streamed from source to destination without a local copy."""
+    message = item['message']
+    media = get_media(message)
+    if not RELAY_MODE or item.get('relay_fallback') or media is None or message.video_note or not getattr(media, 'file_size', 0):
+        return False
+    # Only videos genuinely need the local file: for probing when the source lacks attributes,
+    # and for the screenshot thumbnail when neither the user nor the source has one
+    if message.video or media_file_name(message, media).lower().endswith(VIDEO_FILE_EXTENSIONS):
+        if not source_video_attributes(message)[0] or not (getattr(media, 'thumbs', None) or await thumbnail_version(item['user_id'])):
+            return False
+    return True
+
+def source_video_attributes(message: Message):
+    """(duration, width, height) carried by the source message, or (0, 1, 1) if any is missing."""
+    video = message.video or message.animation
+    if video and video.duration and video.width and video.height:
+        return video.duration, video.width, video.height
+    return 0, 1, 1
+
+async def pick_thumbnail(item: Dict[str, Any], media: Any):
+    """The user's custom thumbnail, else the smallest thumbnail of the source media, else None."""
+    custom = await thumbnail(item['user_id'])
+    if custom or not item.get('source_client'):
+        return custom
+    return await source_thumbnail(item['source_client'], media)
+
+async def media_cache_key(bot_client: Client, item: Dict[str, Any]) -> Optional[str]:
+    """Cache key of an item's media as this bot would upload it for this user, or None if it cannot be cached."""
+    message, user_id = item['message'], item['user_id']
+    media = get_media(message)
+    bot_id = getattr(getattr(bot_client, 'me', None), 'id', None)
+    if not MEDIA_CACHE or media is None or not getattr(media, 'file_unique_id', None) or not bot_id:
+        return None
+    file_name = await get_renamed_file_name(media_file_name(message, media), user_id)
+    thumb_version = await thumbnail_version(user_id)
+    # A custom thumbnail makes the upload user-specific; its version keeps entries fresh after /setthumb
+    thumb_sig = f'{user_id}:{thumb_version}' if thumb_version else ''
+    return media_cache.make_key(media.file_unique_id, bot_id, file_name, thumb_sig)
+
+async def remember_upload(item: Dict[str, Any], sent: Optional[Message]):
+    """Records the file_id of a finished upload so later requests for the same media skip the transfer."""
+    key = item.get('cache_key')
+    if not key or not sent or not sent.media:
+        return
+    kind = sent.media.value
+    media = getattr(sent, kind, None)
+    if not media or not getattr(media, 'file_id', None):
+        return
+    attributes = {name: getattr(media, name) for name in ('file_name', 'file_size', 'duration', 'width', 'height', 'mime_type') if getattr(media, name, None) is not None}
+    await media_cache.put(key, media.file_id, kind, attributes)
 
+async def send_cached_item(bot_client: Client, item: Dict[str, Any]) -> Optional[str]:
+    """Posts an item from a media cache hit. Returns None when the transfer has to run after all."""
+    entry, target_chat_id = item['cached'], item['target_chat_id']
     try:
-        # Determine the actual target chat ID and reply message ID from user settings
-        cfg_chat = await get_user_data_key(user_id, 'chat_id', None)
-        target_chat_id = int(destination_chat_id) # Default to the user's chat
-
-        reply_to_message_id = None
-        if cfg_chat:
+        await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_cached_media,
+            target_chat_id,
+            entry['file_id'],
+            caption=item.get('caption'),
+            reply_to_message_id=item['reply_to']
+        )
+        return 'Done (cached).'
+    except BadRequest as e:
+        # Telegram no longer accepts this file_id (expired, deleted or invalid)
+        print(f"Cached media rejected for message {item['message'].id}, invalidating: {e}")
+        await media_cache.invalidate(item['cache_key'])
+    except Exception as e:
+        print(f"Sending cached media failed for message {item['message'].id}: {e}")
+    return None
+
+def cleanup_item(item: Dict[str, Any]):
+    """Removes any local files an item still holds. Thumbnails are in-memory files and need no cleanup."""
+    for key in ('file', 'downloaded_file'):
+        path = item.get(key)
+        if not isinstance(path, str):
+            continue # RelayFile streams leave nothing on disk
+        if disk_cache.owns(path):
+            continue # Cached copies are evicted by the cache itself
+        if path and os.path.exists(path):
             try:
-                if '/' in cfg_chat:
-                    parts = cfg_chat.split('/', 1)
-                    target_chat_id = int(parts[0])
-                    reply_to_message_id = int(parts[1]) if len(parts) > 1 else None
-                else:
-                    target_chat_id = int(cfg_chat)
-            except ValueError:
-                # If configured chat_id is invalid, use default
-                print(f"Invalid configured chat_id for user {user_id}: {cfg_chat}. Using default.")
-                target_chat_id = int(destination_chat_id)
-                reply_to_message_id = None # Ensure no invalid reply ID is used
-
-        # --- Process Media Messages ---
+                os.remove(path)
+            except Exception as e:
+                print(f"Error removing {path}: {e}")
+
+async def get_target_chat(user_id: int, destination_chat_id: str):
+    """Determines the actual target chat ID and reply message ID from user settings."""
+    cfg_chat = await get_user_data_key(user_id, 'chat_id', None)
+    target_chat_id = int(destination_chat_id) # Default to the user's chat
+
+    reply_to_message_id = None
+    if cfg_chat:
+        try:
+            if '/' in cfg_chat:
+                parts = cfg_chat.split('/', 1)
+                target_chat_id = int(parts[0])
+                reply_to_message_id = int(parts[1]) if len(parts) > 1 else None
+            else:
+                target_chat_id = int(cfg_chat)
+        except ValueError:
+            # If configured chat_id is invalid, use default
+            print(f"Invalid configured chat_id for user {user_id}: {cfg_chat}. Using default.")
+            target_chat_id = int(destination_chat_id)
+            reply_to_message_id = None # Ensure no invalid reply ID is used
+    return target_chat_id, reply_to_message_id
+
+async def build_caption(user_id: int, orig_text: str) -> str:
+    """Applies the user's text processing rules and appends the user-defined caption."""
+    proc_text = await process_text_with_rules(user_id, orig_text)
+    user_cap = await get_user_data_key(user_id, 'caption', '')
+    # Combine processed original text and user-defined caption
+    return f'{proc_text}\n\n{user_cap}' if proc_text and user_cap else user_cap if user_cap else proc_text
+
+def can_send_direct(message: Message, link_type: str, source_chat_identifier: Any) -> bool:
+    """True if a media message may be re-sent by file_id instead of being transferred."""
+    return link_type == 'public' and not emp.get(source_chat_identifier, False) and not getattr(message, 'web_page', None) and not message.empty
+
+async def prepare_msg(bot_client: Client, user_client: Optional[Client], message: Message, destination_chat_id: str, link_type: str, user_id: int, source_chat_identifier: Any) -> Dict[str, Any]:
+    """
+    Works out how a message will be delivered without posting anything to the destination.
+    Returns an item dict; items carrying 'result' are already finished.
+    """
+    item: Dict[str, Any] = {'message': message, 'user_id': user_id}
+    settings_cache.count_message() # Denominator of the settings queries-per-message metric
+    try:
+        item['target_chat_id'], item['reply_to'] = await get_target_chat(user_id, destination_chat_id)
+
+        # --- Media Messages ---
         if message.media:
             # Get original text and apply user's text processing rules
-            orig_text = message.caption.markdown if message.caption else ''
-            proc_text = await process_text_with_rules(user_id, orig_text)
-            user_cap = await get_user_data_key(user_id, 'caption', '')
-            # Combine processed original text and user-defined caption
-            final_caption = f'{proc_text}\n\n{user_cap}' if proc_text and user_cap else user_cap if user_cap else proc_text
+            item['caption'] = await build_caption(user_id, message.caption.markdown if message.caption else '')
 
             # Try sending directly using file_id if possible (e.g., public channels, not restricted)
             # Note: Direct send might not work for restricted content even from public channels sometimes
-            if link_type == 'public' and not emp.get(source_chat_identifier, False):
-                 # Check if message is restricted (basic check) - direct send usually fails for restricted
-                 # If message has web_page, it's likely linked media, which might be restricted.
-                 # If message is empty, it's definitely restricted content.
-                 if not getattr(message, 'web_page', None) and not message.empty: # Basic check for non-restricted-looking messages
-                      if await send_direct(bot_client, message, target_chat_id, final_caption, reply_to_message_id):
-                           return 'Sent directly.'
-                 # If direct send fails or message looks restricted, proceed to download/upload
-
-            # If direct send was not attempted or failed, proceed with download/upload
-            start_time = time.time()
-            # Send initial downloading message in the user's chat
-            download_progress_msg = await bot_client.send_message(target_chat_id, 'Downloading...')
-
-            # Download the media using the user client (preferred for restricted content)
-            # Fallback to bot client if user client is not available or fails
-            client_to_use = user_client if user_client and user_client.is_connected else bot_client if bot_client and bot_client.is_connected else None
-
-            if not client_to_use:
-                 await edit_message_safely(download_progress_msg, 'Error: No client available for download.')
-                 return 'Failed.'
-
-            downloaded_file = None # Initialize
-            try:
-                 # Download the file
-                 downloaded_file = await client_to_use.download_media(
-                     message,
-                     progress=prog, # Pass the progress callback
-                     progress_args=(bot_client, target_chat_id, download_progress_msg.id, start_time) # Pass bot_client for editing
-                 )
-            except Exception as e:
-                 await edit_message_safely(download_progress_msg, f'Download failed: {str(e)[:50]}')
-                 print(f"Download failed for message {message.id}: {e}")
-                 return 'Failed.'
+            # If message has web_page, it's likely linked media, which might be restricted.
+            # If message is empty, it's definitely restricted content.
+            if can_send_direct(message, link_type, source_chat_identifier):
+                item['kind'] = 'direct' # Attempted at delivery time, falls back to download/upload
+            else:
+                item['kind'] = 'file'
 
+        # --- Text Messages ---
+        elif message.text:
+            # For text messages, just send the text with processed rules if any
+            item['kind'] = 'text'
+            item['text'] = await build_caption(user_id, message.text.markdown)
+            if not item['text']:
+                item['result'] = 'Skipped (Empty text after processing).'
 
-            if not downloaded_file or not os.path.exists(downloaded_file):
-                await edit_message_safely(download_progress_msg, 'Download failed or file not found.')
-                return 'Failed.'
+        else:
+            # Handle unsupported message types
+            print(f"Unsupported message type for message {message.id}")
+            item['result'] = 'Unsupported message type.'
+
+    except Exception as e:
+        print(f'Unexpected Error preparing message {message.id}: {e}')
+        item['result'] = f'Error: {str(e)[:50]}'
+    return item
+
+async def download_item(bot_client: Client, user_client: Optional[Client], item: Dict[str, Any]) -> Dict[str, Any]:
+    """Downloads the media of a 'file' item. Sets item['result'] on failure."""
+    if 'result' in item or item.get('kind') != 'file':
+        return item
+    message = item['message']
+    try:
+        if 'cache_key' not in item:
+            item['cache_key'] = await media_cache_key(bot_client, item)
+            cached = await media_cache.get(item['cache_key']) if item['cache_key'] else None
+            if cached:
+                item['cached'] = cached # Posted with send_cached_media, no transfer needed
+                return item
+
+        start_time = time.time()
+        # Send initial downloading message in the user's chat (reused when a relay falls back to disk)
+        if item.get('status_msg'):
+            await edit_message_safely(item['status_msg'], 'Downloading...')
+        else:
+            item['status_msg'] = await limiter.call(bot_client, 'send', item['target_chat_id'], bot_client.send_message, item['target_chat_id'], 'Downloading...')
+
+        # Download the media using the user client (preferred for restricted content)
+        # Fallback to bot client if user client is not available or fails
+        client_to_use = user_client if user_client and user_client.is_connected else bot_client if bot_client and bot_client.is_connected else None
+
+        if not client_to_use:
+             await edit_message_safely(item['status_msg'], 'Error: No client available for download.')
+             item['result'] = 'Failed.'
+             return item
+        item['source_client'] = client_to_use # Also fetches the source thumbnail later
+
+        # A file kept in the local disk cache skips the download completely
+        media = get_media(message)
+        cache_id = getattr(media, 'file_unique_id', None) if media else None
+        cached_file = await disk_cache.fetch(cache_id, target_path(message, media, None)) if cache_id else None
+        if cached_file:
+            item['downloaded_file'] = cached_file
+            return item
+
+        if await can_relay(item):
+            item['relay_client'] = client_to_use # Streamed during upload, nothing is written to disk
+            return item
 
-            await edit_message_safely(download_progress_msg, 'Renaming...')
-            # Apply renaming and text filtering rules to the filename
-            # rename_file function is imported from plugins.settings
+        try:
+             # Download the file; large media is fetched over several connections in parallel
+             item['downloaded_file'] = await fast_download(
+                 client_to_use,
+                 message,
+                 progress=prog, # Pass the progress callback
+                 progress_args=(bot_client, item['target_chat_id'], item['status_msg'].id, start_time) # Pass bot_client for editing
+             )
+        except Exception as e:
+             await edit_message_safely(item['status_msg'], f'Download failed: {str(e)[:50]}')
+             print(f"Download failed for message {message.id}: {e}")
+             item['result'] = 'Failed.'
+             return item
+
+        if not item['downloaded_file'] or not os.path.exists(item['downloaded_file']):
+            await edit_message_safely(item['status_msg'], 'Download failed or file not found.')
+            item['result'] = 'Failed.'
+        elif cache_id:
+            await disk_cache.store(cache_id, item['downloaded_file']) # Kept for retries and reruns with other settings
+    except Exception as e:
+        print(f'Unexpected Error downloading message {message.id}: {e}')
+        cleanup_item(item)
+        if item.get('status_msg'):
+            await edit_message_safely(item['status_msg'], f'An unexpected error occurred: {str(e)[:50]}')
+        item['result'] = f'Error: {str(e)[:50]}'
+    return item
+
+async def process_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Renames a downloaded file and gathers the video metadata and thumbnail needed for upload."""
+    if 'result' in item:
+        return item
+    if 'relay_client' in item:
+        return await process_relay_item(item)
+    if 'downloaded_file' not in item:
+        return item
+    message, user_id, downloaded_file = item['message'], item['user_id'], item['downloaded_file']
+    try:
+        await edit_message_safely(item['status_msg'], 'Renaming...')
+        # Apply renaming and text filtering rules to the filename
+        # rename_file function is imported from plugins.settings
+        try:
+             renamed_file = await rename_file(downloaded_file, user_id, item['status_msg']) # Pass message for potential edits in rename_file
+             if not renamed_file or not os.path.exists(renamed_file):
+                  print(f"Renaming failed for {downloaded_file}")
+                  renamed_file = downloaded_file # Use original if renaming fails
+        except Exception as e:
+             print(f"Error during renaming {downloaded_file}: {e}")
+             renamed_file = downloaded_file # Use original if renaming fails
+        item['file'] = renamed_file
+        item['file_name'] = os.path.basename(renamed_file)
+        item.pop('downloaded_file', None)
+        item['size'] = os.path.getsize(renamed_file)
+
+        # Video attributes and thumbnail come from the source message when it has them;
+        # the file is probed and screenshotted only for what is missing
+        is_video = bool(message.video) or renamed_file.lower().endswith(VIDEO_FILE_EXTENSIONS)
+        duration, width, height = source_video_attributes(message) if is_video else (0, 1, 1)
+        if is_video and not duration:
+            mtd = await get_video_metadata(renamed_file)
+            duration, height, width = mtd.get('duration', 0), mtd.get('height', 1), mtd.get('width', 1)
+        thumb_path = None
+        if is_video or message.audio or message.photo or message.document:
+            thumb_path = await pick_thumbnail(item, get_media(message))
+        if not thumb_path and is_video and duration > 0: # Only attempt screenshot if it's a video with duration
+            # pick_thumbnail already found no user thumbnail, so grab a frame directly instead of screenshot()
+            data = await thumbnailer.capture(renamed_file, duration)
+            thumb_path = as_upload(data) if data else None
+        item.update({'duration': duration, 'height': height, 'width': width, 'thumb': thumb_path})
+    except Exception as e:
+        print(f'Unexpected Error processing file for message {message.id}: {e}')
+        cleanup_item(item)
+        await edit_message_safely(item['status_msg'], f'An unexpected error occurred: {str(e)[:50]}')
+        item['result'] = f'Error: {str(e)[:50]}'
+    return item
+
+async def process_relay_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Relay counterpart of process_item: name and attributes come from the source message instead of the file."""
+    message, user_id = item['message'], item['user_id']
+    try:
+        media = get_media(message)
+        file_name = await get_renamed_file_name(media_file_name(message, media), user_id)
+        item['file'] = RelayFile(item['relay_client'], message, file_name, media.file_size, buffer_parts=RELAY_BUFFER_MB * 2)
+        item['file_name'] = file_name
+        item['size'] = media.file_size
+        duration, width, height = source_video_attributes(message)
+        thumb_path = await pick_thumbnail(item, media) if message.video or message.audio or message.document else None
+        item.update({'duration': duration, 'height': height, 'width': width, 'thumb': thumb_path})
+    except Exception as e:
+        print(f'Unexpected Error preparing relay for message {message.id}: {e}')
+        await edit_message_safely(item['status_msg'], f'An unexpected error occurred: {str(e)[:50]}')
+        item['result'] = f'Error: {str(e)[:50]}'
+    return item
+
+async def upload_large_item(bot_client: Client, item: Dict[str, Any]) -> str:
+    """
+    Uploads a file over 2GB with the least-loaded premium session. The session posts straight into the
+    target chat when it is allowed to, otherwise into LOG_GROUP, from where the bot copies the message.
+    A failed upload is retried on a session that has not been tried yet.
+    """
+    renamed_file = item['file']
+    target_chat_id, reply_to_message_id, final_caption = item['target_chat_id'], item['reply_to'], item.get('caption')
+    status_msg, thumb_path = item['status_msg'], item.get('thumb')
+    duration, height, width = item.get('duration', 0), item.get('height', 1), item.get('width', 1)
+    file_name = item.get('file_name') or os.path.basename(renamed_file)
+    relayed = isinstance(renamed_file, RelayFile)
+    attempts = 1 if relayed else LARGE_UPLOAD_ATTEMPTS # A relay stream can be consumed only once
+    renamed_file = upload_source(renamed_file, file_name) # Parts go up in parallel; a new attempt uploads again
+    tried: List[Client] = []
+
+    await edit_message_safely(status_msg, 'File is larger than 2GB. Uploading with a premium session...')
+    for attempt in range(attempts):
+        sent = None
+        async with uploader_pool.lease(exclude=tried) as uploader:
+            if uploader is None:
+                break # Every session was tried or none is connected
+            tried.append(uploader)
+            if isinstance(renamed_file, ParallelUpload):
+                renamed_file.input_file = None # Uploaded parts belong to the session that sent them
+            direct = await uploader_pool.can_post(uploader, target_chat_id)
+            dest = target_chat_id if direct else LOG_GROUP
+            common = dict(caption=final_caption, thumb=thumb_path, progress=prog,
+                          progress_args=(bot_client, target_chat_id, status_msg.id, time.time()),
+                          reply_to_message_id=reply_to_message_id if direct else None)
             try:
-                 renamed_file = await rename_file(downloaded_file, user_id, download_progress_msg) # Pass message for potential edits in rename_file
-                 if not renamed_file or not os.path.exists(renamed_file):
-                      print(f"Renaming failed for {downloaded_file}")
-                      renamed_file = downloaded_file # Use original if renaming fails
-            except Exception as e:
-                 print(f"Error during renaming {downloaded_file}: {e}")
-                 renamed_file = downloaded_file # Use original if renaming fails
-
-            file_size = os.path.getsize(renamed_file)
-            file_size_gb = file_size / (1024 * 1024 * 1024)
-
-            # --- Handle Large Files (over 2GB) ---
-            # Original logic uploads large files to LOG_GROUP using the global userbot (Y), then copies to user.
-            # This bypasses user-specific bot/client for large file uploads. Confirm if this is desired.
-            # The global userbot (Y) might be the only client capable of uploading >2GB.
-            if file_size_gb > 2 and Y and Y.is_connected:
-                await edit_message_safely(download_progress_msg, 'File is larger than 2GB. Using alternative upload method...')
-                # Ensure global userbot dialogs are updated - done within get_msg if userbot is used for fetching
-                # await upd_dlg(Y) # Maybe not needed here if userbot is only used for uploading
-
-                # Get video metadata and screenshot for the large file if it's a video
-                duration, height, width = 0, 1, 1 # Default values
-                if renamed_file.lower().endswith(('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mpeg', '.mpg', '.3gp')): # Check if it's a video file by extension
-                    mtd = await get_video_metadata(renamed_file)
-                    duration, height, width = mtd.get('duration', 0), mtd.get('height', 1), mtd.get('width', 1)
-
-                thumb_path = None
-                # Try getting a thumbnail (screenshot for video, or potentially user-set thumb)
-                if duration > 0: # Only attempt screenshot if it's a video with duration
-                    thumb_path = await screenshot(renamed_file, duration, user_id)
-                # Could also check for user-set thumbnail here if screenshot fails or for non-videos
-                if not thumb_path and thumbnail(user_id):
-                     thumb_path = thumbnail(user_id)
-
-
-                sent_message_in_log = None
-                try:
-                    # Upload the large file to the log group using the global userbot
-                    # Use the same progress callback logic, adapting arguments
-                    log_upload_start_time = time.time()
-                    # Determine if it's a video to send as video, otherwise send as document
-                    if duration > 0:
-                        sent_message_in_log = await Y.send_video(
-                            LOG_GROUP,
-                            video=renamed_file,
-                            thumb=thumb_path,
-                            caption=final_caption,
-                            duration=duration,
-                            width=width,
-                            height=height,
-                            supports_streaming=True,
-                            progress=prog,
-                            progress_args=(Y, LOG_GROUP, download_progress_msg.id, log_upload_start_time) # Pass Y client for editing log message
-                        )
-                    else:
-                         sent_message_in_log = await Y.send_document(
-                            LOG_GROUP,
-                            document=renamed_file,
-                            thumb=thumb_path,
-                            caption=final_caption,
-                            file_name=os.path.basename(renamed_file),
-                            progress=prog,
-                            progress_args=(Y, LOG_GROUP, download_progress_msg.id, log_upload_start_time) # Pass Y client for editing log message
-                        )
-                    print(f"Uploaded large file to log group {LOG_GROUP}, message ID: {sent_message_in_log.id}")
-                except Exception as e:
-                     print(f"Error uploading large file to log group: {e}")
-                     await edit_message_safely(download_progress_msg, f'Large file upload to log group failed: {str(e)[:50]}')
-
-                # If upload to log group was successful, copy it to the user's chat
-                if sent_message_in_log:
-                    try:
-                        await edit_message_safely(download_progress_msg, 'Copying large file...')
-                        await bot_client.copy_message(
-                            target_chat_id,
-                            LOG_GROUP,
-                            sent_message_in_log.id,
-                            reply_to_message_id=reply_to_message_id
-                        )
-                        await delete_message_safely(download_progress_msg) # Delete the download progress message
-                        print(f"Copied message {sent_message_in_log.id} from log group to {target_chat_id}")
-                        return 'Done (Large file).'
-                    except Exception as e:
-                        print(f"Error copying large file from log group: {e}")
-                        await edit_message_safely(download_progress_msg, f'Copying large file failed: {str(e)[:50]}')
+                if duration > 0:
+                    sent = await limiter.call(uploader, 'send', dest, uploader.send_video, dest, video=renamed_file,
+                                              duration=duration, width=width, height=height, supports_streaming=True, **common)
                 else:
-                    # Upload to log group failed
-                     pass # Error already reported
+                    sent = await limiter.call(uploader, 'send', dest, uploader.send_document, dest, document=renamed_file,
+                                              file_name=file_name, **common)
+            except Exception as e:
+                print(f"Large file upload with session {uploader.name} failed (attempt {attempt + 1}/{attempts}): {e}")
+                item['relay_failed'] = relayed
+                continue
+        if not direct:
+            try:
+                await edit_message_safely(status_msg, 'Copying large file...')
+                sent = await limiter.call(bot_client, 'copy_message', target_chat_id, bot_client.copy_message,
+                    target_chat_id,
+                    LOG_GROUP,
+                    sent.id,
+                    reply_to_message_id=reply_to_message_id
+                )
+                await remember_upload(item, sent) # Only the bot's own copy has a file_id the bot can reuse
+            except Exception as e:
+                print(f"Error copying large file from log group: {e}")
+                await edit_message_safely(status_msg, f'Copying large file failed: {str(e)[:50]}')
+                return 'Failed.'
+        await delete_message_safely(status_msg)
+        return 'Done (Large file).'
+
+    if not item.get('relay_failed'):
+        await edit_message_safely(status_msg, 'Large file upload failed on every premium session.')
+    return 'Failed.'
+
+async def upload_item(bot_client: Client, item: Dict[str, Any]) -> str:
+    """Uploads a processed file to the target chat and cleans up local files."""
+    message, renamed_file = item['message'], item['file']
+    target_chat_id, reply_to_message_id, final_caption = item['target_chat_id'], item['reply_to'], item.get('caption')
+    download_progress_msg, thumb_path = item['status_msg'], item.get('thumb')
+    duration, height, width = item.get('duration', 0), item.get('height', 1), item.get('width', 1)
+    file_size_gb = item['size'] / (1024 * 1024 * 1024)
+    file_name = item.get('file_name') or os.path.basename(renamed_file)
+    relayed = isinstance(renamed_file, RelayFile)
 
-            # --- Handle Standard Files (<= 2GB) ---
-            else:
-                await edit_message_safely(download_progress_msg, 'Uploading...')
-                upload_start_time = time.time()
-
-                # Get video metadata and screenshot if it's a video and needed
-                duration, height, width = 0, 1, 1 # Default values
-                thumb_path = None
-
-                # Determine media type and get specific metadata/thumbnail
-                if message.video or renamed_file.lower().endswith(('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mpeg', '.mpg', '.3gp')):
-                    mtd = await get_video_metadata(renamed_file)
-                    duration, height, width = mtd.get('duration', 0), mtd.get('height', 1), mtd.get('width', 1)
-                    if duration > 0:
-                        thumb_path = await screenshot(renamed_file, duration, user_id)
-                elif message.audio:
-                     # For audio, try to get thumbnail from ytdl info if available, or use a default/user-set one
-                     # The ytdl.py handles audio thumbnails better. For Telegram audio, no built-in thumb usually.
-                     # Could potentially use the user's set thumbnail here if no other thumb is available.
-                     thumb_path = thumbnail(user_id) # Check for user-set thumbnail
-                elif message.photo:
-                     # For photos, check for user-set thumbnail if needed
-                     thumb_path = thumbnail(user_id)
-                elif message.document:
-                     # For documents, check for user-set thumbnail
-                     thumb_path = thumbnail(user_id)
-
-                try:
-                    # Upload the file using the bot client (usually sufficient for <=2GB)
-                    if message.video:
-                        await bot_client.send_video(
-                            target_chat_id,
-                            video=renamed_file,
-                            caption=final_caption,
-                            thumb=thumb_path,
-                            width=width,
-                            height=height,
-                            duration=duration,
-                            progress=prog,
-                            progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
-                            reply_to_message_id=reply_to_message_id
-                        )
-                    elif message.video_note:
-                        await bot_client.send_video_note(
-                            target_chat_id,
-                            video_note=renamed_file,
-                            progress=prog,
-                            progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
-                            reply_to_message_id=reply_to_message_id
-                        )
-                    elif message.voice:
-                        await bot_client.send_voice(
-                            target_chat_id,
-                            voice=renamed_file,
-                            progress=prog,
-                            progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
-                            reply_to_message_id=reply_to_message_id
-                        )
-                    elif message.sticker:
-                         # Re-uploading stickers might not maintain sticker properties well.
-                         # If send_direct failed, this might also behave unexpectedly.
-                         # A simple file upload as document might be a fallback if direct send fails.
-                        await bot_client.send_sticker(target_chat_id, sticker=renamed_file, reply_to_message_id=reply_to_message_id)
-                    elif message.audio:
-                        await bot_client.send_audio(
-                            target_chat_id,
-                            audio=renamed_file,
-                            caption=final_caption,
-                            thumb=thumb_path, # Use thumbnail if available
-                            duration=message.audio.duration, # Keep original duration if available
-                            performer=message.audio.performer, # Keep original metadata
-                            title=message.audio.title, # Keep original metadata
-                            progress=prog,
-                            progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
-                            reply_to_message_id=reply_to_message_id
-                        )
-                    elif message.photo:
-                         # For photos, send as photo. Thumbnail logic already handled.
-                        await bot_client.send_photo(
-                            target_chat_id,
-                            photo=renamed_file,
-                            caption=final_caption,
-                            progress=prog, # Progress might not show for photos depending on size
-                            progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
-                            reply_to_message_id=reply_to_message_id
-                        )
-                    else:
-                        # Default to sending as document for other media types or if type is unknown
-                        await bot_client.send_document(
-                            target_chat_id,
-                            document=renamed_file,
-                            caption=final_caption,
-                            thumb=thumb_path, # Use thumbnail if available (e.g., for video documents)
-                            file_name=os.path.basename(renamed_file), # Use the potentially renamed filename
-                            progress=prog,
-                            progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
-                            reply_to_message_id=reply_to_message_id
-                        )
-
-                    # Clean up files after successful upload
-                    if os.path.exists(renamed_file): os.remove(renamed_file)
-                    if thumb_path and os.path.exists(thumb_path): os.remove(thumb_path)
-                    await delete_message_safely(download_progress_msg) # Delete the download/upload progress message
-
-                    return 'Done.'
-
-                except Exception as e:
-                    # Error during upload
-                    print(f'Upload failed for message {message.id}: {e}')
-                    await edit_message_safely(download_progress_msg, f'Upload failed: {str(e)[:50]}')
-                    # Clean up files even on upload failure
-                    if os.path.exists(renamed_file): os.remove(renamed_file)
-                    if thumb_path and os.path.exists(thumb_path): os.remove(thumb_path)
-                    # Keep the error message instead of deleting download_progress_msg?
-                    # await delete_message_safely(download_progress_msg)
-                    return 'Failed.'
-
-        # --- Handle Text Messages ---
-        elif message.text:
-            # For text messages, just send the text with processed rules if any
-            processed_text = await process_text_with_rules(user_id, message.text.markdown)
-            user_cap = await get_user_data_key(user_id, 'caption', '')
-            final_text = f'{processed_text}\n\n{user_cap}' if processed_text and user_cap else user_cap if user_cap else processed_text
-
-            if final_text: # Only send if there is text after processing
-                 try:
-                      await bot_client.send_message(target_chat_id, text=final_text, reply_to_message_id=reply_to_message_id)
-                      return 'Sent.'
-                 except Exception as e:
-                      print(f"Error sending text message {message.id}: {e}")
-                      return f'Error sending text: {str(e)[:50]}'
+    try:
+        # --- Handle Large Files (over 2GB) ---
+        # Bots cannot upload more than 2GB; a premium user session from the pool does it instead
+        if file_size_gb > 2 and uploader_pool.available():
+            return await upload_large_item(bot_client, item)
+
+        # --- Handle Standard Files (<= 2GB) ---
+        await edit_message_safely(download_progress_msg, 'Uploading...')
+        upload_start_time = time.time()
+        renamed_file = upload_source(renamed_file, file_name) # Large local files are uploaded in parallel parts
+
+        try:
+            # Upload the file using the bot client (usually sufficient for <=2GB)
+            if message.video:
+                sent = await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_video,
+                    target_chat_id,
+                    video=renamed_file,
+                    caption=final_caption,
+                    thumb=thumb_path,
+                    width=width,
+                    height=height,
+                    duration=duration,
+                    progress=prog,
+                    progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
+                    reply_to_message_id=reply_to_message_id
+                )
+            elif message.video_note:
+                sent = await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_video_note,
+                    target_chat_id,
+                    video_note=renamed_file,
+                    progress=prog,
+                    progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
+                    reply_to_message_id=reply_to_message_id
+                )
+            elif message.voice:
+                sent = await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_voice,
+                    target_chat_id,
+                    voice=renamed_file,
+                    progress=prog,
+                    progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
+                    reply_to_message_id=reply_to_message_id
+                )
+            elif message.sticker:
+                 # Re-uploading stickers might not maintain sticker properties well.
+                 # If send_direct failed, this might also behave unexpectedly.
+                 # A simple file upload as document might be a fallback if direct send fails.
+                sent = await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_sticker, target_chat_id, sticker=renamed_file, reply_to_message_id=reply_to_message_id)
+            elif message.audio:
+                sent = await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_audio,
+                    target_chat_id,
+                    audio=renamed_file,
+                    caption=final_caption,
+                    thumb=thumb_path, # Use thumbnail if available
+                    duration=message.audio.duration, # Keep original duration if available
+                    performer=message.audio.performer, # Keep original metadata
+                    title=message.audio.title, # Keep original metadata
+                    progress=prog,
+                    progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
+                    reply_to_message_id=reply_to_message_id
+                )
+            elif message.photo:
+                 # For photos, send as photo. Thumbnail logic already handled.
+                sent = await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_photo,
+                    target_chat_id,
+                    photo=renamed_file,
+                    caption=final_caption,
+                    progress=prog, # Progress might not show for photos depending on size
+                    progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
+                    reply_to_message_id=reply_to_message_id
+                )
             else:
-                 return 'Skipped (Empty text after processing).'
+                # Default to sending as document for other media types or if type is unknown
+                sent = await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_document,
+                    target_chat_id,
+                    document=renamed_file,
+                    caption=final_caption,
+                    thumb=thumb_path, # Use thumbnail if available (e.g., for video documents)
+                    file_name=file_name, # Use the potentially renamed filename
+                    progress=prog,
+                    progress_args=(bot_client, target_chat_id, download_progress_msg.id, upload_start_time),
+                    reply_to_message_id=reply_to_message_id
+                )
+
+            await delete_message_safely(download_progress_msg) # Delete the download/upload progress message
+            await remember_upload(item, sent)
+            return 'Done.'
 
-        else:
-            # Handle unsupported message types
-            print(f"Unsupported message type for message {message.id}")
-            return 'Unsupported message type.'
+        except Exception as e:
+            # Error during upload
+            print(f'Upload failed for message {message.id}: {e}')
+            item['relay_failed'] = relayed
+            await edit_message_safely(download_progress_msg, f'Upload failed: {str(e)[:50]}')
+            # Keep the error message instead of deleting download_progress_msg?
+            return 'Failed.'
+
+    except Exception as e:
+        print(f'Unexpected Error uploading message {message.id}: {e}')
+        await edit_message_safely(download_progress_msg, f'An unexpected error occurred: {str(e)[:50]}')
+        return f'Error: {str(e)[:50]}'
+    finally:
+        # Clean up files whether the upload succeeded or not
+        cleanup_item(item)
+
+async def deliver_msg(bot_client: Client, user_client: Optional[Client], item: Dict[str, Any]) -> str:
+    """Posts a prepared item to its target chat. This is the only stage that sends content to the destination."""
+    if 'result' in item:
+        return item['result']
+    if 'album' in item:
+        return await deliver_album(bot_client, user_client, item)
+    message, kind = item['message'], item['kind']
+    try:
+        if kind == 'text':
+            try:
+                await limiter.call(bot_client, 'send', item['target_chat_id'], bot_client.send_message, item['target_chat_id'], text=item['text'], reply_to_message_id=item['reply_to'])
+                return 'Sent.'
+            except Exception as e:
+                print(f"Error sending text message {message.id}: {e}")
+                return f'Error sending text: {str(e)[:50]}'
+
+        if kind == 'direct':
+            if await send_direct(bot_client, message, item['target_chat_id'], item.get('caption'), item['reply_to']):
+                return 'Sent directly.'
+            # If direct send fails, proceed to download/upload right here
+            item['kind'] = 'file'
+            item = await process_item(await download_item(bot_client, user_client, item))
+            if 'result' in item:
+                return item['result']
+
+        if 'cached' in item:
+            res = await send_cached_item(bot_client, item)
+            if res:
+                return res
+            # Cache entry was rejected; transfer the file after all
+            item.pop('cached')
+
+        if 'file' not in item:
+            # Item was not downloaded by an earlier stage (e.g. process_msg used outside the pipeline)
+            item = await process_item(await download_item(bot_client, user_client, item))
+            if 'result' in item:
+                return item['result']
+
+        res = await upload_item(bot_client, item)
+        if item.pop('relay_failed', False):
+            # The source could not be streamed through; fetch it to disk and upload once more
+            print(f"Relay failed for message {message.id}, falling back to the disk path")
+            for key in ('file', 'file_name', 'relay_client', 'size', 'thumb'):
+                item.pop(key, None)
+            item['relay_fallback'] = True
+            item = await process_item(await download_item(bot_client, user_client, item))
+            if 'result' in item:
+                return item['result']
+            res = await upload_item(bot_client, item)
+        return res
 
     except Exception as e:
-        # Catch any unexpected errors during the entire process_msg execution
+        # Catch any unexpected errors during delivery
         print(f'Unexpected Error processing message {message.id}: {e}')
-        # Attempt to clean up downloaded file if it exists
-        if renamed_file and os.path.exists(renamed_file):
-             os.remove(renamed_file)
-        elif 'downloaded_file' in locals() and downloaded_file and os.path.exists(downloaded_file):
-             os.remove(downloaded_file)
-        if thumb_path and os.path.exists(thumb_path):
-             os.remove(thumb_path)
-        # Attempt to edit/delete the progress message if it exists
-        if download_progress_msg:
-            await edit_message_safely(download_progress_msg, f'An unexpected error occurred: {str(e)[:50]}')
-            # Decide whether to keep or delete the error message
-            # await delete_message_safely(download_progress_msg)
+        cleanup_item(item)
+        if item.get('status_msg'):
+            await edit_message_safely(item['status_msg'], f'An unexpected error occurred: {str(e)[:50]}')
         return f'Error: {str(e)[:50]}'
 
+async def process_msg(bot_client: Client, user_client: Optional[Client], message: Message, destination_chat_id: str, link_type: str, user_id: int, source_chat_identifier: Any) -> str:
+    """Processes a single message: downloads, renames, and uploads."""
+    item = await prepare_msg(bot_client, user_client, message, destination_chat_id, link_type, user_id, source_chat_identifier)
+    return await deliver_msg(bot_client, user_client, item)
+
+
+# --- Albums ---
+# Consecutive messages sharing a media_group_id travel through the pipeline as one item: members are
+# transferred concurrently and posted back with a single send_media_group call.
+def is_album_member(message: Optional[Message]) -> bool:
+    return bool(message and message.media_group_id and (message.photo or message.video or message.document or message.audio))
+
+async def prepare_album(bot_client: Client, user_client: Optional[Client], messages: List[Message], destination_chat_id: str, link_type: str, user_id: int, source_chat_identifier: Any) -> Dict[str, Any]:
+    """Prepares every member of an album; the user's caption is added once, to the album caption."""
+    members = [await prepare_msg(bot_client, user_client, m, destination_chat_id, link_type, user_id, source_chat_identifier) for m in messages]
+    album: Dict[str, Any] = {'album': members, 'message': messages[0], 'user_id': user_id,
+                             'target_chat_id': members[0].get('target_chat_id'), 'reply_to': members[0].get('reply_to')}
+    if any('result' in m for m in members):
+        album['result'] = next(m['result'] for m in members if 'result' in m)
+        return album
+    # Telegram shows the caption of the one member that has it as the album caption
+    caption_index = next((i for i, m in enumerate(messages) if m.caption), 0)
+    for i, (member, message) in enumerate(zip(members, messages)):
+        orig = message.caption.markdown if message.caption else ''
+        member['caption'] = await build_caption(user_id, orig) if i == caption_index else await process_text_with_rules(user_id, orig)
+        member['relay_fallback'] = True # Members go through the disk path so they can be uploaded side by side
+    album['direct'] = all(m['kind'] == 'direct' for m in members)
+    return album
+
+async def download_album(bot_client: Client, user_client: Optional[Client], album: Dict[str, Any]) -> Dict[str, Any]:
+    """Downloads all members concurrently under a single status message."""
+    if 'result' in album or album.get('direct'):
+        return album
+    for member in album['album']:
+        member['kind'] = 'file'
+    if not album.get('status_msg'):
+        album['status_msg'] = await limiter.call(bot_client, 'send', album['target_chat_id'], bot_client.send_message, album['target_chat_id'], f'Downloading album ({len(album["album"])} files)...')
+    for member in album['album']:
+        member['status_msg'] = album['status_msg']
+    await asyncio.gather(*(download_item(bot_client, user_client, m) for m in album['album']))
+    return album
+
+async def process_album(album: Dict[str, Any]) -> Dict[str, Any]:
+    if 'result' in album or album.get('direct'):
+        return album
+    await asyncio.gather(*(process_item(m) for m in album['album']))
+    return album
+
+def album_input_media(message: Message, media: Any, member: Dict[str, Any]):
+    """Builds the InputMedia* for one album member."""
+    caption = member.get('caption') or ''
+    if message.photo:
+        return InputMediaPhoto(media, caption=caption)
+    if message.video:
+        return InputMediaVideo(media, thumb=member.get('thumb'), caption=caption, width=member.get('width', message.video.width),
+                               height=member.get('height', message.video.height), duration=member.get('duration', message.video.duration), supports_streaming=True)
+    if message.audio:
+        return InputMediaAudio(media, thumb=member.get('thumb'), caption=caption, duration=message.audio.duration, performer=message.audio.performer, title=message.audio.title)
+    return InputMediaDocument(media, thumb=member.get('thumb'), caption=caption)
+
+async def deliver_album(bot_client: Client, user_client: Optional[Client], album: Dict[str, Any]) -> str:
+    """Posts an album with one send_media_group call."""
+    members, target_chat_id = album['album'], album['target_chat_id']
+    if album.get('direct'):
+        try:
+            media = [album_input_media(m['message'], getattr(m['message'], m['message'].media.value).file_id, m) for m in members]
+            await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_media_group, target_chat_id, media, reply_to_message_id=album['reply_to'])
+            album['delivered'] = len(members)
+            return 'Sent directly (album).'
+        except Exception as e:
+            # Fall back to transferring the members
+            print(f"Direct album send failed for message {album['message'].id}: {e}")
+            album['direct'] = False
+            album = await process_album(await download_album(bot_client, user_client, album))
+
+    ready = [m for m in members if 'result' not in m]
+    failed = len(members) - len(ready)
+    try:
+        if not ready:
+            return 'Failed.'
+        await edit_message_safely(album['status_msg'], 'Uploading album...')
+
+        async def to_media(member: Dict[str, Any]):
+            if 'cached' in member:
+                return album_input_media(member['message'], member['cached']['file_id'], member)
+            # Upload the parts now, concurrently with the other members; send_media_group only registers them
+            input_file = await bot_client.save_file(upload_source(member['file'], member['file_name']))
+            return album_input_media(member['message'], UploadedFile(input_file, member['file_name']), member)
+
+        media = await asyncio.gather(*(to_media(m) for m in ready))
+        sent = await limiter.call(bot_client, 'send', target_chat_id, bot_client.send_media_group, target_chat_id, list(media), reply_to_message_id=album['reply_to'])
+        for member, sent_message in zip(ready, sent or []):
+            await remember_upload(member, sent_message)
+        await delete_message_safely(album['status_msg'])
+        album['delivered'] = len(ready)
+        return f'Done (album, {len(ready)} files).' + (f' {failed} failed.' if failed else '')
+    except Exception as e:
+        print(f"Album upload failed for message {album['message'].id}: {e}")
+        if album.get('status_msg'):
+            await edit_message_safely(album['status_msg'], f'Album upload failed: {str(e)[:50]}')
+        return 'Failed.'
+    finally:
+        for member in members:
+            cleanup_item(member)
+
+
+# --- Batch Jobs ---
+# /batch and /single only validate input and submit a job; the scheduler runs the job as a supervised
+# background task with a global concurrency cap, premium lane and per-user round-robin.
+SCHEDULER = BatchScheduler(MAX_CONCURRENT_BATCHES)
+SHUTTING_DOWN = False # Set by shutdown(); running jobs stop feeding new items and keep their checkpoint
+PIPELINES: Dict[int, OrderedPipeline] = {} # {user_id: pipeline of the running batch}
+
+async def submit_job(user_id: int, progress_msg: Message, run, kind: str, premium: Optional[bool] = None) -> Optional[Job]:
+    """
+    Submits a batch/single job and keeps the user informed of their queue position.
+    Returns None while the scheduler drains for a restart; the task then stays in ACTIVE_USERS and
+    initialize() resumes it after the restart, so callers have nothing to undo.
+    """
+    if premium is None:
+        premium = await is_premium_user(user_id)
+
+    async def on_position(position: int):
+        lane = 'premium' if premium else 'standard'
+        await edit_message_safely(progress_msg, f'⏳ All transfer slots are busy. Your {kind} is #{position} in the {lane} queue. Use /stop to leave the queue.')
+
+    if not SCHEDULER.accepting:
+        # The task stays in ACTIVE_USERS and is picked up by initialize() after the restart
+        await edit_message_safely(progress_msg, '⏸️ The bot is restarting. Your task will start automatically once it is back.')
+        return None
+
+    # The job edits progress_msg itself once it starts
+    return SCHEDULER.submit(Job(user_id, run, premium=premium, on_position=on_position, name=f'{kind}-{user_id}'))
+
+async def run_single(ubot: Optional[Client], uc: Optional[Client], user_id: int, progress_msg: Message, chat_identifier: Any, message_id: int, link_type: str, dest_chat_id: str):
+    """Job body for /single."""
+    interrupted = False
+    try:
+        await edit_message_safely(progress_msg, '✅ Link received. Processing single message...')
+        # Fetch the single message
+        msg = await get_msg(ubot, uc, chat_identifier, message_id, link_type)
+        if msg:
+            # Process the single message
+            res = await process_msg(ubot, uc, msg, dest_chat_id, link_type, user_id, chat_identifier) # Pass user_id and source_chat_identifier
+            await edit_message_safely(progress_msg, f'Single message process: {res}')
+        else:
+            await edit_message_safely(progress_msg, 'ℹ️ Message not found or inaccessible.')
+    except Exception as e:
+        print(f"Error during single message processing for user {user_id}: {e}")
+        await edit_message_safely(progress_msg, f'❌ Error processing message: {str(e)[:50]}')
+    except asyncio.CancelledError:
+        interrupted = True # Drain deadline passed; the message is processed again after the restart
+        raise
+    finally:
+        # Clean up state regardless of success/failure, unless the task must resume after a restart
+        if not interrupted:
+            await remove_active_batch(user_id)
+
+def item_strategy(item: Dict[str, Any], result: str) -> str:
+    """How an item was delivered, for the batch ledger."""
+    if 'album' in item:
+        return 'album'
+    if item.get('kind') == 'text':
+        return 'text'
+    if 'cached' in result:
+        return 'cached'
+    if 'Sent directly' in result:
+        return 'direct'
+    if 'relay_client' in item:
+        return 'relay'
+    if 'file' in item or item.get('kind') == 'file':
+        return 'disk'
+    return 'none'
+
+async def run_batch(ubot: Optional[Client], uc: Optional[Client], user_id: int, progress_msg: Message, chat_identifier: Any, start_id: int, num_messages: int, link_type: str, dest_chat_id: str, resume_from: Optional[int] = None, batch_id: Optional[str] = None, message_ids: Optional[List[int]] = None, plan: Optional[BatchPlan] = None):
+    """
+    Job body for /batch. resume_from continues an interrupted batch from its checkpoint;
+    message_ids replaces the start_id/num_messages range with explicit IDs (used by /retryfailed);
+    plan supplies the messages the confirmed plan already fetched.
+    """
+    all_ids = list(message_ids) if message_ids else list(range(start_id, start_id + num_messages))
+    num_messages = len(all_ids)
+    position = {message_id: index for index, message_id in enumerate(all_ids)} # Progress index of each ID
+    batch_id = batch_id or uuid.uuid4().hex[:12] # Groups the item outcomes in the ledger
+    success_count = 0 # Initialize success counter
+    interrupted = False
+    pending_ids = all_ids
+    if resume_from:
+        pending_ids = [message_id for message_id in all_ids if message_id >= resume_from]
+        success_count = (get_batch_info(user_id) or {}).get('success', 0)
+        if pending_ids:
+            await edit_message_safely(progress_msg, f'♻️ Resuming batch at {position[pending_ids[0]] + 1}/{num_messages} (Msg ID: {pending_ids[0]})...')
+    else:
+        await edit_message_safely(progress_msg, f'✅ Count received. Starting batch processing for {num_messages} messages...')
+    try:
+        if not pending_ids:
+            return
+        fetch_client, fetch_chat = await get_fetch_client(ubot, uc, chat_identifier, pending_ids[0], link_type)
+        if not fetch_client:
+            raise RuntimeError('No connected client available to fetch messages.')
+
+        # Messages are fetched in bulk windows ahead of the processing cursor
+        prefetcher = MessagePrefetcher(fetch_client, fetch_chat, pending_ids,
+                                       window=BATCH_PREFETCH_WINDOW, lookahead=BATCH_PREFETCH_AHEAD,
+                                       known=plan.messages if plan and plan.fresh() else None)
+        last_delivery = time.time() # Throughput is measured between consecutive deliveries
+        fed_ids = [] # Message IDs of each item fed into the pipeline (albums span several), indexed by sequence number
+        cancelled_at = None
+
+        def record_outcome(ids: List[int], item: Dict[str, Any], res: str):
+            """Buffers one ledger record per source message of a delivered item."""
+            duration = round(time.time() - item.get('started_at', time.time()), 2)
+            members = item['album'] if 'album' in item else [item]
+            pairs = list(zip(ids, members)) if len(members) == len(ids) else [(i, item) for i in ids]
+            for message_id, member in pairs:
+                member_res = member.get('result', res) if member is not item else res
+                ledger.record(batch_id, message_id, user_id=user_id, chat=chat_identifier, link_type=link_type, dest=dest_chat_id,
+                              strategy=item_strategy(item, res), bytes=member.get('size', 0), duration=duration,
+                              code=result_code(member_res), result=member_res[:100])
+
+        async def feed():
+            nonlocal cancelled_at, interrupted
+            async for ids, msg in group_albums(prefetcher, is_album_member):
+                # Check for cancellation request before feeding each item
+                if should_cancel(user_id):
+                    cancelled_at = position[ids[0]]
+                    return
+                if SHUTTING_DOWN:
+                    interrupted = True # Items already in flight still finish and advance the checkpoint
+                    return
+                fed_ids.append(ids)
+                yield ids[0], msg
+
+        async def download_stage(entry):
+            current_message_id, msg = entry
+            started_at = time.time()
+            if not msg:
+                return current_message_id, {'result': 'ℹ️ Message not found or inaccessible.', 'started_at': started_at}
+            if isinstance(msg, list):
+                album = await prepare_album(ubot, uc, msg, dest_chat_id, link_type, user_id, chat_identifier)
+                album['started_at'] = started_at
+                return current_message_id, await download_album(ubot, uc, album)
+            item = await prepare_msg(ubot, uc, msg, dest_chat_id, link_type, user_id, chat_identifier) # Pass user_id and source_chat_identifier
+            item['started_at'] = started_at
+            return current_message_id, await download_item(ubot, uc, item)
+
+        async def process_stage(entry):
+            current_message_id, item = entry
+            if 'album' in item:
+                return current_message_id, await process_album(item)
+            return current_message_id, await process_item(item)
+
+        async def upload_stage(seq, entry):
+            nonlocal success_count, last_delivery
+            ids = fed_ids[seq]
+            current_message_id = ids[-1]
+            j = position[current_message_id]
+            if isinstance(entry, Exception):
+                # Catch errors specific to processing a single message
+                print(f"Error processing message {current_message_id} in batch for user {user_id}: {entry}")
+                record_outcome(ids, {}, f'Error: {str(entry)[:50]}')
+                await update_batch_progress(user_id, j + 1, success_count, last_done=current_message_id)
+                await edit_message_safely(progress_msg, f'Processing {j+1}/{num_messages} (Msg ID: {current_message_id}): ❌ Error - {str(entry)[:50]}')
+                return
+            item = entry[1]
+            res = await deliver_msg(ubot, uc, item)
+            # Feed the planner's ETA with what transfers actually achieve (direct/cached sends move no bytes)
+            now = time.time()
+            if 'Done' in res and 'cached' not in res:
+                transferred = sum(m.get('size', 0) for m in item['album']) if 'album' in item else item.get('size', 0)
+                throughput.record(transferred, now - last_delivery)
+            last_delivery = now
+            record_outcome(ids, item, res)
+            # Check the result string to determine success
+            if 'Done' in res or 'Sent' in res: # 'Copied' is for large file copy
+                 success_count += item.get('delivered', 1) # Albums count every delivered member
+            # Checkpoint: items reach this stage in message-ID order, so everything up to here is delivered
+            await update_batch_progress(user_id, j + 1, success_count, last_done=current_message_id)
+            # Update the progress message with current item status (optional but helpful)
+            await edit_message_safely(progress_msg, f'Processing {j+1}/{num_messages} (Msg ID: {current_message_id}): {res}')
+            # No fixed delay between items: sends are paced by the adaptive per-chat rate limiter
+
+        # item N+1 downloads while item N uploads; uploads are posted in message-ID order
+        pipeline = OrderedPipeline(
+            [('download', download_stage, BATCH_DOWNLOAD_WORKERS), ('process', process_stage, BATCH_PROCESS_WORKERS)],
+            upload_stage,
+            depth=BATCH_QUEUE_DEPTH
+        )
+        PIPELINES[user_id] = pipeline
+        async with prefetcher:
+            await pipeline.run(feed())
+        interrupted = interrupted or pipeline.stopped
+
+        if interrupted:
+            last_done = (get_batch_info(user_id) or {}).get('last_done')
+            resume_index = position[last_done] + 1 if last_done in position else position[pending_ids[0]]
+            await edit_message_safely(progress_msg, f'⏸️ The bot is restarting. This batch will resume from message {resume_index + 1}/{num_messages} automatically.')
+            return
+        if cancelled_at is not None:
+            await edit_message_safely(progress_msg, f'Batch cancelled by user at message {cancelled_at+1}/{num_messages}. Processed successfully: {success_count}.')
+        elif prefetcher.reached_end:
+            print(f"Batch for user {user_id} stopped at the last message of {chat_identifier} (ID {prefetcher.last_id}).")
+
+        # After the loop finishes (either completed or cancelled)
+        if not should_cancel(user_id):
+             # If the loop completed without cancellation
+             failed_hint = ' Use /retryfailed to retry the failed items.' if success_count < num_messages else ''
+             await limiter.call(X, 'send', dest_chat_id, X.send_message, int(dest_chat_id), f'Batch Completed ✅ Processed: {num_messages}. Successful: {success_count}/{num_messages}.{failed_hint}')
+        # If cancelled, the cancellation message is already sent
+
+    except Exception as e:
+         # Catch any unexpected errors during the batch loop setup or iteration
+         print(f"Unexpected error during batch processing for user {user_id}: {e}")
+         await edit_message_safely(progress_msg, f'❌ An unexpected error occurred during batch processing: {str(e)[:50]}')
+
+    except asyncio.CancelledError:
+        interrupted = True # Drain deadline passed; the checkpoint still points at the last delivered message
+        raise
+
+    finally:
+        PIPELINES.pop(user_id, None)
+        # Clean up active batch state regardless of how the process ended, unless it resumes after a restart
+        if not interrupted:
+            await remove_active_batch(user_id)
+        # The progress message 'pt' is kept, potentially showing the final status or error.
+
+async def initialize():
+    """Re-enqueues tasks interrupted by a restart or crash from their checkpoints. Called by main.py after plugins load."""
+    uploader_pool.register(c for c in premium_userbots if c.is_connected)
+    for premium_client in uploader_pool.clients:
+        set_upload_connections(premium_client, PREMIUM_UPLOAD_CONNECTIONS)
+    for user_str, info in list(ACTIVE_USERS.items()):
+        user_id = int(user_str)
+        kind = info.get('kind')
+        if kind not in ('batch', 'single') or info.get('cancel_requested') or not info.get('did'):
+            # Entries without a checkpoint (older versions) or cancelled before the restart cannot be resumed
+            await remove_active_batch(user_id)
+            continue
+
+        last_done = info.get('last_done')
+        ids = info.get('ids') or range(info['sid'], info['sid'] + info.get('num', 1))
+        resume_from = (last_done + 1) if last_done else info['sid']
+        if not any(message_id >= resume_from for message_id in ids):
+            await remove_active_batch(user_id) # Finished right before the restart
+            continue
+
+        ubot = await get_ubot(user_id)
+        uc = await get_uclient(user_id)
+        try:
+            if (not ubot or not ubot.is_connected) and (not uc or not uc.is_connected):
+                await X.send_message(int(info['did']), '❌ Your interrupted task could not be resumed: no connected bot or user client. Use /setbot or /login and start it again.')
+                await remove_active_batch(user_id)
+                continue
+            progress_msg = await X.send_message(int(info['did']), f'♻️ The bot restarted. Your {kind} will resume from message ID {resume_from}.')
+        except Exception as e:
+            print(f"Could not resume task for user {user_id}: {e}")
+            await remove_active_batch(user_id)
+            continue
+
+        info['progress_message_id'] = progress_msg.id
+        cid, lt, did = info['cid'], info['lt'], info['did']
+        if kind == 'single':
+            run = functools.partial(run_single, ubot, uc, user_id, progress_msg, cid, info['sid'], lt, did)
+        else:
+            run = functools.partial(run_batch, ubot, uc, user_id, progress_msg, cid, info['sid'], info['num'], lt, did,
+                                    resume_from=resume_from, batch_id=info.get('batch_id'), message_ids=info.get('ids'))
+        if await submit_job(user_id, progress_msg, run, kind, premium=info.get('premium')) is None:
+            continue # Shutting down again; kept for the next start
+        print(f"Resumed {kind} for user {user_id} from message {resume_from}")
+    await save_active_users_to_file()
+
+async def shutdown():
+    """Stops taking new work, lets in-flight uploads finish up to SHUTDOWN_GRACE seconds and persists checkpoints."""
+    global SHUTTING_DOWN
+    SHUTTING_DOWN = True
+    for pipeline in list(PIPELINES.values()):
+        pipeline.stop()
+    waiting = await SCHEDULER.drain(SHUTDOWN_GRACE)
+    if waiting:
+        print(f"{len(waiting)} queued task(s) will start after the restart")
+    await save_active_users_to_file()
+    await session_pool.close()
+    await ledger.flush()
+    await media_cache.flush()
+
+
+# --- Batch Planning ---
+# After the count is entered the batch is planned from bulk metadata fetches (no downloads) and the
+# user confirms, trims or cancels it before any transfer slot is reserved.
+BATCH_PLAN_BUTTONS = InlineKeyboardMarkup([[
+    InlineKeyboardButton("✅ Start", callback_data="batchplan_start"),
+    InlineKeyboardButton("✂️ Trim", callback_data="batchplan_trim"),
+    InlineKeyboardButton("❌ Cancel", callback_data="batchplan_cancel"),
+]])
+
+async def show_batch_plan(user_id: int):
+    """Plans the batch described by Z[user_id] and asks the user to confirm it."""
+    state = Z[user_id]
+    progress_msg = state['progress_msg']
+    chat_identifier, start_id, num_messages, link_type = state['cid'], state['sid'], state['num'], state['lt']
+
+    ubot = await get_ubot(user_id) # Get user's bot client
+    uc = await get_uclient(user_id) # Get user client (might be global userbot)
+
+    # Need at least a user bot or a user client (or the global userbot Y) that is connected
+    if (not ubot or not ubot.is_connected) and (not uc or not uc.is_connected):
+        await edit_message_safely(progress_msg, 'Cannot proceed without a connected bot or user client. Use /setbot or /login.')
+        del Z[user_id]
+        return
+
+    def is_direct(msg: Message) -> bool:
+        return can_send_direct(msg, link_type, chat_identifier)
+
+    plan = state.get('plan')
+    state['step'] = 'planning'
+    try:
+        if plan and plan.fresh() and num_messages <= plan.count:
+            plan = trim_plan(plan, num_messages, is_direct) # Trimming reuses the fetched messages
+        else:
+            await edit_message_safely(progress_msg, f'🔎 Planning batch: reading metadata of {num_messages} messages...')
+            fetch_client, fetch_chat = await get_fetch_client(ubot, uc, chat_identifier, start_id, link_type)
+            if not fetch_client:
+                raise RuntimeError('No connected client available to fetch messages.')
+            plan = await plan_batch(fetch_client, fetch_chat, start_id, num_messages, is_direct)
+    except Exception as e:
+        print(f"Error planning batch for user {user_id}: {e}")
+        await edit_message_safely(progress_msg, f'❌ Could not plan the batch: {str(e)[:50]}')
+        Z.pop(user_id, None)
+        return
+
+    state.update({'step': 'plan', 'plan': plan})
+    await edit_message_safely(progress_msg, f'{format_plan(plan)}\n\nStart, trim or cancel this batch?', reply_markup=BATCH_PLAN_BUTTONS)
+
+async def start_planned_batch(user_id: int):
+    """Reserves the batch once the user confirmed the plan."""
+    state = Z.pop(user_id) # The command sequence is complete, the scheduler owns the task from here
+    progress_msg = state['progress_msg']
+    chat_identifier, start_id, num_messages, link_type, dest_chat_id, is_prem = state['cid'], state['sid'], state['num'], state['lt'], state['did'], state['premium']
+
+    if is_user_active(user_id):
+        await edit_message_safely(progress_msg, 'You have an active task. Use /stop to cancel it.')
+        return
+
+    ubot = await get_ubot(user_id) # Get user's bot client
+    uc = await get_uclient(user_id) # Get user client (might be global userbot)
+
+    batch_id = uuid.uuid4().hex[:12]
+    # Add to active users to prevent other tasks
+    await add_active_batch(user_id, {
+        "total": num_messages, "current": 0, "success": 0, "cancel_requested": False,
+        "progress_message_id": progress_msg.id, # Link to the progress message
+        # Checkpoint used to resume the batch after a restart; last_done advances as items are delivered
+        "kind": "batch", "cid": chat_identifier, "sid": start_id, "num": num_messages, "lt": link_type,
+        "did": dest_chat_id, "last_done": None, "premium": is_prem, "batch_id": batch_id
+    })
+
+    await submit_job(user_id, progress_msg, lambda: run_batch(ubot, uc, user_id, progress_msg, chat_identifier, start_id, num_messages, link_type, dest_chat_id, batch_id=batch_id, plan=state['plan']), 'batch', premium=is_prem)
+
+@X.on_callback_query(filters.regex(r"^batchplan_(start|trim|cancel)$"))
+async def on_batch_plan(c: Client, q: CallbackQuery):
+    """Handles the Start / Trim / Cancel buttons of a batch plan."""
+    user_id = q.from_user.id
+    state = Z.get(user_id)
+    if not state or state.get('step') != 'plan' or state['progress_msg'].id != q.message.id:
+        await q.answer('This plan is no longer active.', show_alert=True)
+        return
+    await q.answer() # Dismiss the loading indicator
+
+    action = q.data.split('_', 1)[1]
+    if action == 'cancel':
+        del Z[user_id]
+        await edit_message_safely(state['progress_msg'], '✅ Batch cancelled. Nothing was transferred.')
+    elif action == 'trim':
+        state['step'] = 'trim'
+        await edit_message_safely(state['progress_msg'], f'✂️ Send the new number of messages (1-{state["num"]}).')
+    else:
+        await start_planned_batch(user_id)
+
 
 # --- Command Handlers ---
 # Added & filters.private to command handlers as they are user-initiated
@@ -698,12 +1430,56 @@ async def process_cmd(c: Client, m: Message):
     await edit_message_safely(pro, prompt_text)
 
 
+@X.on_message(filters.command('retryfailed') & filters.private & ~login_in_progress)
+async def retry_failed_cmd(c: Client, m: Message):
+    """Handles /retryfailed: re-runs only the failed items of the user's last batch."""
+    user_id = m.from_user.id
+    if await subscribe(c, m) == 1:
+        return
+
+    if is_user_active(user_id) or user_id in Z:
+        await m.reply_text('You have an active task. Use /stop to cancel it.')
+        return
+
+    pro = await m.reply_text('Looking up your last batch...')
+    latest, failed_ids = await ledger.last_batch_failures(user_id)
+    if not latest:
+        await edit_message_safely(pro, 'ℹ️ No batch history found.')
+        return
+    if not failed_ids:
+        await edit_message_safely(pro, '✅ Nothing to retry: your last batch has no failed items.')
+        return
+
+    ubot = await get_ubot(user_id) # Get user's bot client
+    uc = await get_uclient(user_id) # Get user client (might be global userbot)
+    if (not ubot or not ubot.is_connected) and (not uc or not uc.is_connected):
+        await edit_message_safely(pro, 'Cannot proceed without a connected bot or user client. Use /setbot or /login.')
+        return
+
+    is_prem = await is_premium_user(user_id)
+    chat_identifier, link_type, dest_chat_id, batch_id = latest['chat'], latest['link_type'], latest['dest'], latest['batch_id']
+    # Outcomes are written under the original batch_id, so a second /retryfailed only sees what still fails
+    await add_active_batch(user_id, {
+        "total": len(failed_ids), "current": 0, "success": 0, "cancel_requested": False,
+        "progress_message_id": pro.id,
+        "kind": "batch", "cid": chat_identifier, "sid": failed_ids[0], "num": len(failed_ids), "lt": link_type,
+        "did": dest_chat_id, "last_done": None, "premium": is_prem, "batch_id": batch_id, "ids": failed_ids
+    })
+    await edit_message_safely(pro, f'🔁 Retrying {len(failed_ids)} failed item(s) of your last batch...')
+    await submit_job(user_id, pro, lambda: run_batch(ubot, uc, user_id, pro, chat_identifier, failed_ids[0], len(failed_ids), link_type, dest_chat_id, batch_id=batch_id, message_ids=failed_ids), 'batch', premium=is_prem)
+
+
 @X.on_message(filters.command(['cancel', 'stop']) & filters.private)
 async def cancel_cmd(c: Client, m: Message):
     """Handles /cancel and /stop commands to cancel an active task or command sequence."""
     user_id = m.from_user.id
 
-    if is_user_active(user_id):
+    if SCHEDULER.is_queued(user_id):
+        # The task has not started yet, drop it from the queue right away
+        SCHEDULER.cancel_queued(user_id)
+        await remove_active_batch(user_id)
+        await m.reply_text('✅ Your queued task was removed from the queue.')
+    elif is_user_active(user_id):
         batch_info = get_batch_info(user_id)
         if batch_info and not batch_info.get("cancel_requested", False):
              if await request_batch_cancel(user_id):
@@ -728,7 +1504,8 @@ async def cancel_cmd(c: Client, m: Message):
 @X.on_message(filters.text & filters.private & ~login_in_progress & ~filters.command([
     'start', 'batch', 'cancel', 'login', 'logout', 'stop', 'set',
     'pay', 'redeem', 'gencode', 'single', 'generate', 'keyinfo', 'encrypt', 'decrypt',
-    'keys', 'setbot', 'rembot', 'settings', 'plan', 'terms', 'help', 'status', 'transfer', 'add', 'rem', 'dl', 'adl']))
+    'keys', 'setbot', 'rembot', 'settings', 'plan', 'terms', 'help', 'status', 'stats', 'transfer', 'add', 'rem', 'dl', 'adl',
+    'retryfailed']))
 async def text_handler(c: Client, m: Message):
     """Handles text input during command sequences."""
     user_id = m.from_user.id
@@ -773,9 +1550,6 @@ async def text_handler(c: Client, m: Message):
 
         Z[user_id].update({'step': 'process_single', 'cid': chat_identifier, 'sid': message_id, 'lt': link_type})
 
-        # Start processing the single message immediately
-        await edit_message_safely(progress_msg, '✅ Link received. Processing single message...')
-
         ubot = await get_ubot(user_id) # Get user's bot client
         uc = await get_uclient(user_id) # Get user client (might be global userbot)
 
@@ -789,25 +1563,13 @@ async def text_handler(c: Client, m: Message):
         # Add to active users to prevent other tasks
         await add_active_batch(user_id, {
             "total": 1, "current": 0, "success": 0, "cancel_requested": False,
-            "progress_message_id": progress_msg.id # Link to the progress message
+            "progress_message_id": progress_msg.id, # Link to the progress message
+            # Checkpoint used to resume the task after a restart
+            "kind": "single", "cid": chat_identifier, "sid": message_id, "num": 1, "lt": link_type, "did": str(m.chat.id)
         })
+        del Z[user_id] # The command sequence is complete, the scheduler owns the task from here
 
-        try:
-            # Fetch the single message
-            msg = await get_msg(ubot, uc, chat_identifier, message_id, link_type)
-            if msg:
-                # Process the single message
-                res = await process_msg(ubot, uc, msg, str(m.chat.id), link_type, user_id, chat_identifier) # Pass user_id and source_chat_identifier
-                await edit_message_safely(progress_msg, f'Single message process: {res}')
-            else:
-                await edit_message_safely(progress_msg, 'ℹ️ Message not found or inaccessible.')
-        except Exception as e:
-            print(f"Error during single message processing for user {user_id}: {e}")
-            await edit_message_safely(progress_msg, f'❌ Error processing message: {str(e)[:50]}')
-        finally:
-            # Clean up state regardless of success/failure
-            await remove_active_batch(user_id)
-            del Z[user_id]
+        await submit_job(user_id, progress_msg, lambda: run_single(ubot, uc, user_id, progress_msg, chat_identifier, message_id, link_type, str(m.chat.id)), 'single')
 
 
     elif s == 'count':
@@ -828,84 +1590,17 @@ async def text_handler(c: Client, m: Message):
             await edit_message_safely(progress_msg, f'❌ Maximum limit is {max_limit}. You are a {"Premium" if is_prem else "Freemium"} user.')
             return # Stay in this step
 
-        # Valid count received, move to process step
-        Z[user_id].update({'step': 'process_batch', 'did': str(m.chat.id), 'num': count}) # 'did' is destination chat id
-        chat_identifier, start_id, num_messages, link_type = Z[user_id]['cid'], Z[user_id]['sid'], Z[user_id]['num'], Z[user_id]['lt']
-        success_count = 0 # Initialize success counter
-
-        await edit_message_safely(progress_msg, f'✅ Count received. Starting batch processing for {num_messages} messages...')
-
-        ubot = await get_ubot(user_id) # Get user's bot client
-        uc = await get_uclient(user_id) # Get user client (might be global userbot)
-
-        # Need at least a user bot or a user client (or the global userbot Y) that is connected
-        if (not ubot or not ubot.is_connected) and (not uc or not uc.is_connected):
-            await edit_message_safely(progress_msg, 'Cannot proceed without a connected bot or user client. Use /setbot or /login.')
-            del Z[user_id]
-            return
-
-        # Add to active users to prevent other tasks
-        await add_active_batch(user_id, {
-            "total": num_messages, "current": 0, "success": 0, "cancel_requested": False,
-            "progress_message_id": progress_msg.id # Link to the progress message
-        })
-
-        try:
-            # Batch processing loop
-            for j in range(num_messages):
-                # Check for cancellation request before processing each message
-                if should_cancel(user_id):
-                    await edit_message_safely(progress_msg, f'Batch cancelled by user at message {j+1}/{num_messages}. Processed successfully: {success_count}.')
-                    break # Exit the loop
-
-                # Update batch progress state
-                await update_batch_progress(user_id, j + 1, success_count)
-
-                # Calculate the message ID to fetch in this iteration
-                current_message_id = start_id + j
-
-                try:
-                    # Fetch the current message in the batch
-                    msg = await get_msg(ubot, uc, chat_identifier, current_message_id, link_type)
-                    if msg:
-                        # Process the message (download, rename, upload)
-                        res = await process_msg(ubot, uc, msg, str(m.chat.id), link_type, user_id, chat_identifier) # Pass user_id and source_chat_identifier
-                        # Check the result string to determine success
-                        if 'Done' in res or 'Sent' in res: # 'Copied' is for large file copy
-                             success_count += 1
-                        # Update the progress message with current item status (optional but helpful)
-                        await edit_message_safely(progress_msg, f'Processing {j+1}/{num_messages} (Msg ID: {current_message_id}): {res}')
-                    else:
-                         # Message not found or inaccessible, update progress message
-                         await edit_message_safely(progress_msg, f'Processing {j+1}/{num_messages} (Msg ID: {current_message_id}): ℹ️ Message not found or inaccessible.')
-                         pass # Continue to the next message even if one fails
-
-                except Exception as e:
-                    # Catch errors specific to fetching or processing a single message
-                    print(f"Error processing message {current_message_id} in batch for user {user_id}: {e}")
-                    await edit_message_safely(progress_msg, f'Processing {j+1}/{num_messages} (Msg ID: {current_message_id}): ❌ Error - {str(e)[:50]}')
-                    # Decide whether to continue or break on error - continuing allows processing other messages
-
-                # Add a small delay between processing messages to avoid hitting API limits
-                await asyncio.sleep(5) # Increased delay slightly for caution
-
-
-            # After the loop finishes (either completed or cancelled)
-            if not should_cancel(user_id):
-                 # If the loop completed without cancellation
-                 await m.reply_text(f'Batch Completed ✅ Processed: {num_messages}. Successful: {success_count}/{num_messages}.')
-            # If cancelled, the cancellation message is already sent
-
-        except Exception as e:
-             # Catch any unexpected errors during the batch loop setup or iteration
-             print(f"Unexpected error during batch processing for user {user_id}: {e}")
-             await edit_message_safely(progress_msg, f'❌ An unexpected error occurred during batch processing: {str(e)[:50]}')
-
-        finally:
-            # Clean up active batch state regardless of how the process ended
-            await remove_active_batch(user_id)
-            del Z[user_id] # Clean up the command sequence state
-            # The progress message 'pt' is kept, potentially showing the final status or error.
+        # Valid count received: plan the batch before reserving a transfer slot
+        Z[user_id].update({'did': str(m.chat.id), 'num': count, 'premium': is_prem}) # 'did' is destination chat id
+        await show_batch_plan(user_id)
 
+    elif s == 'trim':
+        # User is expected to send a smaller number of messages after looking at the plan
+        num_messages = Z[user_id]['num']
+        if not m.text.isdigit() or not 1 <= int(m.text) <= num_messages:
+            await edit_message_safely(progress_msg, f'❌ Please send a number between 1 and {num_messages}.')
+            return # Stay in this step until valid input
+        Z[user_id]['num'] = int(m.text)
+        await show_batch_plan(user_id)
 
     # No other steps defined for the command sequence currently
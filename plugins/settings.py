@@ -11,7 +11,9 @@ import string
 import random # Used by generate_random_name if kept here
 from shared_client import client as gf # Alias Telethon client as gf
 from config import OWNER_ID
-from utils.func import get_user_data_key, save_user_data, users_collection, remove_user_session # Import remove_user_session
+from utils.func import get_user_data_key, save_user_data, users_collection, remove_user_session, settings_cache # Import remove_user_session
+from utils.func import save_thumbnail, remove_thumbnail, migrate_local_thumbnails
+from utils.rules import compile_rules
 
 # Define VIDEO_EXTENSIONS again if rename_file stays here and needs it
 # Or rely on it being defined in utils.func if rename_file is moved there
@@ -24,6 +26,11 @@ MESS = 'Customize settings for your files...'
 
 active_conversations = {} # {user_id: {'type': 'setting_type', 'message_id': int}}
 
+async def initialize():
+    """Starts cross-replica invalidation of cached settings when enabled and moves local thumbnails to GridFS."""
+    settings_cache.start_watch()
+    await migrate_local_thumbnails()
+
 # --- Helper functions for robustness ---
 async def edit_message_safely(event, text: str, buttons=None):
     """Helper function to edit message and handle errors like MessageNotModifiedError"""
@@ -160,17 +167,16 @@ async def callback_query_handler(event):
                     # 'session_string': ''
                 }}
             )
+            settings_cache.invalidate(user_id) # Written directly, so the cached copy is stale
 
-            # Remove the user's thumbnail file
-            thumbnail_path = f'{user_id}.jpg'
-            if os.path.exists(thumbnail_path):
-                try:
-                    os.remove(thumbnail_path)
-                except Exception as e:
-                    print(f"Error removing thumbnail file during reset for user {user_id}: {e}")
-
+            # Remove the user's thumbnail
+            thumbnail_removed = False
+            try:
+                thumbnail_removed = await remove_thumbnail(user_id)
+            except Exception as e:
+                print(f"Error removing thumbnail during reset for user {user_id}: {e}")
 
-            if result.modified_count > 0 or os.path.exists(thumbnail_path): # Check if db was modified or thumbnail existed
+            if result.modified_count > 0 or thumbnail_removed: # Check if db was modified or thumbnail existed
                  await edit_message_safely(event, '✅ All settings reset successfully. Use /logout for full session termination.')
             else:
                  await edit_message_safely(event, 'ℹ️ No settings found to reset.')
@@ -181,16 +187,14 @@ async def callback_query_handler(event):
 
     elif data == b'remthumb':
         await event.answer("Removing thumbnail...") # Dismiss loading indicator
-        thumbnail_path = f'{user_id}.jpg'
-        if os.path.exists(thumbnail_path):
-            try:
-                os.remove(thumbnail_path)
+        try:
+            if await remove_thumbnail(user_id):
                 await edit_message_safely(event, '✅ Thumbnail removed successfully!')
-            except Exception as e:
-                print(f"Error removing thumbnail file for user {user_id}: {e}")
-                await edit_message_safely(event, f'❌ Error removing thumbnail: {e}')
-        else:
-            await edit_message_safely(event, 'ℹ️ No thumbnail found to remove.')
+            else:
+                await edit_message_safely(event, 'ℹ️ No thumbnail found to remove.')
+        except Exception as e:
+            print(f"Error removing thumbnail for user {user_id}: {e}")
+            await edit_message_safely(event, f'❌ Error removing thumbnail: {e}')
 
 
 async def start_conversation(event, user_id: int, conv_type: str, prompt_message: str):
@@ -355,31 +359,14 @@ async def handle_setthumb(event, user_id: int):
     """Handles setting the custom thumbnail."""
     if event.photo:
         try:
-            # Download the photo
-            temp_path = await event.download_media()
-            thumb_path = f'{user_id}.jpg'
-
-            # Remove old thumbnail if it exists
-            if os.path.exists(thumb_path):
-                try:
-                    os.remove(thumb_path)
-                except Exception as e:
-                    print(f"Error removing old thumbnail {thumb_path}: {e}")
-                    # Continue saving the new one even if old one fails to remove
-
-            # Rename the downloaded photo to the standard thumbnail filename
-            os.rename(temp_path, thumb_path)
+            # Download the photo into memory; it is resized, re-encoded and stored in GridFS, replacing the old one
+            image = await event.download_media(file=bytes)
+            await save_thumbnail(user_id, image)
             await respond_safely(event, '✅ Thumbnail saved successfully!')
 
         except Exception as e:
             print(f"Error setting thumbnail for user {user_id}: {e}")
             await respond_safely(event, f'❌ Error saving thumbnail: {e}')
-            # Clean up the downloaded temp file if renaming failed
-            if 'temp_path' in locals() and os.path.exists(temp_path):
-                 try:
-                      os.remove(temp_path)
-                 except Exception:
-                      pass # Ignore errors during temp file cleanup
     else:
         await respond_safely(event, '❌ Please send a photo to set as the thumbnail. Operation cancelled.')
         # active_conversations.pop(user_id, None) # Already handled
@@ -393,6 +380,46 @@ def generate_random_name(length=7):
     return ''.join(random.choice(characters) for _ in range(length))
 
 
+async def get_renamed_file_name(original_filename: str, sender: int) -> str:
+    """
+    Applies user's renaming rules to a file name only (no file on disk needed).
+    Used by rename_file and by the relay mode, which uploads without a local copy.
+    """
+    delete_words = await get_user_data_key(sender, 'delete_words', [])
+    custom_rename_tag = await get_user_data_key(sender, 'rename_tag', '')
+    replacements = await get_user_data_key(sender, 'replacement_words', {})
+
+    name_without_ext, file_extension = os.path.splitext(original_filename)
+
+    # Remove leading/trailing whitespace after splitext
+    name_without_ext = name_without_ext.strip()
+    file_extension = file_extension.lstrip('.').lower() # Remove dot and lowercase extension
+
+    # Apply word deletions, then replacements (compiled once per rule set)
+    processed_name = compile_rules(delete_words, replacements).apply_name(name_without_ext)
+
+    # Add custom rename tag if it exists
+    if custom_rename_tag:
+         # Add space before tag if the processed name is not empty
+         if processed_name:
+             processed_name = f"{processed_name} {custom_rename_tag}"
+         else:
+             processed_name = custom_rename_tag
+
+    # Sanitize the resulting filename to remove invalid characters
+    sanitized_name = re.sub(r'[<>:"/\\|?*]', '_', processed_name)
+    # Ensure filename is not empty after sanitization and processing
+    if not sanitized_name:
+        sanitized_name = generate_random_name() # Generate a random name if processing results in empty string
+
+    # Ensure extension is present, default to mp4 if unknown or problematic (original logic)
+    # A more robust approach would be to preserve the original extension unless explicitly changing type.
+    final_extension = file_extension if file_extension in VIDEO_EXTENSIONS else 'mp4' if file_extension else 'mp4' # Simplified logic
+    # Or maybe better: use the original extension if available, otherwise default?
+    # final_extension = file_extension if file_extension else 'bin' # More general fallback
+
+    return f'{sanitized_name}.{final_extension}'
+
 async def rename_file(file: str, sender: int, edit_message_event=None):
     """
     Applies user's renaming rules to a downloaded file.
@@ -400,47 +427,8 @@ async def rename_file(file: str, sender: int, edit_message_event=None):
     edit_message_event is an optional Telethon event/message to edit for progress/status.
     """
     try:
-        delete_words = await get_user_data_key(sender, 'delete_words', [])
-        custom_rename_tag = await get_user_data_key(sender, 'rename_tag', '')
-        replacements = await get_user_data_key(sender, 'replacement_words', {})
-
         original_filename = os.path.basename(file)
-        name_without_ext, file_extension = os.path.splitext(original_filename)
-
-        # Remove leading/trailing whitespace after splitext
-        name_without_ext = name_without_ext.strip()
-        file_extension = file_extension.lstrip('.').lower() # Remove dot and lowercase extension
-
-        # Apply word deletions
-        processed_name = name_without_ext
-        for word in delete_words:
-            processed_name = processed_name.replace(word, '') # Simple string replacement
-
-        # Apply word replacements
-        for word, replace_word in replacements.items():
-            processed_name = processed_name.replace(word, replace_word) # Simple string replacement
-
-        # Add custom rename tag if it exists
-        if custom_rename_tag:
-             # Add space before tag if the processed name is not empty
-             if processed_name:
-                 processed_name = f"{processed_name} {custom_rename_tag}"
-             else:
-                 processed_name = custom_rename_tag
-
-        # Sanitize the resulting filename to remove invalid characters
-        sanitized_name = re.sub(r'[<>:"/\\|?*]', '_', processed_name)
-        # Ensure filename is not empty after sanitization and processing
-        if not sanitized_name:
-            sanitized_name = generate_random_name() # Generate a random name if processing results in empty string
-
-        # Ensure extension is present, default to mp4 if unknown or problematic (original logic)
-        # A more robust approach would be to preserve the original extension unless explicitly changing type.
-        final_extension = file_extension if file_extension in VIDEO_EXTENSIONS else 'mp4' if file_extension else 'mp4' # Simplified logic
-        # Or maybe better: use the original extension if available, otherwise default?
-        # final_extension = file_extension if file_extension else 'bin' # More general fallback
-
-        new_file_name = f'{sanitized_name}.{final_extension}'
+        new_file_name = await get_renamed_file_name(original_filename, sender)
         new_file_path = os.path.join(os.path.dirname(file), new_file_name)
 
         # Avoid overwriting if file with new name already exists (unlikely but safe)
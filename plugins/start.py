@@ -78,6 +78,7 @@ async def set_commands(_, message):
             BotCommand("start", "🚀 Start the bot"),
             BotCommand("batch", "🫠 Extract in bulk"),
             BotCommand("single", "🫠 Extract single post"), # Added from batch.py
+            BotCommand("retryfailed", "🔁 Retry failed items of your last batch"),
             BotCommand("login", "🔑 Get into the bot"),
             BotCommand("setbot", "🧸 Add your bot for handling files"),
             BotCommand("logout", "🚪 Get out of the bot"),
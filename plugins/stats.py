@@ -5,8 +5,9 @@
 from datetime import timedelta, datetime
 from shared_client import client as bot_client
 from telethon import events
-from utils.func import get_premium_details, is_private_chat, get_display_name, get_user_data, premium_users_collection, is_premium_user
+from utils.func import get_premium_details, is_private_chat, get_display_name, get_user_data, premium_users_collection, is_premium_user, settings_cache
 from config import OWNER_ID
+from utils.media_cache import media_cache
 import logging
 logging.basicConfig(format=
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -175,4 +176,28 @@ async def remove_premium_handler(event):
     except Exception as e:
         logger.error(f'Error removing premium from {target_user_id}: {e}')
         await event.respond(f'❌ Error removing premium: {str(e)}')
-        return
\ No newline at end of file
+        return
+
+
+@bot_client.on(events.NewMessage(pattern=r'^/stats$'))
+async def stats_handler(event):
+    """Owner-only: reports cache effectiveness."""
+    if not await is_private_chat(event) or event.sender_id not in OWNER_ID:
+        return
+    cache = await media_cache.stats()
+    session, lifetime = cache['session'], cache['lifetime']
+    settings = settings_cache.stats()
+    await event.respond(
+        "**📊 Media cache**\n\n"
+        f"**Entries:** {cache['entries']}\n"
+        f"**Since start:** {session['hits']} hits / {session['misses']} misses ({session['hit_rate']:.1f}% hit rate), "
+        f"{session['stores']} stored, {session['invalidations']} invalidated\n"
+        f"**Lifetime:** {lifetime['hits']} hits / {lifetime['misses']} misses ({lifetime['hit_rate']:.1f}% hit rate), "
+        f"{lifetime['stores']} stored, {lifetime['invalidations']} invalidated\n\n"
+        "**⚙️ Settings cache**\n\n"
+        f"**Users cached:** {settings['entries']}\n"
+        f"**Lookups:** {settings['hits']} hits / {settings['misses']} misses ({settings['hit_rate']:.1f}% hit rate), "
+        f"{settings['invalidations']} invalidated\n"
+        f"**Mongo queries:** {settings['queries']} for {settings['messages']} processed messages "
+        f"({settings['queries_per_message']:.2f} per message)"
+    )
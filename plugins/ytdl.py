@@ -12,14 +12,11 @@
 # License: MIT License
 # ---------------------------------------------------
 
-import yt_dlp
 import os
-import tempfile
 import time
 import asyncio
 import random
 import string
-import requests
 import logging
 import time
 import math
@@ -28,48 +25,47 @@ from telethon import events
 from telethon.sync import TelegramClient
 from telethon.tl.types import DocumentAttributeVideo
 from utils.func import get_video_metadata, screenshot
+from utils.thumbs import as_upload, remote_images
+from utils.thumb_store import normalize_thumbnail
 from telethon.tl.functions.messages import EditMessageRequest
 from devgagantools import fast_upload
-from concurrent.futures import ThreadPoolExecutor
-import aiohttp 
 import logging
-import aiofiles
-from config import YT_COOKIES, INSTA_COOKIES
-from mutagen.id3 import ID3, TIT2, TPE1, COMM, APIC
-from mutagen.mp3 import MP3
+from utils.relay import install_save_file_hook
+from utils.uploader import split_file
+from utils.ytdl_pool import ytdl_pool
  
 logger = logging.getLogger(__name__)
  
- 
-thread_pool = ThreadPoolExecutor()
-ongoing_downloads = {}
- 
-def d_thumbnail(thumbnail_url, save_path):
-    try:
-        response = requests.get(thumbnail_url, stream=True)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        return save_path
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to download thumbnail: {e}")
-        return None
+install_save_file_hook() # split_file parts upload themselves through send_document
  
  
-async def download_thumbnail_async(url, path):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                with open(path, 'wb') as f:
-                    f.write(await response.read())
+ongoing_downloads = {}
  
  
-async def extract_audio_async(ydl_opts, url):
-    def sync_extract():
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            return ydl.extract_info(url, download=True)
-    return await asyncio.get_event_loop().run_in_executor(thread_pool, sync_extract)
+async def shutdown():
+    """Stops the yt-dlp worker processes and the thumbnail HTTP session."""
+    await ytdl_pool.close()
+    await remote_images.close()
+ 
+def ytdl_progress(message, label):
+    """Progress callback for ytdl_pool jobs: edits message at most every 5 seconds."""
+    last = {'time': 0.0}
+ 
+    async def update(event):
+        now = time.time()
+        if event.get('status') == 'postprocessing':
+            text = "**__Post-processing...__**"
+        elif event.get('status') == 'downloading' and now - last['time'] >= 5:
+            done = event.get('downloaded_bytes') or 0
+            total = event.get('total_bytes') or event.get('total_bytes_estimate') or 0
+            text = f"**__{label}__** {humanbytes(done) or '0 B'}" + (f" / {humanbytes(total)}" if total else "")
+            if event.get('speed'):
+                text += f" ({humanbytes(event['speed'])}/s)"
+        else:
+            return
+        last['time'] = now
+        await message.edit(text)
+    return update
  
  
 def get_random_string(length=7):
@@ -77,17 +73,7 @@ def get_random_string(length=7):
     return ''.join(random.choice(characters) for _ in range(length)) 
  
  
-async def process_audio(client, event, url, cookies_env_var=None):
-    cookies = None
-    if cookies_env_var:
-        cookies = cookies_env_var
- 
-    temp_cookie_path = None
-    if cookies:
-        with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.txt') as temp_cookie_file:
-            temp_cookie_file.write(cookies)
-            temp_cookie_path = temp_cookie_file.name
- 
+async def process_audio(client, event, url, profile=None):
     start_time = time.time()
     random_filename = f"@team_spy_pro_{event.sender_id}"
     download_path = f"{random_filename}.mp3"
@@ -95,7 +81,6 @@ async def process_audio(client, event, url, cookies_env_var=None):
     ydl_opts = {
         'format': 'bestaudio/best',
         'outtmpl': f"{random_filename}.%(ext)s",
-        'cookiefile': temp_cookie_path,
         'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}],
         'quiet': False,
         'noplaylist': True,
@@ -106,35 +91,19 @@ async def process_audio(client, event, url, cookies_env_var=None):
  
     try:
          
-        info_dict = await extract_audio_async(ydl_opts, url)
+        # Download and MP3 conversion run in a yt-dlp worker process, reusing a cached extraction
+        info_dict = await ytdl_pool.extract(url, profile)
+        info_dict = await ytdl_pool.run({'op': 'download', 'url': url, 'profile': profile, 'opts': ydl_opts, 'info': info_dict},
+                                        on_progress=ytdl_progress(progress_message, "Downloading audio..."))
         title = info_dict.get('title', 'Extracted Audio')
  
         await progress_message.edit("**__Editing metadata...__**")
  
          
         if os.path.exists(download_path):
-            def edit_metadata():
-                audio_file = MP3(download_path, ID3=ID3)
-                try:
-                    audio_file.add_tags()
-                except Exception:
-                    pass
-                audio_file.tags["TIT2"] = TIT2(encoding=3, text=title)
-                audio_file.tags["TPE1"] = TPE1(encoding=3, text="Team SPY")
-                audio_file.tags["COMM"] = COMM(encoding=3, lang="eng", desc="Comment", text="Processed by Team SPY")
- 
-                thumbnail_url = info_dict.get('thumbnail')
-                if thumbnail_url:
-                    thumbnail_path = os.path.join(tempfile.gettempdir(), "thumb.jpg")
-                    asyncio.run(download_thumbnail_async(thumbnail_url, thumbnail_path))
-                    with open(thumbnail_path, 'rb') as img:
-                        audio_file.tags["APIC"] = APIC(
-                            encoding=3, mime='image/jpeg', type=3, desc='Cover', data=img.read()
-                        )
-                    os.remove(thumbnail_path)
-                audio_file.save()
- 
-            await asyncio.to_thread(edit_metadata)
+            await ytdl_pool.run({'op': 'tag_audio', 'args': {
+                'path': download_path, 'title': title, 'artist': "Team SPY",
+                'comment': "Processed by Team SPY", 'cover': await remote_images.get(info_dict.get('thumbnail'))}})
  
          
  
@@ -161,8 +130,6 @@ async def process_audio(client, event, url, cookies_env_var=None):
     finally:
         if os.path.exists(download_path):
             os.remove(download_path)
-        if temp_cookie_path and os.path.exists(temp_cookie_path):
-            os.remove(temp_cookie_path)
  
 @client.on(events.NewMessage(pattern="/adl"))
 async def handler(event):
@@ -180,9 +147,9 @@ async def handler(event):
  
     try:
         if "instagram.com" in url:
-            await process_audio(client, event, url, cookies_env_var="INSTA_COOKIES")
+            await process_audio(client, event, url, profile="insta")
         elif "youtube.com" in url or "youtu.be" in url:
-            await process_audio(client, event, url, cookies_env_var="YT_COOKIES")
+            await process_audio(client, event, url, profile="yt")
         else:
             await process_audio(client, event, url)
     except Exception as e:
@@ -191,29 +158,22 @@ async def handler(event):
         ongoing_downloads.pop(user_id, None)
  
  
-async def fetch_video_info(url, ydl_opts, progress_message, check_duration_and_size):
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info_dict = ydl.extract_info(url, download=False)
- 
-        if check_duration_and_size:
-             
-            duration = info_dict.get('duration', 0)
-            if duration and duration > 3 * 3600:   
-                await progress_message.edit("**❌ __Video is longer than 3 hours. Download aborted...__**")
-                return None
- 
-             
-            estimated_size = info_dict.get('filesize_approx', 0)
-            if estimated_size and estimated_size > 2 * 1024 * 1024 * 1024:   
-                await progress_message.edit("**🤞 __Video size is larger than 2GB. Aborting download.__**")
-                return None
- 
-        return info_dict
+async def fetch_video_info(url, profile, progress_message, check_duration_and_size):
+    info_dict = await ytdl_pool.extract(url, profile)
+    if check_duration_and_size:
+         
+        duration = info_dict.get('duration', 0)
+        if duration and duration > 3 * 3600:   
+            await progress_message.edit("**❌ __Video is longer than 3 hours. Download aborted...__**")
+            return None
  
-def download_video(url, ydl_opts):
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
+         
+        estimated_size = info_dict.get('filesize_approx', 0)
+        if estimated_size and estimated_size > 2 * 1024 * 1024 * 1024:   
+            await progress_message.edit("**🤞 __Video size is larger than 2GB. Aborting download.__**")
+            return None
  
+    return info_dict
  
 @client.on(events.NewMessage(pattern="/dl"))
 async def handler(event):
@@ -233,9 +193,9 @@ async def handler(event):
      
     try:
         if "instagram.com" in url:
-            await process_video(client, event, url, "INSTA_COOKIES", check_duration_and_size=False)
+            await process_video(client, event, url, "insta", check_duration_and_size=False)
         elif "youtube.com" in url or "youtu.be" in url:
-            await process_video(client, event, url, "YT_COOKIES", check_duration_and_size=True)
+            await process_video(client, event, url, "yt", check_duration_and_size=True)
         else:
             await process_video(client, event, url, None, check_duration_and_size=False)
  
@@ -312,13 +272,9 @@ def progress_callback(done, total, user_id):
  
     return final
  
-async def process_video(client, event, url, cookies_env_var, check_duration_and_size=False):
+async def process_video(client, event, url, profile, check_duration_and_size=False):
     start_time = time.time()
     logger.info(f"Received link: {url}")
-     
-    cookies = None
-    if cookies_env_var:
-        cookies = cookies_env_var
  
      
     random_filename = get_random_string() + ".mp4"
@@ -326,34 +282,25 @@ async def process_video(client, event, url, cookies_env_var, check_duration_and_
     logger.info(f"Generated random download path: {download_path}")
  
      
-    temp_cookie_path = None
-    if cookies:
-        with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.txt') as temp_cookie_file:
-            temp_cookie_file.write(cookies)
-            temp_cookie_path = temp_cookie_file.name
-        logger.info(f"Created temporary cookie file at: {temp_cookie_path}")
- 
-     
-    thumbnail_file = None
     metadata = {'width': None, 'height': None, 'duration': None, 'thumbnail': None}
  
      
     ydl_opts = {
         'outtmpl': download_path,
         'format': 'best',
-        'cookiefile': temp_cookie_path if temp_cookie_path else None,
-        'writethumbnail': True,
         'verbose': True,
     }
     prog = None
     progress_message = await event.reply("**__Starting download...__**")
     logger.info("Starting the download process...")
     try:
-        info_dict = await fetch_video_info(url, ydl_opts, progress_message, check_duration_and_size)
+        info_dict = await fetch_video_info(url, profile, progress_message, check_duration_and_size)
         if not info_dict:
             return
          
-        await asyncio.to_thread(download_video, url, ydl_opts)
+        # The download reuses the extraction the checks above ran on
+        await ytdl_pool.run({'op': 'download', 'url': url, 'profile': profile, 'opts': ydl_opts, 'info': info_dict},
+                            on_progress=ytdl_progress(progress_message, "Downloading..."))
         title = info_dict.get('title', 'Powered by Team SPY')
         k = await get_video_metadata(download_path)      
         W = k['width']
@@ -366,27 +313,27 @@ async def process_video(client, event, url, cookies_env_var, check_duration_and_
         THUMB = None
  
          
-        if thumbnail_url:
-            thumbnail_file = os.path.join(tempfile.gettempdir(), get_random_string() + ".jpg")
-            downloaded_thumb = d_thumbnail(thumbnail_url, thumbnail_file)
-            if downloaded_thumb:
-                logger.info(f"Thumbnail saved at: {downloaded_thumb}")
- 
-        if thumbnail_file:
-            THUMB = thumbnail_file
-        else:
+        # The site's thumbnail, fetched into memory and shrunk to Telegram's thumbnail limits
+        thumb_data = await remote_images.get(thumbnail_url)
+        if thumb_data:
+            try:
+                THUMB = as_upload(await asyncio.to_thread(normalize_thumbnail, thumb_data))
+            except Exception as e:
+                logger.warning(f"Unusable thumbnail {thumbnail_url}: {e}")
+        if not THUMB:
             THUMB = await screenshot(download_path, metadata['duration'], event.sender_id)
 
         chat_id = event.chat_id
-        SIZE = 2 * 1024 * 1024
+        SIZE = 2 * 1024 * 1024 * 1024
         caption = f"{title}"
      
         if os.path.exists(download_path) and os.path.getsize(download_path) > SIZE:
+            await progress_message.delete()
             prog = await client.send_message(chat_id, "**__Starting Upload...__**")
             await split_and_upload_file(app, chat_id, download_path, caption)
             await prog.delete()
          
-        if os.path.exists(download_path):
+        elif os.path.exists(download_path):
             await progress_message.delete()
             prog = await client.send_message(chat_id, "**__Starting Upload...__**")
             uploaded = await fast_upload(
@@ -419,10 +366,6 @@ async def process_video(client, event, url, cookies_env_var, check_duration_and_
          
         if os.path.exists(download_path):
             os.remove(download_path)
-        if temp_cookie_path and os.path.exists(temp_cookie_path):
-            os.remove(temp_cookie_path)
-        if thumbnail_file and os.path.exists(thumbnail_file):
-            os.remove(thumbnail_file)
  
 
 async def split_and_upload_file(app, sender, file_path, caption):
@@ -432,34 +375,16 @@ async def split_and_upload_file(app, sender, file_path, caption):
 
     file_size = os.path.getsize(file_path)
     start = await app.send_message(sender, f"ℹ️ File size: {file_size / (1024 * 1024):.2f} MB")
-    PART_SIZE =  1.9 * 1024 * 1024 * 1024
 
-    part_number = 0
-    async with aiofiles.open(file_path, mode="rb") as f:
-        while True:
-            chunk = await f.read(PART_SIZE)
-            if not chunk:
-                break
-
-            # Create part filename
-            base_name, file_ext = os.path.splitext(file_path)
-            part_file = f"{base_name}.part{str(part_number).zfill(3)}{file_ext}"
-
-            # Write part to file
-            async with aiofiles.open(part_file, mode="wb") as part_f:
-                await part_f.write(chunk)
-
-            # Uploading part
-            edit = await app.send_message(sender, f"⬆️ Uploading part {part_number + 1}...")
-            part_caption = f"{caption} \n\n**Part : {part_number + 1}**"
-            await app.send_document(sender, document=part_file, caption=part_caption,
-                progress=progress_bar,
-                progress_args=("╭─────────────────────╮\n│      **__Pyro Uploader__**\n├─────────────────────", edit, time.time())
-            )
-            await edit.delete()
-            os.remove(part_file)
-
-            part_number += 1
+    # Each part is a byte range of the downloaded file, uploaded from it directly: no part files are written
+    for part_number, part in enumerate(split_file(file_path)):
+        edit = await app.send_message(sender, f"⬆️ Uploading part {part_number + 1}...")
+        part_caption = f"{caption} \n\n**Part : {part_number + 1}**"
+        await app.send_document(sender, document=part, file_name=part.name, caption=part_caption,
+            progress=progress_bar,
+            progress_args=("╭─────────────────────╮\n│      **__Pyro Uploader__**\n├─────────────────────", edit, time.time())
+        )
+        await edit.delete()
 
     await start.delete()
     os.remove(file_path)
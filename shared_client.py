@@ -4,12 +4,12 @@
 
 from telethon import TelegramClient
 from telethon.errors import FloodWaitError as TelethonFloodWaitError # Rename to avoid conflict
-from config import API_ID, API_HASH, BOT_TOKEN, STRING
+from config import API_ID, API_HASH, BOT_TOKEN, STRING, PREMIUM_SESSIONS
 from pyrogram import Client
 from pyrogram.errors import FloodWait as PyrogramFloodWait # Specific Pyrogram FloodWait
 import sys
 import asyncio # Import asyncio for sleep
-from typing import Dict, Any # Import for type hinting
+from typing import Dict, Any, List # Import for type hinting
 import time # Import time for logging wait duration
 
 # Initialize clients (these are the primary clients used by the bot)
@@ -26,6 +26,14 @@ if STRING:
         print("The bot will start without the global userbot.", file=sys.stderr)
         userbot = None # Ensure userbot is None if initialization fails
 
+# Premium sessions that upload files over 2 GB; the global userbot is the first of them
+premium_userbots: List[Client] = [userbot] if userbot else []
+for index, session in enumerate(PREMIUM_SESSIONS, start=1):
+    try:
+        premium_userbots.append(Client(f"4gbbot_{index}", api_id=API_ID, api_hash=API_HASH, session_string=session))
+    except Exception as e:
+        print(f"Warning: Failed to initialize premium session {index}: {e}", file=sys.stderr)
+
 # Dictionaries to cache user-specific clients (moved from plugins/batch.py)
 UB: Dict[int, Client] = {} # Cache for user-specific bot clients {user_id: client_instance}
 UC: Dict[int, Client] = {} # Cache for user-specific user clients {user_id: client_instance}
@@ -42,6 +50,9 @@ async def start_client():
          clients_to_start.append(('Pyrogram client', app, PyrogramFloodWait))
     if userbot and not userbot.is_connected:
          clients_to_start.append(('Global Userbot', userbot, PyrogramFloodWait)) # Assuming userbot uses Pyrogram
+    for premium_client in premium_userbots:
+        if premium_client is not userbot and not premium_client.is_connected:
+            clients_to_start.append((f'Premium session {premium_client.name}', premium_client, PyrogramFloodWait))
 
     # Retry logic for starting each client
     for client_name, client_instance, flood_wait_error_type in clients_to_start:
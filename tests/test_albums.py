@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pyrogram')
+
+from utils.prefetch import group_albums
+
+
+def message(message_id, group=None):
+    return SimpleNamespace(id=message_id, media_group_id=group)
+
+
+def is_member(msg):
+    return bool(msg and msg.media_group_id)
+
+
+def grouped(messages):
+    async def items():
+        for msg in messages:
+            yield (msg.id if msg else None), msg
+
+    async def collect():
+        return [(ids, [m.id for m in msg] if isinstance(msg, list) else msg and msg.id)
+                async for ids, msg in group_albums(items(), is_member)]
+
+    return asyncio.run(collect())
+
+
+def test_consecutive_members_become_one_item():
+    messages = [message(1), message(2, 'a'), message(3, 'a'), message(4, 'a'), message(5)]
+    assert grouped(messages) == [([1], 1), ([2, 3, 4], [2, 3, 4]), ([5], 5)]
+
+
+def test_adjacent_albums_stay_separate():
+    messages = [message(1, 'a'), message(2, 'a'), message(3, 'b'), message(4, 'b')]
+    assert grouped(messages) == [([1, 2], [1, 2]), ([3, 4], [3, 4])]
+
+
+def test_album_at_the_end_is_flushed():
+    assert grouped([message(1), message(2, 'a'), message(3, 'a')]) == [([1], 1), ([2, 3], [2, 3])]
+
+
+def test_single_member_and_missing_messages_pass_through():
+    async def items():
+        yield 1, message(1, 'a')
+        yield 2, None
+        yield 3, message(3, 'b')
+
+    async def collect():
+        return [(ids, msg) async for ids, msg in group_albums(items(), is_member)]
+
+    result = asyncio.run(collect())
+    assert [ids for ids, _ in result] == [[1], [2], [3]]
+    assert result[0][1].id == 1 and result[1][1] is None and result[2][1].id == 3
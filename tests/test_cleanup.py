@@ -0,0 +1,66 @@
+import io
+
+import pytest
+
+pytest.importorskip('pyrogram')
+pytest.importorskip('motor')
+
+from plugins.batch import cleanup_item
+from utils.disk_cache import disk_cache
+from utils.relay import RelayFile
+
+
+def relay_file(size=1024):
+    return RelayFile(None, None, 'video.mp4', size)
+
+
+def test_owns_ignores_in_memory_files():
+    assert not disk_cache.owns(io.BytesIO(b'jpeg'))
+    assert not disk_cache.owns(relay_file())
+    assert not disk_cache.owns(None)
+
+
+def test_cleanup_relay_item():
+    item = {'file': relay_file(), 'thumb': None}
+    cleanup_item(item)
+    assert isinstance(item['file'], RelayFile)
+
+
+def test_cleanup_bytesio_item(tmp_path):
+    downloaded = tmp_path / 'video.mp4'
+    downloaded.write_bytes(b'0' * 16)
+    in_memory = io.BytesIO(b'data')
+    in_memory.name = 'video.mp4'
+    cleanup_item({'file': in_memory, 'downloaded_file': str(downloaded)})
+    assert not downloaded.exists()
+    assert not in_memory.closed and in_memory.getvalue() == b'data'
+
+
+def test_cleanup_removes_local_file(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'0' * 16)
+    cleanup_item({'file': str(path)})
+    assert not path.exists()
+
+
+def test_cleanup_thumbnailed_upload(tmp_path):
+    from utils.thumbs import as_upload
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'0' * 16)
+    thumb = as_upload(b'\xff\xd8jpeg')
+    cleanup_item({'file': str(path), 'thumb': thumb})
+    assert not path.exists()
+    assert thumb.getvalue() == b'\xff\xd8jpeg'
+
+
+def test_cleanup_thumbnailed_relay_upload(tmp_path, monkeypatch):
+    from utils.thumbs import as_upload
+    # Files named like the in-memory objects must not be mistaken for them
+    monkeypatch.chdir(tmp_path)
+    for name in ('video.mp4', 'thumb.jpg'):
+        (tmp_path / name).write_bytes(b'keep')
+    thumb = as_upload(b'\xff\xd8jpeg')
+    item = {'file': relay_file(), 'thumb': thumb}
+    cleanup_item(item)
+    assert (tmp_path / 'video.mp4').read_bytes() == (tmp_path / 'thumb.jpg').read_bytes() == b'keep'
+    assert item['thumb'] is thumb and not thumb.closed and thumb.getvalue() == b'\xff\xd8jpeg'
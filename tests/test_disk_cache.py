@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('dotenv')
+
+from utils.disk_cache import DiskCache
+
+
+def test_fetch_gives_each_item_its_own_path(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'), 1024 * 1024)
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(b'0' * 16)
+    asyncio.run(cache.store('AgADkey', str(source)))
+
+    dest = str(tmp_path / 'downloads' / 'video.mp4')
+    first = asyncio.run(cache.fetch('AgADkey', dest))
+    second = asyncio.run(cache.fetch('AgADkey', dest))
+    assert first == dest
+    assert second != first
+    assert open(first, 'rb').read() == open(second, 'rb').read() == b'0' * 16
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pyrogram')
+pytest.importorskip('dotenv')
+
+from pyrogram import raw
+
+from utils import downloader
+from utils.downloader import CHUNK_SIZE, _parallel_download, download_media, get_media, media_file_name
+
+FILE_ID = SimpleNamespace(media_id=1, access_hash=2, file_reference=b'', dc_id=4)
+
+
+class FakeSession:
+    def __init__(self, data, fail_at=None):
+        self.data = data
+        self.fail_at = fail_at
+
+    async def invoke(self, request):
+        await asyncio.sleep(random.random() / 1000) # Let ranges complete out of order
+        if request.offset == self.fail_at:
+            raise ConnectionError('connection lost')
+        chunk = self.data[request.offset:request.offset + request.limit]
+        return raw.types.upload.File(type=raw.types.storage.FilePartial(), mtime=0, bytes=chunk)
+
+
+class FakePool:
+    def __init__(self, session):
+        self.session = session
+        self.acquired = 0
+        self.released = []
+
+    async def acquire(self, client, dc_id):
+        self.acquired += 1
+        return self.session
+
+    async def release(self, client, dc_id, session, broken=False):
+        self.released.append(broken)
+
+
+def test_ranges_are_written_at_their_offsets(tmp_path, monkeypatch):
+    data = os.urandom(CHUNK_SIZE * 5 + 123)
+    pool = FakePool(FakeSession(data))
+    monkeypatch.setattr(downloader, 'session_pool', pool)
+    progress = []
+
+    async def on_progress(current, total):
+        progress.append((current, total))
+
+    path = str(tmp_path / 'video.mp4')
+    assert asyncio.run(_parallel_download(None, FILE_ID, len(data), path, 3, on_progress, ())) == path
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(path + '.temp')
+    assert pool.acquired == 3 and pool.released == [False] * 3
+    assert progress[-1] == (len(data), len(data))
+
+
+def test_failed_range_removes_the_partial_file(tmp_path, monkeypatch):
+    data = os.urandom(CHUNK_SIZE * 4)
+    pool = FakePool(FakeSession(data, fail_at=2 * CHUNK_SIZE))
+    monkeypatch.setattr(downloader, 'session_pool', pool)
+    path = str(tmp_path / 'video.mp4')
+    with pytest.raises(ConnectionError):
+        asyncio.run(_parallel_download(None, FILE_ID, len(data), path, 2, None, ()))
+    assert os.listdir(tmp_path) == []
+    assert True in pool.released
+
+
+def test_small_files_use_the_sequential_download():
+    calls = []
+
+    class Client:
+        async def download_media(self, message, file_name=None, progress=None, progress_args=()):
+            calls.append(file_name)
+            return 'downloads/small.bin'
+
+    message = SimpleNamespace(id=7, media=SimpleNamespace(value='document'), document=SimpleNamespace(file_size=1024, file_id='x'))
+    assert asyncio.run(download_media(Client(), message)) == 'downloads/small.bin'
+    assert calls == ['downloads/']
+
+
+def test_media_helpers():
+    video = SimpleNamespace(file_name=None, mime_type='video/mp4')
+    message = SimpleNamespace(id=9, media=SimpleNamespace(value='video'), video=video)
+    assert get_media(message) is video
+    assert media_file_name(message, video) == 'video_9.mp4'
+    photo = SimpleNamespace(id=10, media=SimpleNamespace(value='photo'), photo=object())
+    assert get_media(photo) is None
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('pymongo')
+pytest.importorskip('motor')
+pytest.importorskip('dotenv')
+
+from utils.ledger import FAILED, MISSING, OK, SKIPPED, BatchLedger, result_code
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """In-memory stand-in for the upserts, finds and sorts the ledger uses."""
+
+    def __init__(self):
+        self.docs = {}
+        self.bulk_writes = 0
+
+    async def create_index(self, keys):
+        pass
+
+    async def bulk_write(self, ops, ordered=True):
+        self.bulk_writes += 1
+        for op in ops:
+            self.docs.setdefault(op._filter['_id'], {}).update(op._doc['$set'])
+
+    def _match(self, query):
+        return [d for d in self.docs.values() if all(d.get(k) == v for k, v in query.items())]
+
+    async def find_one(self, query, sort=None):
+        docs = self._match(query)
+        return max(docs, key=lambda d: d['at']) if docs else None
+
+    def find(self, query, projection=None):
+        return FakeCursor(self._match(query))
+
+
+def test_result_code():
+    assert result_code('✅ Done') == OK
+    assert result_code('Sent directly') == OK
+    assert result_code('Message not found') == MISSING
+    assert result_code('Skipped: text only') == SKIPPED
+    assert result_code('Error: timeout') == FAILED
+
+
+def test_records_are_written_in_one_bulk_write_when_the_buffer_fills():
+    async def main():
+        collection = FakeCollection()
+        ledger = BatchLedger(collection, flush_size=3, flush_interval=60)
+        for message_id in range(3):
+            ledger.record('b1', message_id, user_id=1, code=OK)
+        await asyncio.sleep(0)
+        await ledger.flush()
+        return collection
+
+    collection = asyncio.run(main())
+    assert collection.bulk_writes == 1
+    assert sorted(collection.docs) == ['b1:0', 'b1:1', 'b1:2']
+
+
+def test_pending_records_are_flushed_after_the_interval():
+    async def main():
+        collection = FakeCollection()
+        ledger = BatchLedger(collection, flush_size=100, flush_interval=0.01)
+        ledger.record('b1', 1, user_id=1, code=OK)
+        assert not collection.docs
+        await asyncio.sleep(0.05)
+        return collection
+
+    assert list(asyncio.run(main()).docs) == ['b1:1']
+
+
+def test_last_batch_failures_resumes_the_latest_batch():
+    async def main():
+        collection = FakeCollection()
+        ledger = BatchLedger(collection)
+        for message_id, code in ((1, OK), (2, FAILED), (3, FAILED)):
+            ledger.record('old', message_id, user_id=7, code=code)
+        await ledger.flush()
+        await asyncio.sleep(0.01)
+        for message_id, code in ((12, FAILED), (10, FAILED), (11, MISSING), (13, OK)):
+            ledger.record('new', message_id, user_id=7, code=code)
+        # A retry overwrites the earlier outcome of the same item
+        ledger.record('new', 12, user_id=7, code=OK)
+        return await ledger.last_batch_failures(7), await ledger.last_batch_failures(8)
+
+    (latest, failed), (none, no_ids) = asyncio.run(main())
+    assert latest['batch_id'] == 'new'
+    assert failed == [10]
+    assert none is None and no_ids == []
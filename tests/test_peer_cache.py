@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('pyrogram')
+pytest.importorskip('dotenv')
+
+from pyrogram import utils
+from pyrogram.errors import BadRequest
+
+from utils import peer_cache as peer_cache_module
+from utils.peer_cache import PeerCache, normalize_chat
+
+
+class FakeClient:
+    """Knows `peers` directly and `dialog_peers` only after its dialogs were walked."""
+
+    name = 'fake'
+
+    def __init__(self, peers=None, dialog_peers=None):
+        self.peers = dict(peers or {})
+        self.dialog_peers = dict(dialog_peers or {})
+        self.resolves = 0
+        self.dialog_walks = 0
+
+    async def resolve_peer(self, key):
+        self.resolves += 1
+        if key not in self.peers:
+            raise BadRequest(f'PEER_ID_INVALID {key}')
+        return self.peers[key]
+
+    async def get_dialogs(self):
+        self.dialog_walks += 1
+        self.peers.update(self.dialog_peers)
+        for _ in ():
+            yield
+
+
+def test_normalize_chat():
+    assert normalize_chat('-100123') == -100123
+    assert normalize_chat(' @SomeChannel ') == 'somechannel'
+    assert normalize_chat(42) == 42
+
+
+def test_hits_do_not_call_resolve_peer(monkeypatch):
+    monkeypatch.setattr(utils, 'get_peer_id', lambda peer: peer['id'], raising=False)
+    peer = {'id': -1001}
+    client = FakeClient(peers={-1001: peer, 'news': peer})
+    cache = PeerCache(negative_ttl=60)
+
+    async def main():
+        assert await cache.resolve(client, '-1001') is peer
+        assert await cache.resolve(client, -1001) is peer
+        assert await cache.resolve(client, '@News') is peer
+        assert await cache.resolve(client, -1001) is peer # Also stored under the username's chat ID
+
+    asyncio.run(main())
+    assert client.resolves == 2
+
+
+def test_unknown_peer_walks_dialogs_once():
+    peer = {'id': -1002}
+    client = FakeClient(dialog_peers={-1002: peer})
+    cache = PeerCache(negative_ttl=60)
+
+    async def main():
+        assert await cache.resolve(client, -1002) is peer
+        assert await cache.resolve(client, -1003) is None
+
+    asyncio.run(main())
+    # The second miss does not walk the dialogs again within DIALOG_SYNC_INTERVAL
+    assert client.dialog_walks == 1
+
+
+def test_inaccessible_peers_are_remembered_until_the_ttl(monkeypatch):
+    client = FakeClient()
+    cache = PeerCache(negative_ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr(peer_cache_module.time, 'monotonic', lambda: now[0])
+
+    async def main():
+        assert await cache.resolve(client, -1004) is None
+        resolves = client.resolves
+        assert await cache.resolve(client, -1004) is None
+        assert client.resolves == resolves
+        now[0] += 61
+        client.peers[-1004] = {'id': -1004}
+        assert await cache.resolve(client, -1004) == {'id': -1004}
+
+    asyncio.run(main())
+
+
+def test_forget_drops_the_negative_entry():
+    client = FakeClient()
+    cache = PeerCache(negative_ttl=60)
+
+    async def main():
+        assert await cache.resolve(client, 'private') is None
+        client.peers['private'] = {'id': -1005}
+        assert await cache.resolve(client, 'private') is None
+        cache.forget(client, '@private')
+        assert await cache.resolve(client, 'private') == {'id': -1005}
+
+    asyncio.run(main())
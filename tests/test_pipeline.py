@@ -0,0 +1,83 @@
+import asyncio
+import random
+
+from utils.pipeline import OrderedPipeline
+
+
+async def numbers(count):
+    for i in range(count):
+        yield i
+
+
+def test_results_reach_final_stage_in_input_order():
+    done = []
+
+    async def download(item):
+        await asyncio.sleep(random.random() / 100)
+        return item * 10
+
+    async def process(item):
+        await asyncio.sleep(random.random() / 100)
+        return item + 1
+
+    async def final(seq, item):
+        done.append((seq, item))
+
+    pipeline = OrderedPipeline([('download', download, 4), ('process', process, 3)], final, depth=5)
+    asyncio.run(pipeline.run(numbers(30)))
+    assert done == [(i, i * 10 + 1) for i in range(30)]
+
+
+def test_failed_items_are_forwarded_in_order():
+    done = []
+
+    async def stage(item):
+        if item == 2:
+            raise ValueError('bad item')
+        return item
+
+    async def final(seq, item):
+        done.append(item)
+
+    asyncio.run(OrderedPipeline([('stage', stage, 2)], final).run(numbers(4)))
+    assert done[:2] == [0, 1] and done[3] == 3
+    assert isinstance(done[2], ValueError)
+
+
+def test_depth_bounds_items_in_flight():
+    in_flight = 0
+    peak = 0
+
+    async def stage(item):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        return item
+
+    async def final(seq, item):
+        nonlocal in_flight
+        await asyncio.sleep(0.005) # Slow consumer
+        in_flight -= 1
+
+    asyncio.run(OrderedPipeline([('stage', stage, 8)], final, depth=3).run(numbers(20)))
+    assert in_flight == 0
+    assert peak <= 3
+
+
+def test_stop_lets_in_flight_items_finish():
+    done = []
+    pipeline = None
+
+    async def stage(item):
+        return item
+
+    async def final(seq, item):
+        done.append(item)
+        if item == 1:
+            pipeline.stop()
+
+    pipeline = OrderedPipeline([('stage', stage, 1)], final, depth=2)
+    asyncio.run(pipeline.run(numbers(100)))
+    assert done[:2] == [0, 1]
+    assert len(done) <= 4
@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pyrogram')
+
+from utils.planner import TWO_GB, build_plan, plan_batch, trim_plan
+from utils.prefetch import MessagePrefetcher
+
+MB = 1024 * 1024
+
+
+def message(message_id, kind=None, size=0):
+    msg = SimpleNamespace(id=message_id, empty=False, media=SimpleNamespace(value=kind) if kind else None)
+    if kind:
+        setattr(msg, kind, SimpleNamespace(file_size=size))
+    return msg
+
+
+class FakeClient:
+    name = 'planner-test'
+
+    def __init__(self, messages, last_id):
+        self.messages = {m.id: m for m in messages}
+        self.last_id = last_id
+        self.requested = []
+
+    async def get_chat_history(self, chat_id, limit=1):
+        yield SimpleNamespace(id=self.last_id)
+
+    async def get_messages(self, chat_id, ids):
+        self.requested += ids
+        return [self.messages.get(i) for i in ids]
+
+
+def never_direct(msg):
+    return False
+
+
+MESSAGES = [message(10, 'video', 300 * MB), message(11), message(13, 'document', TWO_GB + 1), message(14, 'photo', MB)]
+
+
+def test_plan_counts_kinds_sizes_and_gaps():
+    client = FakeClient(MESSAGES, last_id=14)
+    plan = asyncio.run(plan_batch(client, -100, 10, 8, lambda msg: msg.media.value == 'photo'))
+    assert dict(plan.kinds) == {'video': 1, 'text': 1, 'document': 1, 'photo': 1}
+    assert (plan.missing, plan.past_end, plan.last_found_id) == (1, 3, 14)
+    assert plan.over_2gb == [13]
+    assert plan.total_bytes == 300 * MB + TWO_GB + 1 + MB
+    assert (plan.direct, plan.transfer_items, plan.transfer_bytes) == (1, 2, 300 * MB + TWO_GB + 1)
+    assert client.requested == [10, 11, 12, 13, 14]
+
+
+def test_trim_reuses_the_fetched_messages():
+    client = FakeClient(MESSAGES, last_id=14)
+    plan = asyncio.run(plan_batch(client, -100, 10, 8, never_direct))
+    trimmed = trim_plan(plan, 3, never_direct)
+    assert (trimmed.start_id, trimmed.count) == (10, 3)
+    assert dict(trimmed.kinds) == {'video': 1, 'text': 1}
+    assert (trimmed.missing, trimmed.past_end, trimmed.last_found_id) == (1, 0, 11)
+    assert trimmed.transfer_bytes == 300 * MB and not trimmed.over_2gb
+    assert trimmed.fetched_at == plan.fetched_at
+    assert client.requested == [10, 11, 12, 13, 14]
+
+
+def test_build_plan_treats_unfetched_ids_as_past_end():
+    plan = build_plan(1, 4, {1: message(1), 2: None}, never_direct)
+    assert (plan.found, plan.missing, plan.past_end) == (1, 1, 2)
+
+
+def test_prefetcher_serves_known_messages_without_fetching():
+    client = FakeClient(MESSAGES, last_id=14)
+    known = {10: MESSAGES[0], 11: MESSAGES[1], 12: None}
+
+    async def main():
+        async with MessagePrefetcher(client, -100, range(10, 16), known=known) as prefetcher:
+            return [(message_id, msg) async for message_id, msg in prefetcher], prefetcher.reached_end
+
+    items, reached_end = asyncio.run(main())
+    assert items == [(10, MESSAGES[0]), (11, MESSAGES[1]), (12, None), (13, MESSAGES[2]), (14, MESSAGES[3])]
+    assert reached_end
+    assert client.requested == [13, 14]
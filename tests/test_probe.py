@@ -0,0 +1,121 @@
+import asyncio
+import struct
+
+import pytest
+
+pytest.importorskip('dotenv')
+
+from utils import probe
+from utils.probe import probe_video, read_header_metadata
+
+
+# --- MP4 ---
+
+def box(kind, payload):
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def mvhd(timescale, duration):
+    return box(b'mvhd', struct.pack('>IIIII', 0, 0, 0, timescale, duration) + bytes(80))
+
+
+def tkhd(width, height, rotated=False):
+    matrix = (0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000) if rotated else (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    head = bytes(4 * 5 + 8 + 8)
+    return box(b'tkhd', head + struct.pack('>9i', *matrix) + struct.pack('>II', width << 16, height << 16))
+
+
+def trak(handler, width, height, rotated=False):
+    hdlr = box(b'hdlr', bytes(8) + handler + bytes(12))
+    return box(b'trak', tkhd(width, height, rotated) + box(b'mdia', hdlr))
+
+
+def mp4(*traks, moov_first=True, timescale=1000, duration=93_500):
+    moov = box(b'moov', mvhd(timescale, duration) + b''.join(traks))
+    mdat = box(b'mdat', bytes(4096))
+    ftyp = box(b'ftyp', b'isom' + bytes(4))
+    return ftyp + (moov + mdat if moov_first else mdat + moov)
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_mp4_video_track(tmp_path):
+    path = write(tmp_path, 'a.mp4', mp4(trak(b'soun', 0, 0), trak(b'vide', 1280, 720)))
+    assert read_header_metadata(path) == {'width': 1280, 'height': 720, 'duration': 94}
+
+
+def test_mp4_moov_at_end_and_rotation(tmp_path):
+    path = write(tmp_path, 'b.mp4', mp4(trak(b'vide', 1920, 1080, rotated=True), moov_first=False, timescale=90000, duration=90000 * 12))
+    assert read_header_metadata(path) == {'width': 1080, 'height': 1920, 'duration': 12}
+
+
+def test_mp4_without_moov(tmp_path):
+    path = write(tmp_path, 'c.mp4', box(b'ftyp', b'isom' + bytes(4)) + box(b'mdat', bytes(64)))
+    assert read_header_metadata(path) is None
+
+
+# --- Matroska ---
+
+def element(element_id, payload):
+    return element_id + b'\x01' + len(payload).to_bytes(7, 'big') + payload
+
+
+def uint(element_id, value, size=4):
+    return element(element_id, value.to_bytes(size, 'big'))
+
+
+SEGMENT = probe.SEGMENT.to_bytes(4, 'big')
+INFO = probe.INFO.to_bytes(4, 'big')
+TRACKS = probe.TRACKS.to_bytes(4, 'big')
+CLUSTER = probe.CLUSTER.to_bytes(4, 'big')
+
+
+def info(seconds):
+    return element(INFO, uint(b'\x2A\xD7\xB1', 1_000_000) + element(b'\x44\x89', struct.pack('>d', seconds * 1000)))
+
+
+def tracks(width, height):
+    audio = element(b'\xAE', uint(b'\x83', 2, 1))
+    video = element(b'\xAE', uint(b'\x83', 1, 1) + element(b'\xE0', uint(b'\xB0', width, 2) + uint(b'\xBA', height, 2)))
+    return element(TRACKS, audio + video)
+
+
+def mkv(body):
+    header = element(probe.EBML_HEADER.to_bytes(4, 'big'), uint(b'\x42\x86', 1, 1))
+    return header + element(SEGMENT, body)
+
+
+def test_mkv_info_and_tracks(tmp_path):
+    path = write(tmp_path, 'a.mkv', mkv(info(61.4) + tracks(854, 480) + element(CLUSTER, bytes(256))))
+    assert read_header_metadata(path) == {'width': 854, 'height': 480, 'duration': 61}
+
+
+def test_mkv_tracks_after_clusters_via_seek_head(tmp_path):
+    head_info = info(5)
+    cluster = element(CLUSTER, bytes(256))
+    # SeekHead sizes are fixed, so the Tracks position can be computed before it is built
+    seek_head_size = len(element(b'\x11\x4D\x9B\x74', element(b'\x4D\xBB', element(b'\x53\xAB', TRACKS) + uint(b'\x53\xAC', 0, 8))))
+    position = seek_head_size + len(head_info) + len(cluster)
+    seek = element(b'\x4D\xBB', element(b'\x53\xAB', TRACKS) + uint(b'\x53\xAC', position, 8))
+    seek_head = element(b'\x11\x4D\x9B\x74', seek)
+    assert len(seek_head) == seek_head_size
+    path = write(tmp_path, 'b.mkv', mkv(seek_head + head_info + cluster + tracks(3840, 2160)))
+    assert read_header_metadata(path) == {'width': 3840, 'height': 2160, 'duration': 5}
+
+
+def test_unknown_format(tmp_path):
+    path = write(tmp_path, 'a.avi', b'RIFF' + bytes(64))
+    assert read_header_metadata(path) is None
+
+
+def test_probe_video_uses_headers(tmp_path, monkeypatch):
+    async def no_ffprobe(path):
+        raise AssertionError('ffprobe should not run when the headers are complete')
+
+    monkeypatch.setattr(probe, 'ffprobe_metadata', no_ffprobe)
+    path = write(tmp_path, 'a.mp4', mp4(trak(b'vide', 640, 360)))
+    assert asyncio.run(probe_video(path)) == {'width': 640, 'height': 360, 'duration': 94}
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+pyrogram_errors = pytest.importorskip('pyrogram.errors')
+
+from utils import ratelimit
+from utils.ratelimit import RateLimiter, TokenBucket
+
+
+class FakeClient:
+    name = 'bot'
+
+
+BOT = FakeClient()
+
+
+def flood_wait(seconds):
+    error = pyrogram_errors.FloodWait.__new__(pyrogram_errors.FloodWait)
+    error.value = seconds
+    return error
+
+
+def test_bucket_speeds_up_additively_and_halves_on_flood():
+    bucket = TokenBucket(2.0, 0.5, 10.0)
+    bucket.on_success()
+    bucket.on_success()
+    assert bucket.rate == pytest.approx(3.0)
+    bucket.on_flood(0)
+    assert bucket.rate == pytest.approx(1.5)
+    for _ in range(5):
+        bucket.on_flood(0)
+    assert bucket.rate == 0.5
+    for _ in range(1000):
+        bucket.on_success()
+    assert bucket.rate == 10.0
+
+
+def test_flood_blocks_the_bucket():
+    bucket = TokenBucket(100.0, 1.0, 100.0, burst=5)
+    assert bucket.try_acquire()
+    bucket.on_flood(30)
+    assert bucket.tokens == 0
+    assert bucket.delay() > 29
+    assert not bucket.try_acquire()
+
+
+def test_allow_takes_tokens_from_client_and_chat_buckets():
+    limiter = RateLimiter()
+    assert limiter.allow(BOT, 'send', 1)
+    assert ('bot', 'send') in limiter.buckets and ('bot', 'send', '1') in limiter.buckets
+    # The per-chat bucket holds a single token at 0.5/s, another chat is unaffected
+    assert not limiter.allow(BOT, 'send', 1)
+    assert limiter.allow(BOT, 'send', 2)
+
+
+def test_call_retries_after_flood_wait():
+    limiter = RateLimiter()
+    calls = []
+
+    async def fn():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise flood_wait(0)
+        return 'ok'
+
+    assert asyncio.run(limiter.call(BOT, 'get_messages', None, fn)) == 'ok'
+    assert len(calls) == 2
+    bucket = limiter.buckets[('bot', 'get_messages')]
+    assert bucket.rate == pytest.approx(1.5 + 10.0 * 0.05)
+
+
+def test_call_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'MAX_FLOOD_RETRIES', 1)
+    limiter = RateLimiter()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        raise flood_wait(0)
+
+    with pytest.raises(pyrogram_errors.FloodWait):
+        asyncio.run(limiter.call(BOT, 'get_messages', None, fn))
+    assert len(calls) == 2
+    with pytest.raises(pyrogram_errors.FloodWait):
+        asyncio.run(limiter.call(BOT, 'get_messages', None, fn, retry=False))
+    assert len(calls) == 3
+
+
+def test_sweep_drops_idle_buckets():
+    limiter = RateLimiter()
+    limiter.allow(BOT, 'send', 1)
+    limiter.allow(BOT, 'send', 2)
+    idle = limiter.buckets[('bot', 'send', '1')]
+    idle.updated -= ratelimit.BUCKET_IDLE_TTL + 1
+    limiter.swept -= ratelimit.SWEEP_INTERVAL + 1
+    limiter.allow(BOT, 'edit_message_text', 3)
+    assert ('bot', 'send', '1') not in limiter.buckets
+    assert ('bot', 'send', '2') in limiter.buckets
+
+
+def test_sweep_keeps_blocked_buckets():
+    limiter = RateLimiter()
+    limiter.flood(BOT, 'send', 1, ratelimit.BUCKET_IDLE_TTL * 2)
+    bucket = limiter.buckets[('bot', 'send', '1')]
+    bucket.updated -= ratelimit.BUCKET_IDLE_TTL + 1
+    limiter.swept -= ratelimit.SWEEP_INTERVAL + 1
+    limiter.allow(BOT, 'edit_message_text', 3)
+    assert limiter.buckets[('bot', 'send', '1')] is bucket
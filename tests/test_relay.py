@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('pyrogram')
+
+from pyrogram import Client
+from utils.relay import PartResendError, RelayFile, UploadSource, install_save_file_hook
+
+
+class RecordingSource(UploadSource):
+    name = 'recorded.bin'
+
+    def __init__(self):
+        self.calls = []
+
+    async def save(self, client, progress=None, progress_args=()):
+        self.calls.append(('save',))
+        return 'input-file'
+
+    async def save_part(self, client, file_id, file_part):
+        self.calls.append(('part', file_id, file_part))
+        return 'input-file'
+
+
+def test_hook_routes_full_upload_to_save():
+    install_save_file_hook()
+    source = RecordingSource()
+    assert asyncio.run(Client.save_file(None, source)) == 'input-file'
+    assert source.calls == [('save',)]
+
+
+def test_hook_routes_missing_part_to_save_part():
+    install_save_file_hook()
+    source = RecordingSource()
+    asyncio.run(Client.save_file(None, source, file_id=42, file_part=3))
+    assert source.calls == [('part', 42, 3)]
+
+
+def test_relay_file_cannot_resend_a_part():
+    install_save_file_hook()
+    relay = RelayFile(None, None, 'video.mp4', 1024)
+    with pytest.raises(PartResendError):
+        asyncio.run(Client.save_file(None, relay, file_id=42, file_part=0))
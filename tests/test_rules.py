@@ -0,0 +1,67 @@
+import random
+
+from utils.rules import compile_rules
+
+
+def replace_text(text, delete_words, replacements):
+    """The original caption rules: one str.replace per rule in order, then drop delete words."""
+    for word, replacement in replacements.items():
+        text = text.replace(word, replacement)
+    if delete_words:
+        text = " ".join(w for w in text.split() if w not in delete_words)
+    return text
+
+
+def replace_name(name, delete_words, replacements):
+    """The original file name rules: delete words anywhere, then replace words."""
+    for word in delete_words:
+        name = name.replace(word, "")
+    for word, replacement in replacements.items():
+        name = name.replace(word, replacement)
+    return name
+
+
+def test_independent_rules_compile_to_one_stage():
+    rules = compile_rules([], {'@old': '@new', 'spam': 'ham'})
+    assert len(rules.text_stages) == 1
+    assert rules.apply_text('@old says spam') == '@new says ham'
+
+
+def test_rule_order_is_kept_when_rules_interact():
+    replacements = {'a': 'b', 'b': 'c'}
+    rules = compile_rules([], replacements)
+    assert rules.apply_text('ab') == 'cc' == replace_text('ab', [], replacements)
+    replacements = {'b': 'c', 'a': 'b'}
+    assert compile_rules([], replacements).apply_text('ab') == 'bc' == replace_text('ab', [], replacements)
+
+
+def test_shorter_word_before_longer_word():
+    replacements = {'a': 'x', 'ab': 'y'}
+    assert compile_rules([], replacements).apply_text('ab') == 'xb'
+
+
+def test_delete_words():
+    rules = compile_rules(['promo'], {'@old': '@new'})
+    assert rules.apply_text('join @old promo now') == 'join @new now'
+    assert rules.apply_name('file promo @old') == 'file  @new'
+
+
+def test_delete_word_joining_text_into_a_later_word():
+    assert compile_rules(['b', 'ac'], {}).apply_name('abc') == ''
+    assert compile_rules(['b'], {'ac': 'x'}).apply_name('abc') == 'x'
+
+
+def test_matches_sequential_replace_on_random_rules():
+    rng = random.Random(1234)
+    alphabet = 'ab c'
+
+    def word(low, high):
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+    for _ in range(20000):
+        delete_words = [word(1, 4) for _ in range(rng.randint(0, 3))]
+        replacements = {word(1, 4): word(0, 3) for _ in range(rng.randint(0, 4))}
+        text = word(0, 15)
+        rules = compile_rules(delete_words, replacements)
+        assert rules.apply_text(text) == replace_text(text, delete_words, replacements), (text, delete_words, replacements)
+        assert rules.apply_name(text) == replace_name(text, delete_words, replacements), (text, delete_words, replacements)
@@ -0,0 +1,85 @@
+import asyncio
+
+from utils.scheduler import BatchScheduler, Job
+
+
+def make_job(started, user_id, premium=False, name=''):
+    async def run():
+        started.append(name)
+        await asyncio.sleep(0)
+    return Job(user_id, run, premium=premium, name=name)
+
+
+def test_users_are_served_round_robin_premium_first():
+    async def main():
+        started = []
+        scheduler = BatchScheduler(max_concurrent=1)
+        blocker = asyncio.Event()
+
+        async def block():
+            await blocker.wait()
+
+        scheduler.submit(Job(0, block, name='blocker'))
+        jobs = [make_job(started, 1, name='a1'), make_job(started, 1, name='a2'), make_job(started, 1, name='a3'),
+                make_job(started, 2, name='b1'), make_job(started, 3, premium=True, name='p1'),
+                make_job(started, 2, name='b2'), make_job(started, 3, premium=True, name='p2')]
+        for job in jobs:
+            scheduler.submit(job)
+        expected = ['p1', 'p2', 'a1', 'b1', 'a2', 'b2', 'a3']
+        assert [j.name for j in scheduler._waiting_order()] == expected
+        assert scheduler.position(jobs[4]) == 1 and scheduler.position(jobs[2]) == 7
+        blocker.set()
+        while scheduler.running or scheduler.queued_count():
+            await asyncio.sleep(0.001)
+        return started, expected
+
+    started, expected = asyncio.run(main())
+    assert started == expected
+
+
+def test_concurrency_cap_and_queue_positions():
+    async def main():
+        release = asyncio.Event()
+        positions = {}
+
+        async def run():
+            await release.wait()
+
+        def on_position(name):
+            async def update(position):
+                positions[name] = position
+            return update
+
+        scheduler = BatchScheduler(max_concurrent=2)
+        jobs = [scheduler.submit(Job(i, run, on_position=on_position(i), name=str(i))) for i in range(4)]
+        await asyncio.sleep(0.01)
+        assert len(scheduler.running) == 2
+        assert positions == {2: 1, 3: 2}
+        assert scheduler.cancel_queued(3) and not scheduler.is_queued(3)
+        release.set()
+        await asyncio.gather(*(job.task for job in jobs[:2]))
+        await asyncio.sleep(0.01)
+        assert jobs[2].task.done() and jobs[3].task is None
+        assert not scheduler.running and scheduler.queued_count() == 0
+
+    asyncio.run(main())
+
+
+def test_drain_cancels_running_and_returns_waiting():
+    async def main():
+        async def forever():
+            await asyncio.Event().wait()
+
+        scheduler = BatchScheduler(max_concurrent=1)
+        running = scheduler.submit(Job(1, forever))
+        waiting = scheduler.submit(Job(2, forever))
+        await asyncio.sleep(0)
+        assert await scheduler.drain(timeout=0.01) == [waiting]
+        assert running.task.done() and waiting.task is None
+        try:
+            scheduler.submit(Job(3, forever))
+        except RuntimeError:
+            return True
+        return False
+
+    assert asyncio.run(main())
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('motor')
+pytest.importorskip('dotenv')
+
+from utils import func
+from utils.func import SettingsCache
+
+
+class FakeUsers:
+    def __init__(self):
+        self.queries = 0
+        self.release = asyncio.Event()
+
+    async def find_one(self, query):
+        self.queries += 1
+        await self.release.wait()
+        return {'_id': 'doc', 'user_id': query['user_id'], 'caption': 'hi'}
+
+
+def test_concurrent_misses_share_one_query(monkeypatch):
+    async def main():
+        users = FakeUsers()
+        monkeypatch.setattr(func, 'users_collection', users)
+        cache = SettingsCache(max_users=10, ttl=60)
+        waiters = [asyncio.ensure_future(cache.get(5)) for _ in range(3)]
+        await asyncio.sleep(0)
+        users.release.set()
+        docs = await asyncio.gather(*waiters)
+        assert users.queries == 1
+        assert docs[0] == docs[1] and docs[0] is not docs[1] # Every caller gets its own copy
+        assert await cache.get('5') == docs[0] and users.queries == 1
+        assert not cache.loading
+
+    asyncio.run(main())
+
+
+def test_load_is_cleared_when_every_waiter_was_cancelled(monkeypatch):
+    async def main():
+        users = FakeUsers()
+        monkeypatch.setattr(func, 'users_collection', users)
+        cache = SettingsCache(max_users=10, ttl=60)
+        waiter = asyncio.ensure_future(cache.get(5))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        assert 5 in cache.loading # The shared load keeps running for later callers
+        users.release.set()
+        await asyncio.sleep(0.01)
+        assert not cache.loading
+        assert (await cache.get(5))['caption'] == 'hi' and users.queries == 1
+
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+import asyncio
+import io
+import itertools
+
+import pytest
+
+pytest.importorskip('PIL')
+pytest.importorskip('aiohttp')
+pytest.importorskip('dotenv')
+
+from PIL import Image
+
+from utils.thumb_store import ThumbStore
+
+
+class GridOut:
+    def __init__(self, file_id, data, metadata):
+        self._id = file_id
+        self.data = data
+        self.metadata = metadata
+
+    async def read(self):
+        return self.data
+
+
+class FakeBucket:
+    """In-memory stand-in for the GridFS calls ThumbStore makes; files are listed oldest first."""
+
+    def __init__(self):
+        self.files = []
+        self.ids = itertools.count()
+
+    async def upload_from_stream(self, name, data, metadata=None):
+        self.files.append(GridOut(next(self.ids), data, metadata))
+
+    def _match(self, query):
+        def matches(f):
+            if f.metadata['user_id'] != query['metadata.user_id']:
+                return False
+            version = query.get('metadata.version')
+            if isinstance(version, dict):
+                return f.metadata['version'] != version['$ne']
+            return version is None or f.metadata['version'] == version
+        return [f for f in self.files if matches(f)]
+
+    async def find(self, query, sort=None, limit=0):
+        files = self._match(query)
+        if sort: # Only ever sorted by uploadDate, newest first
+            files = files[::-1]
+        for f in files[:limit or None]:
+            yield f
+
+    async def delete(self, file_id):
+        self.files = [f for f in self.files if f._id != file_id]
+
+
+def png(color):
+    out = io.BytesIO()
+    Image.new('RGB', (640, 480), color).save(out, 'PNG')
+    return out.getvalue()
+
+
+def test_put_replaces_older_versions():
+    bucket = FakeBucket()
+    store = ThumbStore(bucket, max_entries=10)
+
+    async def main():
+        first = await store.put(1, png('red'))
+        second = await store.put(1, png('blue'))
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first != second
+    assert [f.metadata['version'] for f in bucket.files] == [second]
+    assert bucket.files[0].data.startswith(b'\xff\xd8') # Stored as JPEG
+
+
+def test_stale_version_falls_back_to_the_newest_one():
+    bucket = FakeBucket()
+    writer, replica = ThumbStore(bucket, max_entries=10), ThumbStore(bucket, max_entries=10)
+
+    async def main():
+        old = await writer.put(1, png('red'))
+        new = await writer.put(1, png('blue'))
+        # The replica's settings still name the old version
+        return await replica.get(1, old), await replica.get(1, new), await replica.get(2, old)
+
+    stale, current, other_user = asyncio.run(main())
+    assert stale == current == bucket.files[0].data
+    assert other_user is None
+
+
+def test_removed_thumbnail_is_gone_everywhere():
+    bucket = FakeBucket()
+    writer, replica = ThumbStore(bucket, max_entries=10), ThumbStore(bucket, max_entries=10)
+
+    async def main():
+        version = await writer.put(1, png('red'))
+        await writer.remove(1)
+        return await replica.get(1, version)
+
+    assert asyncio.run(main()) is None
+    assert bucket.files == []
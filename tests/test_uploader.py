@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('pyrogram')
+
+from utils.relay import PART_SIZE, PartResendError
+from utils.uploader import ParallelUpload, split_file
+
+
+def test_split_file_views_cover_the_file(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'0' * (PART_SIZE * 7 + 5))
+    parts = split_file(str(path), part_size=3 * PART_SIZE)
+    assert [(p.offset, p.size) for p in parts] == [(0, 3 * PART_SIZE), (3 * PART_SIZE, 3 * PART_SIZE), (6 * PART_SIZE, PART_SIZE + 5)]
+    assert [p.name for p in parts] == ['video.part000.mp4', 'video.part001.mp4', 'video.part002.mp4']
+
+
+def test_save_part_rejects_unknown_upload(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'0' * 16)
+    upload = ParallelUpload(str(path))
+    with pytest.raises(PartResendError):
+        asyncio.run(upload.save_part(None, 42, 0))
+
+
+def test_parts_are_read_from_the_view(tmp_path):
+    path = tmp_path / 'video.mp4'
+    data = bytes(range(256)) * (PART_SIZE // 64)
+    path.write_bytes(data)
+    upload = ParallelUpload(str(path), offset=PART_SIZE + 7, length=PART_SIZE + 100)
+    assert upload.total_parts == 2
+    assert upload._read_part(0) == data[PART_SIZE + 7:2 * PART_SIZE + 7]
+    assert upload._read_part(1) == data[2 * PART_SIZE + 7:2 * PART_SIZE + 107]
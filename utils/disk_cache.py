@@ -0,0 +1,144 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import os
+import re
+import shutil
+from collections import OrderedDict
+from typing import Any, Optional
+from config import DISK_CACHE_DIR, DISK_CACHE_MB
+
+logger = logging.getLogger(__name__)
+
+SAFE_KEY = re.compile(r'^[A-Za-z0-9_-]+$') # file_unique_id is URL-safe base64
+
+
+async def link_or_copy(src: str, dst: str):
+    """
+    Hard-links src to the new path dst, copying in a worker thread when the filesystem does not
+    support links. Raises FileExistsError if dst already exists.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+    os.close(os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL)) # Claims dst before the (slow) copy
+    try:
+        await asyncio.to_thread(shutil.copy2, src, dst)
+    except BaseException:
+        os.remove(dst)
+        raise
+
+
+class DiskCache:
+    """
+    Content-addressed cache of downloaded media: one file per source file_unique_id, evicted in LRU
+    order once the byte budget is exceeded. Callers never work on the cached file itself but on a
+    hard link to it, so evicting an entry never breaks a transfer in progress.
+    The index is rebuilt from the directory on start; access times are kept in the files' mtime.
+    """
+
+    def __init__(self, directory: str, budget_bytes: int):
+        self.directory = os.path.abspath(directory)
+        self.budget = budget_bytes
+        self.index: "OrderedDict[str, int]" = OrderedDict() # {key: size}, least recently used first
+        self.total = 0
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            self.scan()
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def scan(self):
+        """Rebuilds the index from the files on disk, oldest access first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if not SAFE_KEY.match(name) or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name, stat.st_size))
+        self.index.clear()
+        self.total = 0
+        for _, name, size in sorted(entries):
+            self.index[name] = size
+            self.total += size
+        self._evict()
+        logger.info(f"Disk cache: {len(self.index)} files, {self.total / (1024 * 1024):.1f} MB in {self.directory}")
+
+    def owns(self, path: Any) -> bool:
+        """True if path is a file inside the cache directory (which must never be moved or deleted by callers)."""
+        if not path or not isinstance(path, (str, os.PathLike)):
+            return False # In-memory files (RelayFile, BytesIO thumbnails) are never cached
+        return os.path.dirname(os.path.abspath(path)) == self.directory
+
+    def _evict(self):
+        while self.total > self.budget and self.index:
+            key, size = self.index.popitem(last=False)
+            self.total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError as e:
+                logger.warning(f"Could not evict {key} from the disk cache: {e}")
+
+    def _forget(self, key: str):
+        self.total -= self.index.pop(key, 0)
+
+    async def fetch(self, key: str, dest: str) -> Optional[str]:
+        """
+        On a hit, hard-links the cached file to a new path and returns it; None on a miss. The path is
+        dest, or dest with a _N suffix when another item already uses that name.
+        """
+        if not self.enabled or not key or key not in self.index:
+            return None
+        path = self._path(key)
+        base, ext = os.path.splitext(dest)
+        count = 0
+        try:
+            os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+            while True:
+                target = f"{base}_{count}{ext}" if count else dest
+                try:
+                    await link_or_copy(path, target)
+                    break
+                except FileExistsError:
+                    count += 1
+            os.utime(path) # Persist the LRU position across restarts
+        except OSError as e:
+            logger.warning(f"Disk cache entry {key} is unusable: {e}")
+            self._forget(key)
+            return None
+        self.index.move_to_end(key)
+        return target
+
+    async def store(self, key: str, path: str):
+        """Adds a freshly downloaded file under key; the caller keeps using path, which stays a separate link."""
+        if not self.enabled or not key or not SAFE_KEY.match(key) or key in self.index:
+            return
+        try:
+            size = os.path.getsize(path)
+            if size > self.budget:
+                return # Would evict everything else and itself
+            await link_or_copy(path, self._path(key))
+        except FileExistsError:
+            return # Stored concurrently by another item
+        except OSError as e:
+            logger.warning(f"Could not add {path} to the disk cache: {e}")
+            return
+        self.index[key] = size
+        self.total += size
+        self._evict()
+
+
+disk_cache = DiskCache(DISK_CACHE_DIR, DISK_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,213 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import inspect
+import logging
+import mimetypes
+import os
+import sys
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pyrogram import Client, raw
+from pyrogram.file_id import FileId, FileType
+from pyrogram.session import Auth, Session
+from pyrogram.types import Message
+from config import PARALLEL_DOWNLOAD_CONNECTIONS, PARALLEL_DOWNLOAD_MIN_MB
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024 # upload.GetFile limit; offsets must be multiples of it
+DOWNLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "downloads") # Same default as Pyrogram
+DOCUMENT_MEDIA = ("document", "video", "audio", "voice", "animation", "video_note") # Media served as documents
+
+
+class MediaSessionPool:
+    """
+    Keeps started media-DC sessions per (client, dc) for reuse across downloads.
+    The authorization is exported and imported once per DC; every further session reuses the key.
+    """
+
+    def __init__(self, max_idle: int = 8):
+        self.max_idle = max_idle
+        self._idle: Dict[Tuple[int, int], List[Session]] = {}
+        self._auth_keys: Dict[Tuple[int, int], bytes] = {}
+        self._locks: Dict[Tuple[int, int], asyncio.Lock] = {}
+
+    async def _start(self, client: Client, dc_id: int, auth_key: bytes) -> Session:
+        session = Session(client, dc_id, auth_key, await client.storage.test_mode(), is_media=True)
+        await session.start()
+        return session
+
+    async def acquire(self, client: Client, dc_id: int) -> Session:
+        key = (id(client), dc_id)
+        idle = self._idle.get(key)
+        if idle:
+            return idle.pop()
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            if key not in self._auth_keys:
+                if dc_id == await client.storage.dc_id():
+                    self._auth_keys[key] = await client.storage.auth_key()
+                else:
+                    # First connection to a foreign DC: new key, then carry the login over to it
+                    auth_key = await Auth(client, dc_id, await client.storage.test_mode()).create()
+                    session = await self._start(client, dc_id, auth_key)
+                    try:
+                        exported = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                        await session.invoke(raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes))
+                    except Exception:
+                        await session.stop()
+                        raise
+                    self._auth_keys[key] = auth_key
+                    return session
+        return await self._start(client, dc_id, self._auth_keys[key])
+
+    async def release(self, client: Client, dc_id: int, session: Session, broken: bool = False):
+        idle = self._idle.setdefault((id(client), dc_id), [])
+        if broken or len(idle) >= self.max_idle:
+            await session.stop()
+        else:
+            idle.append(session)
+
+    async def close(self):
+        for sessions in self._idle.values():
+            for session in sessions:
+                try:
+                    await session.stop()
+                except Exception:
+                    pass
+        self._idle.clear()
+
+
+session_pool = MediaSessionPool(max_idle=max(8, PARALLEL_DOWNLOAD_CONNECTIONS * 2))
+
+
+def get_media(message: Message) -> Optional[Any]:
+    """The document-type media object of a message (video, audio, ...), None for photos, stickers and text."""
+    media_type = getattr(message.media, "value", None) if message.media else None
+    if media_type not in DOCUMENT_MEDIA:
+        return None
+    return getattr(message, media_type, None)
+
+
+def media_file_name(message: Message, media: Any) -> str:
+    """The media's own file name, or a generated one with an extension guessed from the MIME type."""
+    name = getattr(media, "file_name", None)
+    if not name:
+        ext = mimetypes.guess_extension(getattr(media, "mime_type", None) or "") or ""
+        name = f"{message.media.value}_{message.id}{ext}"
+    return name
+
+
+def target_path(message: Message, media: Any, file_name: Optional[str]) -> str:
+    """Mirrors download_media's naming: a directory (trailing slash) or full path, defaulting to downloads/<name>."""
+    directory, name = os.path.split(file_name or "")
+    name = name or media_file_name(message, media)
+    if not directory:
+        directory = DOWNLOAD_DIR
+    elif not os.path.isabs(directory):
+        directory = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), directory)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+async def report_progress(progress: Optional[Callable], current: int, total: int, progress_args: tuple):
+    """Calls a Pyrogram-style progress callback, awaiting it if it is a coroutine."""
+    if not progress:
+        return
+    try:
+        result = progress(current, total, *progress_args)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.warning(f"Progress callback failed: {e}")
+
+
+async def _parallel_download(client: Client, file_id: FileId, size: int, path: str, connections: int, progress: Optional[Callable], progress_args: tuple) -> str:
+    location = raw.types.InputDocumentFileLocation(
+        id=file_id.media_id,
+        access_hash=file_id.access_hash,
+        file_reference=file_id.file_reference,
+        thumb_size=""
+    )
+    chunks = asyncio.Queue()
+    for index in range((size + CHUNK_SIZE - 1) // CHUNK_SIZE):
+        chunks.put_nowait(index)
+    done = 0
+    temp_path = f"{path}.temp"
+
+    # Preallocate so every range can be written at its own offset
+    fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+
+        async def worker():
+            nonlocal done
+            session = await session_pool.acquire(client, file_id.dc_id)
+            broken = False
+            try:
+                while True:
+                    try:
+                        index = chunks.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    r = await session.invoke(raw.functions.upload.GetFile(location=location, offset=index * CHUNK_SIZE, limit=CHUNK_SIZE))
+                    if not isinstance(r, raw.types.upload.File):
+                        raise RuntimeError(f"Unsupported GetFile response {type(r).__name__}") # e.g. CDN redirect
+                    # Inline write: 1 MiB into the page cache is cheap, and a cancelled thread could outlive the fd
+                    os.pwrite(fd, r.bytes, index * CHUNK_SIZE)
+                    done += len(r.bytes)
+                    await report_progress(progress, min(done, size), size, progress_args)
+            except BaseException:
+                broken = True
+                raise
+            finally:
+                await session_pool.release(client, file_id.dc_id, session, broken=broken)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(connections)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        if done < size:
+            raise RuntimeError(f"Incomplete download: {done}/{size} bytes")
+    except BaseException:
+        os.close(fd)
+        fd = None
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        if fd is not None:
+            os.close(fd)
+    os.replace(temp_path, path)
+    return path
+
+
+async def download_media(client: Client, message: Message, file_name: Optional[str] = None, progress: Optional[Callable] = None, progress_args: tuple = (), connections: int = PARALLEL_DOWNLOAD_CONNECTIONS) -> Optional[str]:
+    """
+    Drop-in for client.download_media(message, ...): large documents are fetched as 1 MiB ranges over
+    several media-DC connections and written at their offsets into a preallocated file. Small files,
+    photos, or any failure of the parallel path fall back to Pyrogram's sequential download.
+    progress(current, total, *progress_args) is called as in Pyrogram.
+    """
+    media = get_media(message)
+    size = getattr(media, "file_size", 0) or 0
+    if media is None or connections < 2 or size < PARALLEL_DOWNLOAD_MIN_MB * 1024 * 1024 or not hasattr(os, "pwrite"):
+        return await client.download_media(message, file_name=file_name or "downloads/", progress=progress, progress_args=progress_args)
+    try:
+        file_id = FileId.decode(media.file_id)
+        if file_id.file_type == FileType.PHOTO:
+            raise ValueError("photos are not served as documents")
+        path = target_path(message, media, file_name)
+        return await _parallel_download(client, file_id, size, path, connections, progress, progress_args)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Parallel download of message {message.id} failed, falling back to sequential: {e}")
+        return await client.download_media(message, file_name=file_name or "downloads/", progress=progress, progress_args=progress_args)
@@ -2,16 +2,22 @@
 # Licensed under the GNU General Public License v3.0.  
 # See LICENSE file in the repository root for full license text.
 
-import concurrent.futures
 import time
+import io
 import os
 import re
-import cv2
 import logging
 import asyncio
+import copy
+import functools
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGO_DB as MONGO_URI, DB_NAME
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from utils.rules import compile_rules
+from utils.probe import probe_video
+from utils.thumbs import thumbnailer, as_upload
+from utils.thumb_store import ThumbStore
+from config import MONGO_DB as MONGO_URI, DB_NAME, SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL, SETTINGS_CHANGE_STREAM, THUMB_CACHE_ENTRIES
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,6 +32,7 @@ users_collection = db["users"]
 premium_users_collection = db["premium_users"]
 statistics_collection = db["statistics"]
 codedb = db["redeem_code"]
+thumb_store = ThumbStore(AsyncIOMotorGridFSBucket(db, bucket_name="thumbnails"), THUMB_CACHE_ENTRIES)
 
 # ------- < start > Session Encoder don't change -------
 
@@ -48,8 +55,11 @@ def is_private_link(link):
     return bool(PRIVATE_LINK_PATTERN.match(link))
 
 
-def thumbnail(sender):
-    return f'{sender}.jpg' if os.path.exists(f'{sender}.jpg') else None
+async def thumbnail(sender):
+    """The user's custom thumbnail as an in-memory JPEG, or None."""
+    version = await thumbnail_version(sender)
+    data = await thumb_store.get(int(sender), version) if version else None
+    return as_upload(data) if data else None
 
 
 def hhmmss(seconds):
@@ -101,25 +111,146 @@ async def is_private_chat(event):
     return event.is_private
 
 
+class SettingsCache:
+    """
+    In-process copy of user documents, so the handful of settings read for every processed message
+    cost one find_one per user per TTL instead of one per key. Bounded in size (LRU). Writes made
+    through this module update the cached document; other writers must call invalidate().
+    Callers always get copies, so mutating a returned value never leaks into the cache.
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.entries: "OrderedDict[int, tuple]" = OrderedDict() # {user_id: (expiry, document or None)}
+        self.doc_ids = {} # {document _id: user_id}, for change stream events that only carry the _id
+        self.loading = {} # {user_id: Future} so concurrent misses share one query
+        self.dirty = set() # Users written to while their document was being loaded
+        self.counters = {"hits": 0, "misses": 0, "queries": 0, "invalidations": 0, "messages": 0}
+        self.watch_task = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_users > 0 and self.ttl > 0
+
+    def _store(self, user_id: int, doc):
+        if not self.enabled:
+            return
+        self.entries[user_id] = (time.monotonic() + self.ttl, doc)
+        self.entries.move_to_end(user_id)
+        if doc and "_id" in doc:
+            self.doc_ids[doc["_id"]] = user_id
+        while len(self.entries) > self.max_users:
+            _, (_, old) = self.entries.popitem(last=False)
+            if old:
+                self.doc_ids.pop(old.get("_id"), None)
+
+    async def get(self, user_id):
+        """Returns a copy of the user's document (None if there is none)."""
+        user_id = int(user_id)
+        entry = self.entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            self.counters["hits"] += 1
+            self.entries.move_to_end(user_id)
+            return copy.deepcopy(entry[1])
+        self.counters["misses"] += 1
+        pending = self.loading.get(user_id)
+        if pending is None:
+            pending = self.loading[user_id] = asyncio.ensure_future(self._load(user_id))
+            # Cleared when the load finishes, even if every waiter was cancelled before that
+            pending.add_done_callback(functools.partial(self._loaded, user_id))
+        return copy.deepcopy(await asyncio.shield(pending))
+
+    def _loaded(self, user_id: int, future: asyncio.Future):
+        if self.loading.get(user_id) is future:
+            del self.loading[user_id]
+        if not future.cancelled():
+            future.exception() # Retrieved here so a failure nobody awaited is not reported as never retrieved
+
+    async def _load(self, user_id: int):
+        self.counters["queries"] += 1
+        self.dirty.discard(user_id)
+        doc = await users_collection.find_one({"user_id": user_id})
+        if user_id not in self.dirty: # Otherwise the document may predate the write; the next read reloads it
+            self._store(user_id, doc)
+        return doc
+
+    def update(self, user_id, fields=None, unset=()):
+        """Applies a write that already succeeded in Mongo to the cached document, if it is cached."""
+        user_id = int(user_id)
+        if user_id in self.loading:
+            self.dirty.add(user_id)
+        entry = self.entries.get(user_id)
+        if not entry:
+            return
+        doc = dict(entry[1] or {"user_id": user_id})
+        doc.update(copy.deepcopy(fields or {}))
+        for key in unset:
+            doc.pop(key, None)
+        self.entries[user_id] = (entry[0], doc)
+
+    def invalidate(self, user_id):
+        user_id = int(user_id)
+        if user_id in self.loading:
+            self.dirty.add(user_id)
+        entry = self.entries.pop(user_id, None)
+        if entry:
+            self.counters["invalidations"] += 1
+            if entry[1]:
+                self.doc_ids.pop(entry[1].get("_id"), None)
+
+    def count_message(self):
+        self.counters["messages"] += 1
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"]
+        messages = self.counters["messages"]
+        return {
+            **self.counters,
+            "entries": len(self.entries),
+            "hit_rate": (self.counters["hits"] / lookups * 100) if lookups else 0.0,
+            "queries_per_message": (self.counters["queries"] / messages) if messages else 0.0,
+        }
+
+    def start_watch(self):
+        """Invalidates entries on writes made by other processes (needs a replica set)."""
+        if SETTINGS_CHANGE_STREAM and self.enabled and not self.watch_task:
+            self.watch_task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        try:
+            async with users_collection.watch() as stream:
+                logger.info("Watching the users collection for settings changes")
+                async for change in stream:
+                    user_id = self.doc_ids.get(change.get("documentKey", {}).get("_id"))
+                    if user_id is not None:
+                        self.invalidate(user_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Settings change stream stopped, relying on the TTL only: {e}")
+
+
+settings_cache = SettingsCache(SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL)
+
+
 async def save_user_data(user_id, key, value):
     await users_collection.update_one(
         {"user_id": user_id},
         {"$set": {key: value}},
         upsert=True
     )
-    print(users_collection)
+    settings_cache.update(user_id, {key: value})
 
 
 async def get_user_data_key(user_id, key, default=None):
-    user_data = await users_collection.find_one({"user_id": int(user_id)})
-    print(f"Fetching key '{key}' for user {user_id}: {user_data}")
+    user_data = await settings_cache.get(user_id)
     return user_data.get(key, default) if user_data else default
 
 
 async def get_user_data(user_id):
     try:
-        user_data = await users_collection.find_one({"user_id": user_id})
-        return user_data
+        return await settings_cache.get(user_id)
     except Exception as e:
         logger.error(f"Error retrieving user data for {user_id}: {e}")
         return None
@@ -135,6 +266,7 @@ async def save_user_session(user_id, session_string):
             }},
             upsert=True
         )
+        settings_cache.update(user_id, {"session_string": session_string})
         logger.info(f"Saved session for user {user_id}")
         return True
     except Exception as e:
@@ -148,6 +280,7 @@ async def remove_user_session(user_id):
             {"user_id": user_id},
             {"$unset": {"session_string": ""}}
         )
+        settings_cache.update(user_id, unset=("session_string",))
         logger.info(f"Removed session for user {user_id}")
         return True
     except Exception as e:
@@ -165,6 +298,7 @@ async def save_user_bot(user_id, bot_token):
             }},
             upsert=True
         )
+        settings_cache.update(user_id, {"bot_token": bot_token})
         logger.info(f"Saved bot token for user {user_id}")
         return True
     except Exception as e:
@@ -178,6 +312,7 @@ async def remove_user_bot(user_id):
             {"user_id": user_id},
             {"$unset": {"bot_token": ""}}
         )
+        settings_cache.update(user_id, unset=("bot_token",))
         logger.info(f"Removed bot token for user {user_id}")
         return True
     except Exception as e:
@@ -185,6 +320,43 @@ async def remove_user_bot(user_id):
         return False
 
 
+async def thumbnail_version(user_id):
+    """Version of the user's current custom thumbnail (None if unset); changes whenever it is replaced."""
+    return await get_user_data_key(user_id, "thumb_version", None)
+
+
+async def save_thumbnail(user_id, image):
+    """Normalizes and stores a custom thumbnail for all replicas."""
+    version = await thumb_store.put(int(user_id), image)
+    await save_user_data(user_id, "thumb_version", version)
+
+
+async def remove_thumbnail(user_id):
+    """Removes the user's custom thumbnail; returns False if there was none."""
+    if not await thumbnail_version(user_id):
+        return False
+    await users_collection.update_one({"user_id": user_id}, {"$unset": {"thumb_version": ""}})
+    settings_cache.update(user_id, unset=("thumb_version",))
+    await thumb_store.remove(int(user_id))
+    return True
+
+
+async def migrate_local_thumbnails(directory="."):
+    """Moves thumbnails saved as {user_id}.jpg by earlier versions into the shared store."""
+    for name in os.listdir(directory):
+        match = re.fullmatch(r"(\d+)\.jpg", name)
+        if not match:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "rb") as f:
+                await save_thumbnail(int(match.group(1)), f.read())
+            os.remove(path)
+            logger.info(f"Migrated thumbnail {name} to GridFS")
+        except Exception as e:
+            logger.error(f"Could not migrate thumbnail {name}: {e}")
+
+
 async def process_text_with_rules(user_id, text):
     if not text:
         return ""
@@ -192,89 +364,25 @@ async def process_text_with_rules(user_id, text):
     try:
         replacements = await get_user_data_key(user_id, "replacement_words", {})
         delete_words = await get_user_data_key(user_id, "delete_words", [])
-        
-        processed_text = text
-        for word, replacement in replacements.items():
-            processed_text = processed_text.replace(word, replacement)
-        
-        if delete_words:
-            words = processed_text.split()
-            filtered_words = [w for w in words if w not in delete_words]
-            processed_text = " ".join(filtered_words)
-        
-        return processed_text
+        return compile_rules(delete_words, replacements).apply_text(text)
     except Exception as e:
         logger.error(f"Error processing text with rules: {e}")
         return text
 
 
-async def screenshot(video: str, duration: int, sender: str) -> str | None:
-    existing_screenshot = f"{sender}.jpg"
-    if os.path.exists(existing_screenshot):
+async def screenshot(video: str, duration: int, sender: str) -> io.BytesIO | None:
+    """The user's custom thumbnail if set, otherwise an in-memory JPEG grabbed from the video."""
+    existing_screenshot = await thumbnail(sender)
+    if existing_screenshot:
         return existing_screenshot
 
-    time_stamp = hhmmss(duration // 2)
-    output_file = datetime.now().isoformat("_", "seconds") + ".jpg"
-
-    cmd = [
-        "ffmpeg",
-        "-ss", time_stamp,
-        "-i", video,
-        "-frames:v", "1",
-        output_file,
-        "-y"
-    ]
-
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    
-    stdout, stderr = await process.communicate()
-
-    if os.path.isfile(output_file):
-        return output_file
-    else:
-        print(f"FFmpeg Error: {stderr.decode().strip()}")
-        return None
+    data = await thumbnailer.capture(video, duration)
+    return as_upload(data) if data else None
 
 
 async def get_video_metadata(file_path):
-    default_values = {'width': 1, 'height': 1, 'duration': 1}
-    loop = asyncio.get_event_loop()
-    executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
-    
-    try:
-        def _extract_metadata():
-            try:
-                vcap = cv2.VideoCapture(file_path)
-                if not vcap.isOpened():
-                    return default_values
-
-                width = round(vcap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                height = round(vcap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                fps = vcap.get(cv2.CAP_PROP_FPS)
-                frame_count = vcap.get(cv2.CAP_PROP_FRAME_COUNT)
-
-                if fps <= 0:
-                    return default_values
-
-                duration = round(frame_count / fps)
-                if duration <= 0:
-                    return default_values
-
-                vcap.release()
-                return {'width': width, 'height': height, 'duration': duration}
-            except Exception as e:
-                logger.error(f"Error in video_metadata: {e}")
-                return default_values
-        
-        return await loop.run_in_executor(executor, _extract_metadata)
-        
-    except Exception as e:
-        logger.error(f"Error in get_video_metadata: {e}")
-        return default_values
+    """Width, height and duration of a video, read from its container headers (ffprobe as fallback)."""
+    return await probe_video(file_path)
 
 
 async def add_premium_user(user_id, duration_value, duration_unit):
@@ -0,0 +1,87 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from pymongo import DESCENDING, UpdateOne
+from utils.func import db
+
+logger = logging.getLogger(__name__)
+
+batch_items_collection = db["batch_items"]
+
+# Result codes stored per item
+OK, FAILED, MISSING, SKIPPED = 'ok', 'failed', 'missing', 'skipped'
+
+
+def result_code(result: str) -> str:
+    """Maps the human-readable result of a delivery to a ledger result code."""
+    if 'Done' in result or 'Sent' in result:
+        return OK
+    if 'not found' in result or 'inaccessible' in result:
+        return MISSING
+    if 'Skipped' in result or 'Unsupported' in result:
+        return SKIPPED
+    return FAILED
+
+
+class BatchLedger:
+    """
+    Buffers one outcome document per batch item and writes them with unordered bulk_write,
+    either when flush_size records are pending or flush_interval seconds after the first one.
+    Documents are keyed by (batch_id, message_id), so a retry overwrites the earlier outcome.
+    """
+
+    def __init__(self, collection, flush_size: int = 100, flush_interval: float = 10.0):
+        self.collection = collection
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._ops: List[UpdateOne] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set() # Size-triggered flushes, referenced until they finish
+        self._lock = asyncio.Lock()
+        self._indexed = False
+
+    def record(self, batch_id: str, message_id: int, **fields: Any):
+        doc = {'batch_id': batch_id, 'message_id': message_id, 'at': datetime.now(), **fields}
+        self._ops.append(UpdateOne({'_id': f'{batch_id}:{message_id}'}, {'$set': doc}, upsert=True))
+        if len(self._ops) >= self.flush_size:
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif not self._timer or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            ops, self._ops = self._ops, []
+            if not ops:
+                return
+            try:
+                if not self._indexed:
+                    await self.collection.create_index([('user_id', 1), ('at', DESCENDING)])
+                    await self.collection.create_index([('batch_id', 1), ('code', 1)])
+                    self._indexed = True
+                await self.collection.bulk_write(ops, ordered=False)
+            except Exception as e:
+                logger.error(f"Batch ledger flush of {len(ops)} records failed: {e}")
+
+    async def last_batch_failures(self, user_id: int) -> Tuple[Optional[Dict[str, Any]], List[int]]:
+        """Returns (a record of the user's most recent batch, IDs of its failed items in order)."""
+        await self.flush() # Include outcomes still in the buffer
+        latest = await self.collection.find_one({'user_id': user_id}, sort=[('at', DESCENDING)])
+        if not latest:
+            return None, []
+        cursor = self.collection.find({'batch_id': latest['batch_id'], 'code': FAILED}, {'message_id': 1})
+        ids = sorted([doc['message_id'] async for doc in cursor])
+        return latest, ids
+
+
+ledger = BatchLedger(batch_items_collection)
@@ -0,0 +1,109 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+from utils.func import db, statistics_collection
+
+logger = logging.getLogger(__name__)
+
+media_cache_collection = db["media_cache"]
+STATS_ID = "media_cache" # Document in the statistics collection holding lifetime counters
+FLUSH_INTERVAL = 30 # seconds counter increments are buffered before they are written
+
+
+class MediaCache:
+    """
+    Maps a source media (file_unique_id) to the file_id of our own earlier upload, so repeated
+    requests for the same post are answered with send_cached_media instead of a full transfer.
+
+    file_ids only work for the bot that uploaded them, and the upload carries the renamed file name
+    and thumbnail, so both are part of the key alongside the file_unique_id.
+    Lifetime counters are buffered in memory and written FLUSH_INTERVAL seconds after the first change.
+    """
+
+    def __init__(self, collection, stats_collection):
+        self.collection = collection
+        self.stats_collection = stats_collection
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0} # Since start
+        self._pending = dict.fromkeys(self.counters, 0) # Not yet added to the lifetime counters
+        self._timer: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def make_key(file_unique_id: str, bot_id: int, file_name: str, thumb_sig: str = "") -> str:
+        variant = hashlib.sha1(f"{file_name}|{thumb_sig}".encode()).hexdigest()[:12]
+        return f"{file_unique_id}:{bot_id}:{variant}"
+
+    def _count(self, counter: str):
+        self.counters[counter] += 1
+        self._pending[counter] += 1
+        if not self._timer or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        """Adds the buffered counter increments to the lifetime counters."""
+        increments = {name: count for name, count in self._pending.items() if count}
+        if not increments:
+            return
+        self._pending = dict.fromkeys(self.counters, 0)
+        try:
+            await self.stats_collection.update_one({"_id": STATS_ID}, {"$inc": increments}, upsert=True)
+        except Exception as e:
+            logger.warning(f"Could not persist media cache counters: {e}")
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            entry = await self.collection.find_one({"_id": key})
+        except Exception as e:
+            logger.error(f"Media cache lookup failed for {key}: {e}")
+            return None
+        self._count("hits" if entry else "misses")
+        return entry
+
+    async def put(self, key: str, file_id: str, kind: str, attributes: Optional[Dict[str, Any]] = None):
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"file_id": file_id, "kind": kind, "attributes": attributes or {}, "updated_at": datetime.now()}},
+                upsert=True
+            )
+            self._count("stores")
+        except Exception as e:
+            logger.error(f"Could not store media cache entry {key}: {e}")
+
+    async def invalidate(self, key: str):
+        try:
+            await self.collection.delete_one({"_id": key})
+            self._count("invalidations")
+        except Exception as e:
+            logger.error(f"Could not invalidate media cache entry {key}: {e}")
+
+    async def stats(self) -> Dict[str, Any]:
+        """Counters since start and lifetime counters, each with a hit rate, plus the number of entries."""
+        lifetime = {}
+        entries = 0
+        await self.flush()
+        try:
+            lifetime = await self.stats_collection.find_one({"_id": STATS_ID}) or {}
+            entries = await self.collection.estimated_document_count()
+        except Exception as e:
+            logger.error(f"Could not read media cache stats: {e}")
+
+        def with_rate(counters: Dict[str, Any]) -> Dict[str, Any]:
+            result = {name: counters.get(name, 0) for name in self.counters}
+            lookups = result["hits"] + result["misses"]
+            result["hit_rate"] = (result["hits"] / lookups * 100) if lookups else 0.0
+            return result
+
+        return {"session": with_rate(self.counters), "lifetime": with_rate(lifetime), "entries": entries}
+
+
+media_cache = MediaCache(media_cache_collection, statistics_collection)
@@ -0,0 +1,128 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+from pyrogram import Client, utils
+from pyrogram.errors import BadRequest, Forbidden
+from config import PEER_NEGATIVE_TTL
+
+logger = logging.getLogger(__name__)
+
+MAX_PEERS = 5000 # resolved peers kept per client
+DIALOG_SYNC_INTERVAL = 3600 # seconds before a client may walk its dialogs again
+
+# Errors meaning the peer does not exist or this client cannot see it; anything else (FloodWait, network) is not cached
+NOT_ACCESSIBLE = (BadRequest, Forbidden, KeyError, ValueError)
+
+
+def normalize_chat(chat: Union[int, str]) -> Union[int, str]:
+    """Numeric strings ('-100123...') become int IDs, usernames lose '@' and are lower-cased."""
+    if isinstance(chat, str):
+        stripped = chat.strip()
+        try:
+            return int(stripped)
+        except ValueError:
+            return stripped.lstrip('@').lower()
+    return chat
+
+
+class _ClientPeers:
+    """Peers known to a single client."""
+
+    def __init__(self):
+        self.peers: "OrderedDict[Union[int, str], Any]" = OrderedDict() # {chat ID or username: InputPeer}, LRU order
+        self.missing: Dict[Union[int, str], float] = {} # {chat ID or username: monotonic expiry}
+        self.synced_at: Optional[float] = None
+        self.sync_lock = asyncio.Lock()
+
+
+class PeerCache:
+    """
+    Resolves chat IDs and usernames to input peers (which carry the access hash) once per client.
+    A miss costs one targeted resolve_peer; a full dialog walk is only done when that fails and the
+    client has not synced recently. Peers that still cannot be resolved are remembered for
+    negative_ttl seconds so later lookups fail without any RPC.
+    """
+
+    def __init__(self, negative_ttl: float):
+        self.negative_ttl = negative_ttl
+        self._clients: "weakref.WeakKeyDictionary[Client, _ClientPeers]" = weakref.WeakKeyDictionary()
+
+    def _for(self, client: Client) -> _ClientPeers:
+        entry = self._clients.get(client)
+        if entry is None:
+            entry = self._clients[client] = _ClientPeers()
+        return entry
+
+    def _remember(self, known: _ClientPeers, key: Union[int, str], peer: Any):
+        known.missing.pop(key, None)
+        known.peers[key] = peer
+        known.peers.move_to_end(key)
+        if isinstance(key, str):
+            try:
+                known.peers[utils.get_peer_id(peer)] = peer # Make the username's chat ID a hit as well
+            except Exception:
+                pass
+        while len(known.peers) > MAX_PEERS:
+            known.peers.popitem(last=False)
+
+    async def _sync_dialogs(self, client: Client, known: _ClientPeers) -> bool:
+        """Walks the client's dialogs once so pyrogram stores their access hashes; False if skipped."""
+        async with known.sync_lock:
+            if known.synced_at and time.monotonic() - known.synced_at < DIALOG_SYNC_INTERVAL:
+                return False
+            known.synced_at = time.monotonic()
+            try:
+                async for _ in client.get_dialogs():
+                    pass
+            except Exception as e:
+                logger.warning(f"Dialog sync failed for client {client.name}: {e}")
+            return True
+
+    async def resolve(self, client: Client, chat: Union[int, str]) -> Optional[Any]:
+        """Returns the InputPeer for chat, or None if the client cannot access it."""
+        key = normalize_chat(chat)
+        known = self._for(client)
+        peer = known.peers.get(key)
+        if peer is not None:
+            known.peers.move_to_end(key)
+            return peer
+        expiry = known.missing.get(key)
+        if expiry is not None:
+            if time.monotonic() < expiry:
+                return None
+            del known.missing[key]
+
+        try:
+            peer = await client.resolve_peer(key)
+        except NOT_ACCESSIBLE as e:
+            # Last resort: peers the account only knows from its chat list need their access hash from the dialogs
+            if not await self._sync_dialogs(client, known):
+                return self._fail(known, key, e)
+            try:
+                peer = await client.resolve_peer(key)
+            except NOT_ACCESSIBLE as e:
+                return self._fail(known, key, e)
+        self._remember(known, key, peer)
+        return peer
+
+    def _fail(self, known: _ClientPeers, key: Union[int, str], error: Exception) -> None:
+        logger.info(f"Peer {key} is not accessible, skipping lookups for {self.negative_ttl}s: {error}")
+        known.missing[key] = time.monotonic() + self.negative_ttl
+        return None
+
+    def forget(self, client: Client, chat: Union[int, str]):
+        """Drops positive and negative entries for chat, e.g. after the client joined it."""
+        key = normalize_chat(chat)
+        known = self._for(client)
+        known.peers.pop(key, None)
+        known.missing.pop(key, None)
+
+
+peer_cache = PeerCache(PEER_NEGATIVE_TTL)
@@ -0,0 +1,88 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+StageFn = Callable[[Any], Awaitable[Any]]
+
+
+class OrderedPipeline:
+    """
+    Runs items through a chain of concurrent stages connected by bounded queues and hands
+    the results to a final stage strictly in input order (reorder buffer).
+
+    stages: list of (name, fn, workers); fn(item) -> item. Exceptions are forwarded as the item.
+    final:  fn(seq, item) called by a single worker in input order.
+    depth:  max items between the source and the final stage, which bounds the files on disk
+            and the memory held by the pipeline.
+    """
+
+    def __init__(self, stages: List[Tuple[str, StageFn, int]], final: Callable[[int, Any], Awaitable[None]], depth: int = 3):
+        self.stages = [(name, fn, max(1, int(workers))) for name, fn, workers in stages]
+        self.final = final
+        self.depth = max(1, int(depth))
+        self.stopped = False
+        self._window = asyncio.Semaphore(self.depth)
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=self.depth) for _ in range(len(self.stages) + 1)]
+        self._pending: Dict[int, Any] = {} # Reorder buffer {seq: item}
+        self._next_seq = 0
+
+    def stop(self):
+        """Stops feeding new items; items already in flight still run to the final stage."""
+        self.stopped = True
+
+    async def _stage_worker(self, index: int, name: str, fn: StageFn):
+        inbox, outbox = self._queues[index], self._queues[index + 1]
+        while True:
+            seq, item = await inbox.get()
+            try:
+                if not isinstance(item, Exception):
+                    item = await fn(item)
+            except Exception as e:
+                logger.error(f"Pipeline stage '{name}' failed for item {seq}: {e}")
+                item = e
+            await outbox.put((seq, item))
+            inbox.task_done()
+
+    async def _reorder_worker(self):
+        inbox = self._queues[-1]
+        while True:
+            seq, item = await inbox.get()
+            self._pending[seq] = item
+            try:
+                while self._next_seq in self._pending:
+                    ready = self._pending.pop(self._next_seq)
+                    try:
+                        await self.final(self._next_seq, ready)
+                    except Exception as e:
+                        logger.error(f"Pipeline final stage failed for item {self._next_seq}: {e}")
+                    self._next_seq += 1
+                    self._window.release()
+            finally:
+                inbox.task_done()
+
+    async def run(self, source: AsyncIterable[Any]):
+        """Feeds items from source through the pipeline and returns once every fed item reached the final stage."""
+        workers = [asyncio.create_task(self._reorder_worker())]
+        for index, (name, fn, count) in enumerate(self.stages):
+            workers += [asyncio.create_task(self._stage_worker(index, name, fn)) for _ in range(count)]
+        try:
+            seq = 0
+            async for item in source:
+                await self._window.acquire() # Blocks while `depth` items are in flight
+                if self.stopped:
+                    self._window.release()
+                    break
+                await self._queues[0].put((seq, item))
+                seq += 1
+            for queue in self._queues:
+                await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
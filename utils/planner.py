@@ -0,0 +1,144 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+from pyrogram import Client
+from pyrogram.types import Message
+from utils.prefetch import MessagePrefetcher
+
+TWO_GB = 2 * 1024 * 1024 * 1024
+DEFAULT_THROUGHPUT = 2 * 1024 * 1024 # bytes/s assumed until a batch has been measured
+PER_ITEM_SECONDS = 2.0 # send pacing and API round trips per delivered item
+PLAN_REUSE_TTL = 600 # seconds a plan's messages stand in for a fresh fetch; older file references may have expired
+
+
+class ThroughputMeter:
+    """Exponentially weighted average of the transfer rate measured by running batches."""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.rate: Optional[float] = None # bytes/s
+        self.samples = 0
+
+    def record(self, nbytes: int, seconds: float):
+        if nbytes <= 0 or seconds <= 0:
+            return
+        sample = nbytes / seconds
+        self.rate = sample if self.rate is None else self.alpha * sample + (1 - self.alpha) * self.rate
+        self.samples += 1
+
+    def estimate(self) -> float:
+        return self.rate or DEFAULT_THROUGHPUT
+
+
+throughput = ThroughputMeter()
+
+
+class BatchPlan:
+    """What a batch would transfer, built from message metadata only."""
+
+    def __init__(self, start_id: int, count: int):
+        self.start_id = start_id
+        self.count = count
+        self.kinds: Counter = Counter() # {media kind or 'text': count}
+        self.missing = 0 # IDs that are deleted, empty or inaccessible
+        self.past_end = 0 # IDs beyond the newest message of the chat
+        self.last_found_id: Optional[int] = None
+        self.total_bytes = 0
+        self.over_2gb: List[int] = []
+        self.direct = 0 # Items eligible for the cheap send_direct path
+        self.transfer_bytes = 0 # Bytes that must actually be downloaded and uploaded
+        self.transfer_items = 0
+        self.messages: Dict[int, Optional[Message]] = {} # Every fetched ID, None if missing; reused by trims and the batch itself
+        self.fetched_at = time.monotonic()
+
+    def fresh(self) -> bool:
+        return time.monotonic() - self.fetched_at < PLAN_REUSE_TTL
+
+    @property
+    def found(self) -> int:
+        return sum(self.kinds.values())
+
+    def eta_seconds(self) -> float:
+        return self.transfer_bytes / throughput.estimate() + self.found * PER_ITEM_SECONDS
+
+
+def media_size(message: Message) -> int:
+    if not message.media:
+        return 0
+    media = getattr(message, message.media.value, None)
+    return getattr(media, 'file_size', 0) or 0
+
+
+def build_plan(start_id: int, count: int, messages: Dict[int, Optional[Message]], is_direct: Callable[[Message], bool]) -> BatchPlan:
+    """Builds a BatchPlan from already fetched messages; IDs absent from messages lie past the end of the chat."""
+    plan = BatchPlan(start_id, count)
+    plan.messages = messages
+    for message_id in range(start_id, start_id + count):
+        if message_id not in messages:
+            plan.past_end += 1
+            continue
+        message = messages[message_id]
+        if message is None:
+            plan.missing += 1
+            continue
+        plan.last_found_id = message_id
+        plan.kinds[message.media.value if message.media else 'text'] += 1
+        size = media_size(message)
+        plan.total_bytes += size
+        if size > TWO_GB:
+            plan.over_2gb.append(message_id)
+        if message.media and is_direct(message):
+            plan.direct += 1
+        elif message.media:
+            plan.transfer_items += 1
+            plan.transfer_bytes += size
+    return plan
+
+
+async def plan_batch(client: Client, chat_id: Any, start_id: int, count: int, is_direct: Callable[[Message], bool]) -> BatchPlan:
+    """Builds a BatchPlan with bulk get_messages calls; nothing is downloaded."""
+    messages: Dict[int, Optional[Message]] = {}
+    async with MessagePrefetcher(client, chat_id, range(start_id, start_id + count)) as prefetcher:
+        async for message_id, message in prefetcher:
+            messages[message_id] = message
+    return build_plan(start_id, count, messages, is_direct)
+
+
+def trim_plan(plan: BatchPlan, count: int, is_direct: Callable[[Message], bool]) -> BatchPlan:
+    """The plan for the first `count` IDs of plan, from the messages it already holds."""
+    trimmed = build_plan(plan.start_id, count, plan.messages, is_direct)
+    trimmed.fetched_at = plan.fetched_at
+    return trimmed
+
+
+def format_size(nbytes: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if nbytes < 1024:
+            return f'{nbytes:.1f} {unit}'
+        nbytes /= 1024
+    return f'{nbytes:.1f} TB'
+
+
+def format_duration(seconds: float) -> str:
+    return time.strftime('%H:%M:%S', time.gmtime(seconds)) if seconds < 86400 else f'{seconds / 86400:.1f} days'
+
+
+def format_plan(plan: BatchPlan) -> str:
+    mix = ', '.join(f'{kind}: {n}' for kind, n in plan.kinds.most_common()) or 'none'
+    measured = 'measured' if throughput.samples else 'assumed'
+    lines = [
+        f'📋 **Batch plan** ({plan.count} IDs from {plan.start_id})\n',
+        f'**Found:** {plan.found} · **Missing/empty:** {plan.missing}' + (f' · **Past end of chat:** {plan.past_end}' if plan.past_end else ''),
+        f'**Mix:** {mix}',
+        f'**Total size:** {format_size(plan.total_bytes)}',
+        f'**Over 2 GB:** {len(plan.over_2gb)}' + (f" (IDs {', '.join(map(str, plan.over_2gb[:5]))}{'…' if len(plan.over_2gb) > 5 else ''})" if plan.over_2gb else ''),
+        f'**Direct send (no transfer):** {plan.direct} · **To transfer:** {plan.transfer_items} ({format_size(plan.transfer_bytes)})',
+        f'**ETA:** ~{format_duration(plan.eta_seconds())} at {format_size(throughput.estimate())}/s ({measured})',
+    ]
+    if plan.last_found_id and plan.last_found_id < plan.start_id + plan.count - 1:
+        lines.append(f'\nℹ️ The last existing message is #{plan.last_found_id - plan.start_id + 1}; trimming to that loses nothing.')
+    return '\n'.join(lines)
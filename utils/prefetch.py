@@ -0,0 +1,147 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from pyrogram import Client
+from pyrogram.types import Message
+from utils.ratelimit import limiter
+
+logger = logging.getLogger(__name__)
+
+MAX_IDS_PER_CALL = 200 # Telegram caps messages.getMessages / channels.getMessages at 200 IDs
+
+
+def normalize_chat_id(chat_identifier: Any) -> Any:
+    """Turns numeric strings like '-100123' (as returned by E()) into ints so Pyrogram treats them as chat IDs."""
+    if isinstance(chat_identifier, str) and chat_identifier.lstrip('-').isdigit():
+        return int(chat_identifier)
+    return chat_identifier
+
+
+async def get_last_message_id(client: Client, chat_id: Any) -> Optional[int]:
+    """Returns the newest message ID in a chat, or None if the client cannot read history (e.g. bots)."""
+    try:
+        async for msg in client.get_chat_history(chat_id, limit=1):
+            return msg.id
+    except Exception as e:
+        logger.info(f"Could not read last message ID of {chat_id}: {e}")
+    return None
+
+
+class MessagePrefetcher:
+    """
+    Fetches batch messages in windows of up to 200 IDs with one get_messages call each,
+    reading a bounded number of windows ahead of the consumer.
+
+    Usage:
+        async with MessagePrefetcher(client, chat, ids) as pf:
+            async for msg_id, msg in pf:
+                ...  # msg is None when the ID is missing or inaccessible
+    """
+
+    def __init__(self, client: Client, chat_id: Any, message_ids: Iterable[int], window: int = MAX_IDS_PER_CALL, lookahead: int = 3,
+                 known: Optional[Dict[int, Optional[Message]]] = None):
+        self.client = client
+        self.chat_id = normalize_chat_id(chat_id)
+        self.message_ids: List[int] = list(message_ids)
+        self.window = max(1, min(int(window), MAX_IDS_PER_CALL))
+        self.lookahead = max(1, int(lookahead))
+        self.known = known or {} # Messages fetched earlier (e.g. by the batch planner), served without an API call
+        self.last_id: Optional[int] = None # Newest message ID in the chat, if known
+        self.reached_end = False # True when IDs past the chat's last message were skipped
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.lookahead) # Bounded buffer of fetched windows
+        self._task: Optional[asyncio.Task] = None
+
+    async def _fetch_window(self, ids: List[int]) -> List[Optional[Message]]:
+        """Fetches one window of IDs; missing or empty messages come back as None."""
+        try:
+            msgs = await limiter.call(self.client, 'get_messages', None, self.client.get_messages, self.chat_id, ids)
+        except Exception as e:
+            logger.error(f"Bulk fetch of {len(ids)} messages from {self.chat_id} failed: {e}")
+            return [None] * len(ids)
+        if not isinstance(msgs, list):
+            msgs = [msgs]
+        by_id = {m.id: m for m in msgs if m and not getattr(m, "empty", False)}
+        return [by_id.get(i) for i in ids]
+
+    async def _produce(self):
+        """Background task filling the buffer window by window."""
+        try:
+            self.last_id = await get_last_message_id(self.client, self.chat_id)
+            for i in range(0, len(self.message_ids), self.window):
+                ids = self.message_ids[i:i + self.window]
+                if self.last_id is not None:
+                    in_range = [x for x in ids if x <= self.last_id]
+                    if len(in_range) < len(ids):
+                        self.reached_end = True
+                    if not in_range:
+                        break # Every remaining ID is past the end of the chat
+                    ids = in_range
+                unknown = [x for x in ids if x not in self.known]
+                fetched = dict(zip(unknown, await self._fetch_window(unknown))) if unknown else {}
+                await self._queue.put([(x, self.known[x] if x in self.known else fetched[x]) for x in ids])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Prefetcher for {self.chat_id} stopped: {e}")
+        finally:
+            try:
+                self._queue.put_nowait(None) # End-of-stream marker
+            except asyncio.QueueFull:
+                pass # Consumer is gone or will drain; close() cancels us anyway
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._produce())
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __aiter__(self):
+        self.start()
+        return self._iterate()
+
+    async def _iterate(self):
+        while True:
+            window: Optional[List[Tuple[int, Optional[Message]]]] = await self._queue.get()
+            if window is None:
+                return
+            for item in window:
+                yield item
+            # The producer may have been unable to queue the end marker while the buffer was full;
+            # it only finishes after pushing every window, so a finished task means we're done.
+            if self._task and self._task.done() and self._queue.empty():
+                return
+
+
+async def group_albums(items: AsyncIterable[Tuple[int, Optional[Message]]], is_member: Callable[[Optional[Message]], bool]) -> AsyncIterator[Tuple[List[int], Any]]:
+    """
+    Merges consecutive album members that share a media_group_id into one entry.
+    Yields (message IDs, message) or, for albums of two or more, (message IDs, list of messages).
+    """
+    album: List[Tuple[int, Message]] = [] # Pending (message_id, msg) pairs of the album being collected
+    async for message_id, msg in items:
+        if album and not (is_member(msg) and msg.media_group_id == album[-1][1].media_group_id):
+            yield [i for i, _ in album], [m for _, m in album] if len(album) > 1 else album[0][1]
+            album = []
+        if is_member(msg):
+            album.append((message_id, msg))
+            continue
+        yield [message_id], msg
+    if album:
+        yield [i for i, _ in album], [m for _, m in album] if len(album) > 1 else album[0][1]
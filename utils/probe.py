@@ -0,0 +1,305 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from config import PROBE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METADATA = {'width': 1, 'height': 1, 'duration': 1}
+MAX_MOOV_BYTES = 64 * 1024 * 1024 # a larger moov is malformed or not worth reading; ffprobe takes over
+MAX_ELEMENT_BYTES = 16 * 1024 * 1024 # same bound for Matroska Info/Tracks
+
+# Header parsing is plain file I/O; it runs on this shared pool and ffprobe runs under the same bound
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix='probe')
+ffprobe_slots = asyncio.Semaphore(PROBE_WORKERS)
+
+
+# --- MP4 / MOV (ISO base media) ---
+
+def _boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yields (type, payload offset, payload size) of the boxes between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        offset = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            offset = 16
+        elif size == 0:
+            size = end - pos
+        if size < offset:
+            return
+        yield box_type, pos + offset, size - offset
+        pos += size
+
+
+def _mp4_metadata(f: BinaryIO, file_size: int) -> Optional[Dict[str, int]]:
+    moov = next(((off, size) for box, off, size in _boxes(f, 0, file_size) if box == b'moov'), None)
+    if not moov or moov[1] > MAX_MOOV_BYTES:
+        return None
+    f.seek(moov[0])
+    data = f.read(moov[1]) # moov holds only the headers and sample tables; it may sit at the end of the file
+    view = _BytesReader(data)
+    duration = None
+    width = height = None
+    for box, off, size in _boxes(view, 0, len(data)):
+        if box == b'mvhd':
+            version = data[off]
+            if version == 1:
+                timescale, length = struct.unpack_from('>IQ', data, off + 20)
+            else:
+                timescale, length = struct.unpack_from('>II', data, off + 12)
+            if timescale:
+                duration = length / timescale
+        elif box == b'trak' and width is None:
+            width, height = _mp4_video_track(view, data, off, off + size) or (None, None)
+    if duration is None and width is None:
+        return None
+    return {'width': width or 1, 'height': height or 1, 'duration': round(duration or 0)}
+
+
+def _mp4_video_track(view: '_BytesReader', data: bytes, start: int, end: int) -> Optional[Tuple[int, int]]:
+    """(width, height) as displayed, if this trak is a video track."""
+    tkhd = None
+    is_video = False
+    for box, off, size in _boxes(view, start, end):
+        if box == b'tkhd':
+            tkhd = (off, size)
+        elif box == b'mdia':
+            for inner, ioff, _ in _boxes(view, off, off + size):
+                if inner == b'hdlr' and data[ioff + 8:ioff + 12] == b'vide':
+                    is_video = True
+    if not is_video or not tkhd:
+        return None
+    off, size = tkhd
+    # Width and height are the last two 16.16 fixed-point fields; the matrix before them carries rotation
+    width, height = (v >> 16 for v in struct.unpack_from('>II', data, off + size - 8))
+    a, b = struct.unpack_from('>ii', data, off + size - 44)
+    if a == 0 and b != 0: # Rotated by 90 or 270 degrees
+        width, height = height, width
+    return width, height
+
+
+class _BytesReader:
+    """Minimal file-like view of an in-memory buffer, so _boxes works on a loaded moov."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def seek(self, pos: int):
+        self.pos = pos
+
+    def read(self, n: int) -> bytes:
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+
+# --- Matroska / WebM (EBML) ---
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD, SEEK, SEEK_ID, SEEK_POSITION = 0x114D9B74, 0x4DBB, 0x53AB, 0x53AC
+INFO, TIMECODE_SCALE, DURATION = 0x1549A966, 0x2AD7B1, 0x4489
+TRACKS, TRACK_ENTRY, TRACK_TYPE = 0x1654AE6B, 0xAE, 0x83
+VIDEO, PIXEL_WIDTH, PIXEL_HEIGHT, DISPLAY_WIDTH, DISPLAY_HEIGHT = 0xE0, 0xB0, 0xBA, 0x54B0, 0x54BA
+CLUSTER = 0x1F43B675
+
+
+def _vint(f: BinaryIO, keep_marker: bool) -> Optional[Tuple[int, int]]:
+    """Reads an EBML variable-length integer; returns (value, length), value -1 for 'unknown size'."""
+    first = f.read(1)
+    if not first:
+        return None
+    b = first[0]
+    length = next((i + 1 for i in range(8) if b & (0x80 >> i)), None)
+    if length is None:
+        return None
+    value = b if keep_marker else b & (0xFF >> length)
+    rest = f.read(length - 1)
+    if len(rest) < length - 1:
+        return None
+    for byte in rest:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = -1
+    return value, length
+
+
+def _elements(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    """Yields (id, data offset, data size) of the EBML elements between start and end; size -1 = unknown."""
+    pos = start
+    while pos < end:
+        f.seek(pos)
+        element_id = _vint(f, keep_marker=True)
+        size = _vint(f, keep_marker=False)
+        if not element_id or not size:
+            return
+        data = pos + element_id[1] + size[1]
+        yield element_id[0], data, size[0]
+        if size[0] < 0:
+            return # Unknown size (live streams); nothing after it can be located
+        pos = data + size[0]
+
+
+def _ebml_uint(data: bytes) -> int:
+    return int.from_bytes(data, 'big')
+
+
+def _ebml_float(data: bytes) -> float:
+    return struct.unpack('>f', data)[0] if len(data) == 4 else struct.unpack('>d', data)[0] if len(data) == 8 else 0.0
+
+
+def _read_element(f: BinaryIO, offset: int, size: int) -> Optional[bytes]:
+    if size < 0 or size > MAX_ELEMENT_BYTES:
+        return None
+    f.seek(offset)
+    return f.read(size)
+
+
+def _mkv_metadata(f: BinaryIO, file_size: int) -> Optional[Dict[str, int]]:
+    segment = next(((off, size) for eid, off, size in _elements(f, 0, file_size) if eid == SEGMENT), None)
+    if not segment:
+        return None
+    seg_start = segment[0]
+    seg_end = file_size if segment[1] < 0 else min(file_size, seg_start + segment[1])
+    found: Dict[int, Tuple[int, int]] = {}
+    seek_targets: List[int] = []
+
+    for eid, off, size in _elements(f, seg_start, seg_end):
+        if eid in (INFO, TRACKS):
+            found.setdefault(eid, (off, size))
+        elif eid == SEEK_HEAD:
+            seek_targets += _mkv_seek_positions(f, off, size, seg_start)
+        elif eid == CLUSTER:
+            break # Media data starts; headers not seen yet are reached through the SeekHead
+        if INFO in found and TRACKS in found:
+            break
+    for target in seek_targets:
+        for eid, off, size in _elements(f, target, min(seg_end, target + 16)):
+            if eid in (INFO, TRACKS):
+                found.setdefault(eid, (off, size))
+            break
+    if not found:
+        return None
+
+    duration = 0.0
+    if INFO in found and (info := _read_element(f, *found[INFO])) is not None:
+        scale, raw_duration = 1_000_000, 0.0
+        view = _BytesReader(info)
+        for eid, off, size in _elements(view, 0, len(info)):
+            if eid == TIMECODE_SCALE:
+                scale = _ebml_uint(info[off:off + size]) or scale
+            elif eid == DURATION:
+                raw_duration = _ebml_float(info[off:off + size])
+        duration = raw_duration * scale / 1e9
+
+    width = height = None
+    if TRACKS in found and (tracks := _read_element(f, *found[TRACKS])) is not None:
+        width, height = _mkv_video_size(tracks) or (None, None)
+    return {'width': width or 1, 'height': height or 1, 'duration': round(duration)}
+
+
+def _mkv_seek_positions(f: BinaryIO, offset: int, size: int, seg_start: int) -> List[int]:
+    data = _read_element(f, offset, size)
+    if data is None:
+        return []
+    view = _BytesReader(data)
+    positions = []
+    for eid, off, sz in _elements(view, 0, len(data)):
+        if eid != SEEK:
+            continue
+        target_id, position = None, None
+        for inner, ioff, isz in _elements(view, off, off + sz):
+            if inner == SEEK_ID:
+                target_id = _ebml_uint(data[ioff:ioff + isz])
+            elif inner == SEEK_POSITION:
+                position = _ebml_uint(data[ioff:ioff + isz])
+        if target_id in (INFO, TRACKS) and position is not None:
+            positions.append(seg_start + position)
+    return positions
+
+
+def _mkv_video_size(tracks: bytes) -> Optional[Tuple[int, int]]:
+    view = _BytesReader(tracks)
+    for eid, off, size in _elements(view, 0, len(tracks)):
+        if eid != TRACK_ENTRY:
+            continue
+        track_type, video = None, None
+        for inner, ioff, isz in _elements(view, off, off + size):
+            if inner == TRACK_TYPE:
+                track_type = _ebml_uint(tracks[ioff:ioff + isz])
+            elif inner == VIDEO:
+                video = (ioff, isz)
+        if track_type != 1 or not video:
+            continue
+        fields: Dict[int, int] = {}
+        for inner, ioff, isz in _elements(view, video[0], video[0] + video[1]):
+            fields[inner] = _ebml_uint(tracks[ioff:ioff + isz])
+        width = fields.get(DISPLAY_WIDTH) or fields.get(PIXEL_WIDTH)
+        height = fields.get(DISPLAY_HEIGHT) or fields.get(PIXEL_HEIGHT)
+        if width and height:
+            return width, height
+    return None
+
+
+def read_header_metadata(path: str) -> Optional[Dict[str, int]]:
+    """Width/height/duration from the container headers only; None if the format is not recognised."""
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        head = f.read(12)
+        f.seek(0)
+        if head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+            return _mp4_metadata(f, file_size)
+        if head[:4] == EBML_HEADER.to_bytes(4, 'big'):
+            return _mkv_metadata(f, file_size)
+    return None
+
+
+async def ffprobe_metadata(path: str) -> Optional[Dict[str, int]]:
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height:format=duration',
+           '-of', 'json', path]
+    async with ffprobe_slots:
+        try:
+            process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            stdout, stderr = await process.communicate()
+        except FileNotFoundError:
+            logger.warning("ffprobe is not installed; video metadata falls back to defaults")
+            return None
+    if process.returncode != 0:
+        logger.error(f"ffprobe failed for {path}: {stderr.decode(errors='ignore').strip()}")
+        return None
+    info = json.loads(stdout or b'{}')
+    stream = (info.get('streams') or [{}])[0]
+    duration = float((info.get('format') or {}).get('duration') or 0)
+    return {'width': stream.get('width') or 1, 'height': stream.get('height') or 1, 'duration': round(duration)}
+
+
+async def probe_video(path: str) -> Dict[str, int]:
+    """Video width/height/duration (seconds), read from container headers with ffprobe as the fallback."""
+    metadata = None
+    try:
+        metadata = await asyncio.get_running_loop().run_in_executor(executor, read_header_metadata, path)
+    except Exception as e:
+        logger.warning(f"Header probe failed for {path}: {e}")
+    if not metadata or metadata['duration'] <= 0 or metadata['width'] <= 1:
+        try:
+            metadata = await ffprobe_metadata(path) or metadata
+        except Exception as e:
+            logger.error(f"ffprobe probe failed for {path}: {e}")
+    if not metadata or metadata['duration'] <= 0:
+        return dict(DEFAULT_METADATA)
+    return metadata
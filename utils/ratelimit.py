@@ -0,0 +1,155 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+# Per method class: (start rate, min rate, max rate) in calls per second, for the whole client and per chat.
+# Buckets speed up additively while calls succeed and halve on every FloodWait (AIMD).
+CLIENT_RATES: Dict[str, Tuple[float, float, float]] = {
+    'get_messages': (3.0, 0.2, 10.0),
+    'send': (10.0, 0.5, 25.0),
+    'edit_message_text': (5.0, 0.2, 20.0),
+    'copy_message': (10.0, 0.5, 25.0),
+}
+CHAT_RATES: Dict[str, Tuple[float, float, float]] = {
+    'send': (0.5, 0.05, 1.0),
+    'edit_message_text': (0.3, 0.05, 1.0),
+    'copy_message': (0.5, 0.05, 1.0),
+}
+MAX_FLOOD_RETRIES = 3
+BUCKET_IDLE_TTL = 600 # seconds after which an unused bucket is dropped; it restarts at its start rate
+SWEEP_INTERVAL = 60
+
+
+class TokenBucket:
+    """Token bucket whose refill rate adapts to FloodWait feedback."""
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0 # Set by FloodWait; no tokens are handed out before this
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def try_acquire(self) -> bool:
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self):
+        async with self._lock: # FIFO among waiters on the same bucket
+            while (wait := self.delay()) > 0:
+                await asyncio.sleep(wait)
+            self.tokens -= 1
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def idle(self, now: float) -> bool:
+        """True if nothing used or waited on the bucket for BUCKET_IDLE_TTL and it is not blocked."""
+        return now - self.updated > BUCKET_IDLE_TTL and now >= self.blocked_until and not self._lock.locked()
+
+    def on_flood(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+
+
+class RateLimiter:
+    """
+    Paces Telegram calls per (client, method class) and per (client, method class, chat).
+    call() honours FloodWait by blocking the affected buckets, slowing them down and retrying.
+    Buckets idle for BUCKET_IDLE_TTL are dropped, so every chat ever touched does not keep one.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[Any, ...], TokenBucket] = {}
+        self.swept = time.monotonic()
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self.swept < SWEEP_INTERVAL:
+            return
+        self.swept = now
+        for bucket_key in [k for k, b in self.buckets.items() if b.idle(now)]:
+            del self.buckets[bucket_key]
+
+    @staticmethod
+    def _client_key(client: Any) -> Any:
+        return getattr(client, 'name', None) or id(client)
+
+    def _buckets(self, client: Any, method: str, chat_id: Any = None):
+        self._sweep()
+        key = self._client_key(client)
+        keys = [((key, method), CLIENT_RATES.get(method))]
+        if chat_id is not None and method in CHAT_RATES:
+            keys.append(((key, method, str(chat_id)), CHAT_RATES[method]))
+        result = []
+        for bucket_key, rates in keys:
+            if rates is None:
+                continue
+            if bucket_key not in self.buckets:
+                start, low, high = rates
+                self.buckets[bucket_key] = TokenBucket(start, low, high, burst=max(1.0, start))
+            result.append(self.buckets[bucket_key])
+        return result
+
+    def allow(self, client: Any, method: str, chat_id: Any = None) -> bool:
+        """Non-blocking check for optional calls such as progress edits; takes tokens only if all buckets have one."""
+        buckets = self._buckets(client, method, chat_id)
+        if any(b.delay() > 0 for b in buckets):
+            return False
+        for b in buckets:
+            b.try_acquire()
+        return True
+
+    def flood(self, client: Any, method: str, chat_id: Any, seconds: float):
+        for b in self._buckets(client, method, chat_id):
+            b.on_flood(seconds)
+
+    async def call(self, client: Any, method: str, chat_id: Any, fn: Callable[..., Awaitable[Any]], *args, retry: bool = True, **kwargs):
+        """Runs fn(*args, **kwargs) once all matching buckets allow it, retrying after FloodWait."""
+        attempt = 0
+        while True:
+            buckets = self._buckets(client, method, chat_id)
+            for b in buckets:
+                await b.acquire()
+            try:
+                result = await fn(*args, **kwargs)
+            except FloodWait as e:
+                wait = float(getattr(e, 'value', 0) or 0) + 1
+                self.flood(client, method, chat_id, wait)
+                attempt += 1
+                logger.warning(f"FloodWait {wait:.0f}s on {method} (chat {chat_id}), attempt {attempt}/{MAX_FLOOD_RETRIES}")
+                if not retry or attempt > MAX_FLOOD_RETRIES:
+                    raise
+                continue # acquire() sleeps until the bucket is unblocked
+            for b in buckets:
+                b.on_success()
+            return result
+
+
+limiter = RateLimiter()
@@ -0,0 +1,153 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import abc
+import asyncio
+import logging
+import random
+from typing import Any, Callable, Optional
+from pyrogram import Client, raw
+from pyrogram.types import Message
+from utils.downloader import report_progress, session_pool
+
+logger = logging.getLogger(__name__)
+
+PART_SIZE = 512 * 1024 # upload.Save*FilePart maximum
+BIG_FILE_SIZE = 10 * 1024 * 1024 # Telegram requires SaveBigFilePart/InputFileBig above this
+
+
+class PartResendError(RuntimeError):
+    """Telegram asked for a part of an upload again (FILE_PART_MISSING) and the source cannot re-send it."""
+
+
+class UploadSource(abc.ABC):
+    """
+    Base for objects passed to send_video/send_document/... in place of a path. Pyrogram hands
+    non-path media to Client.save_file, which the hook below routes to save() instead of reading a file.
+    """
+    name: str = ''
+
+    @abc.abstractmethod
+    async def save(self, client: Client, progress: Optional[Callable] = None, progress_args: tuple = ()) -> Any:
+        """Uploads the file's parts and returns the InputFile/InputFileBig to register."""
+
+    async def save_part(self, client: Client, file_id: int, file_part: int) -> Any:
+        """Uploads one part of the file saved as file_id again; sources that cannot replay a part raise PartResendError."""
+        raise PartResendError(f'{type(self).__name__} {self.name} cannot re-send part {file_part}')
+
+
+def install_save_file_hook():
+    """Patches Client.save_file once so UploadSource objects upload themselves."""
+    original = Client.save_file
+    if getattr(original, 'upload_source_hook', False):
+        return
+
+    async def save_file(self, path, file_id: int = None, file_part: int = 0, progress: Callable = None, progress_args: tuple = ()):
+        if isinstance(path, UploadSource):
+            if file_id is not None:
+                # Pyrogram's FilePartMissing recovery: one part of an upload already sent is missing
+                return await path.save_part(self, file_id, file_part)
+            return await path.save(self, progress, progress_args)
+        return await original(self, path, file_id=file_id, file_part=file_part, progress=progress, progress_args=progress_args)
+
+    save_file.upload_source_hook = True
+    Client.save_file = save_file
+
+
+class UploadedFile(UploadSource):
+    """A file whose parts are already uploaded (e.g. album members uploaded side by side before send_media_group)."""
+
+    def __init__(self, input_file: Any, name: str):
+        self.input_file = input_file
+        self.name = name
+
+    async def save(self, client: Client, progress: Optional[Callable] = None, progress_args: tuple = ()) -> Any:
+        return self.input_file
+
+
+class RelayFile(UploadSource):
+    """
+    Streams a source message with stream_media() and feeds the chunks straight into upload-part RPCs
+    through a bounded ring of PART_SIZE buffers, so no byte of the file touches the disk.
+    A stream can be consumed once; a repeated save() after success returns the same InputFile.
+    """
+
+    def __init__(self, source_client: Client, message: Message, name: str, size: int, buffer_parts: int = 8, upload_workers: int = 2):
+        self.source_client = source_client
+        self.message = message
+        self.name = name
+        self.size = size
+        self.buffer_parts = max(1, buffer_parts)
+        self.upload_workers = max(1, upload_workers)
+        self.input_file = None
+        self._consumed = False
+
+    async def save(self, client: Client, progress: Optional[Callable] = None, progress_args: tuple = ()) -> Any:
+        if self.input_file is not None:
+            return self.input_file # send_* retried after the upload finished (e.g. FloodWait on SendMedia)
+        if self._consumed:
+            raise RuntimeError('Relay stream was already consumed')
+        self._consumed = True
+
+        file_id = random.getrandbits(63)
+        total_parts = max(1, (self.size + PART_SIZE - 1) // PART_SIZE)
+        is_big = self.size > BIG_FILE_SIZE
+        ring: asyncio.Queue = asyncio.Queue(maxsize=self.buffer_parts)
+        uploaded = 0
+        produced = 0
+
+        async def produce():
+            nonlocal produced
+            pending = bytearray()
+            async for chunk in self.source_client.stream_media(self.message):
+                pending += chunk
+                while len(pending) >= PART_SIZE:
+                    await ring.put((produced, bytes(pending[:PART_SIZE])))
+                    del pending[:PART_SIZE]
+                    produced += 1
+            if pending or produced == 0:
+                await ring.put((produced, bytes(pending)))
+                produced += 1
+            for _ in range(self.upload_workers):
+                await ring.put(None)
+
+        async def upload():
+            nonlocal uploaded
+            session = await session_pool.acquire(client, await client.storage.dc_id())
+            broken = False
+            try:
+                while (entry := await ring.get()) is not None:
+                    index, data = entry
+                    if index >= total_parts:
+                        raise RuntimeError(f'Source stream is larger than the expected {self.size} bytes')
+                    if is_big:
+                        rpc = raw.functions.upload.SaveBigFilePart(file_id=file_id, file_part=index, file_total_parts=total_parts, bytes=data)
+                    else:
+                        rpc = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=index, bytes=data)
+                    if not await session.invoke(rpc):
+                        raise RuntimeError(f'Upload of part {index} was rejected')
+                    uploaded += len(data)
+                    await report_progress(progress, min(uploaded, self.size), self.size, progress_args)
+            except BaseException:
+                broken = True
+                raise
+            finally:
+                await session_pool.release(client, await client.storage.dc_id(), session, broken=broken)
+
+        tasks = [asyncio.create_task(produce())] + [asyncio.create_task(upload()) for _ in range(self.upload_workers)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        if produced != total_parts:
+            raise RuntimeError(f'Source stream ended after {produced}/{total_parts} parts')
+
+        if is_big:
+            self.input_file = raw.types.InputFileBig(id=file_id, parts=total_parts, name=self.name)
+        else:
+            self.input_file = raw.types.InputFile(id=file_id, parts=total_parts, name=self.name, md5_checksum='')
+        return self.input_file
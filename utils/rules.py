@@ -0,0 +1,96 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import functools
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+Rule = Tuple[str, str] # (word, replacement); a delete word is a rule with an empty replacement
+
+
+def _overlaps(a: str, b: str) -> bool:
+    """True if a proper suffix of a is a prefix of b or a proper prefix of a is a suffix of b."""
+    return any(a[-k:] == b[:k] or a[:k] == b[-k:] for k in range(1, min(len(a), len(b))))
+
+
+def _interacts(earlier: Rule, later: Rule) -> bool:
+    """
+    True if applying `earlier` can create, destroy or shift an occurrence of `later`'s word, so the
+    two give a different result in one pass than one after the other.
+    """
+    (word, replacement), (other, _) = earlier, later
+    if not replacement:
+        if len(other) > 1:
+            return True # Deleting joins the surrounding text, which may spell the later word
+    elif other in replacement or replacement in other or _overlaps(replacement, other):
+        return True # The replacement may produce the later word, alone or with its neighbours
+    return word in other or _overlaps(word, other) # A shorter earlier word eats into the later one
+
+
+class _Stage:
+    """Rules that do not interact, applied together by one regex in a single scan of the text."""
+
+    def __init__(self, rules: List[Rule]):
+        self.table = dict(rules)
+        # Longest first: at one position the longer word wins, as when it was replaced before its substrings
+        words = sorted(self.table, key=len, reverse=True)
+        self.pattern: Pattern = re.compile("|".join(map(re.escape, words)))
+
+    def apply(self, text: str) -> str:
+        return self.pattern.sub(lambda m: self.table[m.group(0)], text)
+
+
+def _stages(rules: Iterable[Rule]) -> List[_Stage]:
+    """
+    Splits rules, in the user's order, into consecutive stages of mutually independent rules.
+    Each stage is one regex pass; running the stages in order gives exactly the result of one
+    str.replace per rule. Rule sets without overlapping words compile to a single stage.
+    """
+    stages: List[List[Rule]] = []
+    for rule in rules:
+        if not rule[0]:
+            continue # An empty word would match between every character
+        if stages and not any(_interacts(earlier, rule) for earlier in stages[-1]):
+            stages[-1].append(rule)
+        else:
+            stages.append([rule])
+    return [_Stage(group) for group in stages]
+
+
+class RuleSet:
+    """
+    A user's delete and replacement words compiled into regex stages (usually a single one).
+    Results are the same as applying the rules one by one in order, in a single pass per stage
+    instead of one str.replace pass per rule.
+    """
+
+    def __init__(self, delete_words: Tuple[str, ...], replacements: Tuple[Tuple[str, str], ...]):
+        self.delete_set = frozenset(delete_words)
+        self.text_stages = _stages(replacements)
+        # File names drop delete words anywhere, then apply the replacements
+        self.name_stages = _stages([(w, "") for w in delete_words] + list(replacements))
+
+    def apply_text(self, text: str) -> str:
+        """Caption/text rules: replace words, then drop whitespace-separated words equal to a delete word."""
+        for stage in self.text_stages:
+            text = stage.apply(text)
+        if self.delete_set:
+            text = " ".join(w for w in text.split() if w not in self.delete_set)
+        return text
+
+    def apply_name(self, name: str) -> str:
+        """File name rules: delete words anywhere in the name, then replace words."""
+        for stage in self.name_stages:
+            name = stage.apply(name)
+        return name
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile(delete_words: Tuple[str, ...], replacements: Tuple[Tuple[str, str], ...]) -> RuleSet:
+    return RuleSet(delete_words, replacements)
+
+
+def compile_rules(delete_words: Optional[Iterable[str]], replacements: Optional[Dict[str, str]]) -> RuleSet:
+    """Returns the compiled RuleSet for these rules; it is rebuilt only when the rules change."""
+    return _compile(tuple(delete_words or ()), tuple((replacements or {}).items()))
@@ -0,0 +1,145 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class Job:
+    """A unit of work submitted to the scheduler (one /batch or /single run)."""
+    _ids = itertools.count(1)
+
+    def __init__(self, user_id: int, run: Callable[[], Awaitable[Any]], premium: bool = False, on_position: Optional[PositionCallback] = None, name: str = ''):
+        self.id = next(Job._ids)
+        self.user_id = user_id
+        self.run = run # Coroutine factory, called once when the job is started
+        self.premium = premium
+        self.on_position = on_position
+        self.name = name or f'job-{self.id}'
+        self.task: Optional[asyncio.Task] = None
+        self.last_position: Optional[int] = None
+
+
+class BatchScheduler:
+    """
+    Runs submitted jobs as supervised background tasks with a global concurrency cap.
+    Waiting jobs are kept in two lanes (premium first); inside a lane users are served
+    round-robin so one user's queued jobs cannot starve everyone else.
+    """
+
+    def __init__(self, max_concurrent: int = 5):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.running: Dict[int, Job] = {} # {job_id: job}
+        self._lanes: Dict[bool, "OrderedDict[int, Deque[Job]]"] = {True: OrderedDict(), False: OrderedDict()} # {premium: {user_id: jobs}}
+        self.accepting = True # False once drain() has started
+
+    # --- Queue bookkeeping ---
+    def _waiting_order(self) -> List[Job]:
+        """Waiting jobs in the order they would be started."""
+        order: List[Job] = []
+        for premium in (True, False):
+            queues = [list(q) for q in self._lanes[premium].values()]
+            for depth in range(max((len(q) for q in queues), default=0)):
+                order += [q[depth] for q in queues if depth < len(q)]
+        return order
+
+    def _pop_next(self) -> Optional[Job]:
+        for premium in (True, False):
+            lane = self._lanes[premium]
+            if lane:
+                user_id, queue = next(iter(lane.items()))
+                job = queue.popleft()
+                del lane[user_id]
+                if queue:
+                    lane[user_id] = queue # Rotate the user to the back of the lane
+                return job
+        return None
+
+    def queued_count(self) -> int:
+        return sum(len(q) for lane in self._lanes.values() for q in lane.values())
+
+    def position(self, job: Job) -> int:
+        """1-based queue position of a waiting job, 0 if it is running or unknown."""
+        for index, waiting in enumerate(self._waiting_order()):
+            if waiting is job:
+                return index + 1
+        return 0
+
+    async def _notify_positions(self):
+        for index, job in enumerate(self._waiting_order()):
+            if job.on_position and job.last_position != index + 1:
+                job.last_position = index + 1
+                try:
+                    await job.on_position(index + 1)
+                except Exception as e:
+                    logger.warning(f"Queue position update failed for {job.name}: {e}")
+
+    # --- Public API ---
+    def submit(self, job: Job) -> Job:
+        """Queues a job and starts it right away if a slot is free."""
+        if not self.accepting:
+            raise RuntimeError('Scheduler is shutting down')
+        self._lanes[job.premium].setdefault(job.user_id, deque()).append(job)
+        self._dispatch()
+        asyncio.create_task(self._notify_positions())
+        return job
+
+    def cancel_queued(self, user_id: int) -> bool:
+        """Drops a user's jobs that have not started yet."""
+        removed = False
+        for lane in self._lanes.values():
+            if lane.pop(user_id, None):
+                removed = True
+        if removed:
+            asyncio.create_task(self._notify_positions())
+        return removed
+
+    def is_queued(self, user_id: int) -> bool:
+        return any(user_id in lane for lane in self._lanes.values())
+
+    async def drain(self, timeout: float) -> List[Job]:
+        """
+        Stops accepting jobs, drops the waiting ones and gives running jobs up to `timeout`
+        seconds to finish before cancelling them. Returns the jobs that never started.
+        """
+        self.accepting = False
+        waiting = self._waiting_order()
+        for lane in self._lanes.values():
+            lane.clear()
+        tasks = [job.task for job in self.running.values() if job.task]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=max(0, timeout))
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Cancelled {len(pending)} job(s) still running after the {timeout}s drain deadline")
+                await asyncio.gather(*pending, return_exceptions=True)
+        return waiting
+
+    def _dispatch(self):
+        while len(self.running) < self.max_concurrent:
+            job = self._pop_next()
+            if not job:
+                break
+            self.running[job.id] = job
+            job.task = asyncio.create_task(self._supervise(job), name=job.name)
+
+    async def _supervise(self, job: Job):
+        try:
+            await job.run()
+        except asyncio.CancelledError:
+            logger.info(f"{job.name} for user {job.user_id} was cancelled")
+        except Exception as e:
+            logger.exception(f"{job.name} for user {job.user_id} crashed: {e}")
+        finally:
+            self.running.pop(job.id, None)
+            self._dispatch()
+            await self._notify_positions()
@@ -0,0 +1,86 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import io
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+from PIL import Image
+from utils.thumbs import THUMB_SIZE, THUMB_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_thumbnail(data: bytes) -> bytes:
+    """Re-encodes any image as an RGB JPEG that fits in THUMB_SIZE x THUMB_SIZE and Telegram's size limit."""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGB')
+        image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+        for quality in (85, 70, 50):
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=quality, optimize=True)
+            if out.tell() <= THUMB_MAX_BYTES:
+                break
+    return out.getvalue()
+
+
+class ThumbStore:
+    """
+    Custom thumbnails kept in a GridFS bucket, so every replica sees the same ones. Each upload gets
+    a new version; the current version is stored with the user's settings and the bytes of recently
+    used versions are kept in memory, so a changed or removed thumbnail is never served stale.
+    """
+
+    def __init__(self, bucket, max_entries: int):
+        self.bucket = bucket
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[int, Tuple[str, bytes]]" = OrderedDict() # {user_id: (version, jpeg)}
+
+    def _remember(self, user_id: int, version: str, data: bytes):
+        self.entries[user_id] = (version, data)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def put(self, user_id: int, image: bytes) -> str:
+        """Normalizes and stores a new thumbnail, drops the older ones and returns the new version."""
+        data = await asyncio.to_thread(normalize_thumbnail, image)
+        version = uuid.uuid4().hex
+        await self.bucket.upload_from_stream(f'{user_id}.jpg', data, metadata={'user_id': user_id, 'version': version})
+        await self._delete({'metadata.user_id': user_id, 'metadata.version': {'$ne': version}})
+        self._remember(user_id, version, data)
+        return version
+
+    async def get(self, user_id: int, version: str) -> Optional[bytes]:
+        """JPEG bytes of the given thumbnail version (the newest one if it was replaced), from memory when possible."""
+        entry = self.entries.get(user_id)
+        if entry and entry[0] == version:
+            self.entries.move_to_end(user_id)
+            return entry[1]
+        async for grid_out in self.bucket.find({'metadata.user_id': user_id, 'metadata.version': version}, limit=1):
+            data = await grid_out.read()
+            self._remember(user_id, version, data)
+            return data
+        # A replica whose cached settings predate the user's latest upload asks for a version put() already
+        # deleted; the newest stored one is what its settings will name once they are refreshed
+        async for grid_out in self.bucket.find({'metadata.user_id': user_id}, sort=[('uploadDate', -1)], limit=1):
+            logger.info(f"Thumbnail version {version} of user {user_id} was replaced, serving the newest one")
+            data = await grid_out.read()
+            self._remember(user_id, grid_out.metadata['version'], data)
+            return data
+        logger.warning(f"Thumbnail version {version} of user {user_id} is missing from GridFS")
+        return None
+
+    async def remove(self, user_id: int):
+        self.entries.pop(user_id, None)
+        await self._delete({'metadata.user_id': user_id})
+
+    async def _delete(self, query: dict):
+        async for grid_out in self.bucket.find(query):
+            try:
+                await self.bucket.delete(grid_out._id)
+            except Exception as e:
+                logger.warning(f"Could not delete thumbnail file {grid_out._id}: {e}")
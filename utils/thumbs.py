@@ -0,0 +1,152 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import io
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+import aiohttp
+from config import THUMB_WORKERS
+
+logger = logging.getLogger(__name__)
+
+THUMB_SIZE = 320 # Telegram's maximum thumbnail width/height
+THUMB_MAX_BYTES = 200 * 1024 # Telegram rejects larger thumbnails
+FFMPEG_TIMEOUT = 60
+REMOTE_CACHE_ENTRIES = 64 # thumbnail/cover images fetched by URL kept in memory
+REMOTE_MAX_BYTES = 5 * 1024 * 1024 # larger remote images are not thumbnails; skip them
+
+
+def as_upload(data: bytes, name: str = 'thumb.jpg') -> io.BytesIO:
+    """Wraps JPEG bytes in a named in-memory file, accepted as thumb= by Pyrogram and Telethon."""
+    buffer = io.BytesIO(data)
+    buffer.name = name
+    return buffer
+
+
+class ThumbnailService:
+    """
+    Grabs video thumbnails with at most `workers` ffmpeg processes at a time. ffmpeg seeks on the
+    input and decodes only keyframes, scales to fit THUMB_SIZE and writes the JPEG to a pipe,
+    so nothing is written to disk and concurrent jobs cannot collide.
+    """
+
+    def __init__(self, workers: int):
+        self.slots = asyncio.Semaphore(max(1, workers))
+
+    async def _grab(self, path: str, position: float, quality: int) -> Optional[bytes]:
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-skip_frame', 'nokey', '-ss', f'{position:.2f}', '-i', path,
+            '-frames:v', '1', '-an', '-sn',
+            '-vf', f'scale={THUMB_SIZE}:{THUMB_SIZE}:force_original_aspect_ratio=decrease',
+            '-q:v', str(quality), '-f', 'image2pipe', '-vcodec', 'mjpeg', 'pipe:1',
+        ]
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), FFMPEG_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logger.warning(f"ffmpeg timed out grabbing a thumbnail from {path}")
+            return None
+        if process.returncode != 0 or not stdout:
+            if stderr:
+                logger.warning(f"ffmpeg could not grab a thumbnail from {path}: {stderr.decode(errors='ignore').strip()}")
+            return None
+        return stdout
+
+    async def capture(self, path: str, duration: float) -> Optional[bytes]:
+        """JPEG bytes of a keyframe near the middle of the video, or None."""
+        async with self.slots:
+            try:
+                # The midpoint can lie past the last keyframe of short clips; the first frame is the fallback
+                for position in dict.fromkeys((max(0.0, duration / 2), 0.0)):
+                    data = await self._grab(path, position, quality=3)
+                    if data and len(data) > THUMB_MAX_BYTES:
+                        data = await self._grab(path, position, quality=10)
+                    if data and len(data) <= THUMB_MAX_BYTES:
+                        return data
+            except FileNotFoundError:
+                logger.error("ffmpeg is not installed; videos are sent without a generated thumbnail")
+        return None
+
+
+async def source_thumbnail(client, media) -> Optional[io.BytesIO]:
+    """Downloads the smallest thumbnail Telegram already has for a media (a few KB), or None."""
+    thumbs = getattr(media, 'thumbs', None) or []
+    if not thumbs:
+        return None
+    smallest = min(thumbs, key=lambda t: (t.width * t.height, t.file_size or 0))
+    try:
+        data = await client.download_media(smallest.file_id, in_memory=True)
+    except Exception as e:
+        logger.warning(f"Could not download the source thumbnail: {e}")
+        return None
+    return as_upload(data.getvalue()) if data else None
+
+
+class RemoteImages:
+    """
+    Fetches thumbnail and cover-art URLs (e.g. yt-dlp's info['thumbnail']) into memory over one
+    long-lived, connection-pooled aiohttp session. Recently used images are kept in an LRU keyed
+    by URL, and concurrent fetches of one URL share a single request.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.pending: Dict[str, asyncio.Task] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def _session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=16, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self.session
+
+    async def _download(self, url: str) -> Optional[bytes]:
+        try:
+            async with self._session().get(url) as response:
+                if response.status != 200 or (response.content_length or 0) > REMOTE_MAX_BYTES:
+                    logger.warning(f"Skipping image {url}: HTTP {response.status}, {response.content_length} bytes")
+                    return None
+                data = await response.content.read(REMOTE_MAX_BYTES + 1)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Failed to download image {url}: {e}")
+            return None
+        if len(data) > REMOTE_MAX_BYTES:
+            return None
+        self.entries[url] = data
+        self.entries.move_to_end(url)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return data
+
+    async def get(self, url: Optional[str]) -> Optional[bytes]:
+        """Image bytes at url, or None if there is no URL or it cannot be fetched."""
+        if not url:
+            return None
+        data = self.entries.get(url)
+        if data is not None:
+            self.entries.move_to_end(url)
+            return data
+        task = self.pending.get(url)
+        if task is None:
+            task = asyncio.create_task(self._download(url))
+            self.pending[url] = task
+            task.add_done_callback(lambda _: self.pending.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.entries.clear()
+
+
+thumbnailer = ThumbnailService(THUMB_WORKERS)
+remote_images = RemoteImages(REMOTE_CACHE_ENTRIES)
@@ -0,0 +1,155 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import os
+import random
+import weakref
+from typing import Any, Callable, List, Optional, Union
+from pyrogram import Client, raw
+from config import UPLOAD_CONNECTIONS, PARALLEL_UPLOAD_MIN_MB
+from utils.downloader import report_progress, session_pool
+from utils.relay import UploadSource, PartResendError, PART_SIZE, BIG_FILE_SIZE
+
+logger = logging.getLogger(__name__)
+
+PART_RETRIES = 3
+SPLIT_SIZE = 3900 * PART_SIZE # ~1.9 GB pieces: under the 2 GB bot limit and aligned to upload parts
+
+# Part concurrency per client; clients not listed use UPLOAD_CONNECTIONS
+_connections: "weakref.WeakKeyDictionary[Client, int]" = weakref.WeakKeyDictionary()
+
+
+def set_upload_connections(client: Client, connections: int):
+    _connections[client] = max(1, connections)
+
+
+def upload_connections(client: Client) -> int:
+    return _connections.get(client, max(1, UPLOAD_CONNECTIONS))
+
+
+class ParallelUpload(UploadSource):
+    """
+    A local file uploaded as concurrent upload-part RPCs, each worker on its own media session and
+    reading its parts in a thread, instead of Pyrogram's one-part-at-a-time save_file.
+    offset/length make it a view of a byte range of the file, uploaded as a file of its own.
+    save() returns the InputFile/InputFileBig the send_* call then registers; it is kept so a
+    retried send_* does not upload the file again.
+    """
+
+    def __init__(self, path: str, name: Optional[str] = None, offset: int = 0, length: Optional[int] = None):
+        self.path = path
+        self.name = name or os.path.basename(path)
+        self.offset = offset
+        self.size = max(0, os.path.getsize(path) - offset) if length is None else length
+        self.input_file = None
+
+    @property
+    def total_parts(self) -> int:
+        return max(1, (self.size + PART_SIZE - 1) // PART_SIZE)
+
+    def _read_part(self, index: int) -> bytes:
+        position = index * PART_SIZE
+        # Own descriptor per read: a cancelled worker's thread may still be reading after save() returned
+        with open(self.path, 'rb', buffering=0) as f:
+            return os.pread(f.fileno(), min(PART_SIZE, self.size - position), self.offset + position)
+
+    async def _part_rpc(self, file_id: int, index: int):
+        data = await asyncio.to_thread(self._read_part, index) # A cold or slow disk would otherwise stall the event loop
+        if self.size > BIG_FILE_SIZE:
+            return raw.functions.upload.SaveBigFilePart(file_id=file_id, file_part=index, file_total_parts=self.total_parts, bytes=data), len(data)
+        return raw.functions.upload.SaveFilePart(file_id=file_id, file_part=index, bytes=data), len(data)
+
+    async def save_part(self, client: Client, file_id: int, file_part: int) -> Any:
+        """Re-sends only part file_part of the upload file_id, which Telegram reported missing."""
+        if self.input_file is None or self.input_file.id != file_id or not 0 <= file_part < self.total_parts:
+            raise PartResendError(f'{self.name} has no part {file_part} of upload {file_id}')
+        dc_id = await client.storage.dc_id()
+        rpc, _ = await self._part_rpc(file_id, file_part)
+        session = await session_pool.acquire(client, dc_id)
+        broken = True
+        try:
+            if not await session.invoke(rpc):
+                raise RuntimeError(f'Upload of part {file_part} was rejected')
+            broken = False
+        finally:
+            await session_pool.release(client, dc_id, session, broken=broken)
+        return self.input_file
+
+    async def save(self, client: Client, progress: Optional[Callable] = None, progress_args: tuple = ()) -> Any:
+        if self.input_file is not None:
+            return self.input_file
+
+        file_id = random.getrandbits(63)
+        total_parts = self.total_parts
+        is_big = self.size > BIG_FILE_SIZE
+        next_part = 0
+        uploaded = 0
+        dc_id = await client.storage.dc_id()
+
+        async def worker():
+            nonlocal next_part, uploaded
+            session = await session_pool.acquire(client, dc_id)
+            try:
+                while next_part < total_parts:
+                    index, next_part = next_part, next_part + 1
+                    rpc, length = await self._part_rpc(file_id, index)
+                    for attempt in range(PART_RETRIES):
+                        try:
+                            if await session.invoke(rpc):
+                                break
+                            raise RuntimeError(f'Upload of part {index} was rejected')
+                        except (asyncio.CancelledError, KeyboardInterrupt):
+                            raise
+                        except Exception as e:
+                            if attempt == PART_RETRIES - 1:
+                                raise
+                            logger.warning(f"Part {index} of {self.name} failed ({e}), retrying on a new session")
+                            await session_pool.release(client, dc_id, session, broken=True)
+                            session = None
+                            session = await session_pool.acquire(client, dc_id)
+                    uploaded += length
+                    await report_progress(progress, min(uploaded, self.size), self.size, progress_args)
+            except BaseException:
+                if session is not None:
+                    await session_pool.release(client, dc_id, session, broken=True)
+                    session = None
+                raise
+            finally:
+                if session is not None:
+                    await session_pool.release(client, dc_id, session)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(upload_connections(client), total_parts))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+
+        if is_big:
+            self.input_file = raw.types.InputFileBig(id=file_id, parts=total_parts, name=self.name)
+        else:
+            self.input_file = raw.types.InputFile(id=file_id, parts=total_parts, name=self.name, md5_checksum='')
+        return self.input_file
+
+
+def split_file(path: str, part_size: int = SPLIT_SIZE) -> List[ParallelUpload]:
+    """
+    Views of consecutive part_size ranges of a file, named name.partNNN.ext. Each uploads straight
+    from the original file, so splitting needs no part files and no extra memory.
+    """
+    size = os.path.getsize(path)
+    base_name, file_ext = os.path.splitext(os.path.basename(path))
+    return [ParallelUpload(path, f"{base_name}.part{str(number).zfill(3)}{file_ext}", offset, min(part_size, size - offset))
+            for number, offset in enumerate(range(0, size, part_size))]
+
+
+def upload_source(file: Union[str, Any], name: Optional[str] = None) -> Union[str, Any]:
+    """Wraps a local path large enough to benefit from parallel parts; anything else is returned unchanged."""
+    if isinstance(file, str) and os.path.isfile(file) and os.path.getsize(file) >= PARALLEL_UPLOAD_MIN_MB * 1024 * 1024:
+        return ParallelUpload(file, name)
+    return file
@@ -0,0 +1,92 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from pyrogram import Client
+from pyrogram.enums import ChatMemberStatus, ChatType
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TTL = 600 # seconds a "can this session post in that chat" answer is trusted
+
+
+class UploaderPool:
+    """
+    Premium user sessions able to upload files over 2 GB. lease() hands out the connected session
+    with the fewest uploads in flight, at most per_session at a time each, and waits when all are busy.
+    Sessions a caller already tried (e.g. after a failed upload) can be excluded.
+    """
+
+    def __init__(self, per_session: int):
+        self.per_session = max(1, per_session)
+        self.clients: List[Client] = []
+        self.load: Dict[Client, int] = {}
+        self.access: Dict[Tuple[Client, int], Tuple[float, bool]] = {} # {(client, chat_id): (expiry, can_post)}
+        self._changed = asyncio.Condition()
+
+    def register(self, clients: Iterable[Client]):
+        for client in clients:
+            if client in self.load:
+                continue
+            if not getattr(client.me, 'is_premium', False):
+                logger.warning(f"Session {client.name} is not premium and cannot upload files over 2 GB, skipping it")
+                continue
+            self.clients.append(client)
+            self.load[client] = 0
+        logger.info(f"Large-file uploader pool: {len(self.clients)} premium sessions, {self.per_session} uploads each")
+
+    def available(self, exclude: Iterable[Client] = ()) -> List[Client]:
+        excluded = set(exclude)
+        return [c for c in self.clients if c.is_connected and c not in excluded]
+
+    def _pick(self, exclude: Iterable[Client]) -> Optional[Client]:
+        candidates = [c for c in self.available(exclude) if self.load[c] < self.per_session]
+        return min(candidates, key=lambda c: self.load[c]) if candidates else None
+
+    @asynccontextmanager
+    async def lease(self, exclude: Iterable[Client] = ()):
+        """Yields the least-loaded session, or None if no session outside exclude is connected."""
+        exclude = list(exclude)
+        async with self._changed:
+            while (client := self._pick(exclude)) is None:
+                if not self.available(exclude):
+                    client = None
+                    break
+                await self._changed.wait()
+            if client is not None:
+                self.load[client] += 1
+        try:
+            yield client
+        finally:
+            if client is not None:
+                async with self._changed:
+                    self.load[client] -= 1
+                    self._changed.notify_all()
+
+    async def can_post(self, client: Client, chat_id: int) -> bool:
+        """True if the session can post media straight into chat_id (cached for ACCESS_TTL)."""
+        key = (client, chat_id)
+        cached = self.access.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        allowed = False
+        try:
+            chat = await client.get_chat(chat_id)
+            if chat.type in (ChatType.GROUP, ChatType.SUPERGROUP, ChatType.CHANNEL):
+                member = await client.get_chat_member(chat_id, 'me')
+                if member.status == ChatMemberStatus.OWNER:
+                    allowed = True
+                elif member.status == ChatMemberStatus.ADMINISTRATOR:
+                    allowed = chat.type != ChatType.CHANNEL or bool(member.privileges and member.privileges.can_post_messages)
+                elif member.status == ChatMemberStatus.MEMBER:
+                    allowed = chat.type != ChatType.CHANNEL
+            # Private chats (the user's chat with the bot) stay on the bot: a user session would post as itself
+        except Exception as e:
+            logger.info(f"Session {client.name} cannot post in {chat_id}: {e}")
+        self.access[key] = (time.monotonic() + ACCESS_TTL, allowed)
+        return allowed
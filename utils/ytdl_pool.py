@@ -0,0 +1,216 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from config import YT_COOKIES, INSTA_COOKIES, YTDL_WORKERS, YTDL_INFO_TTL
+from utils.ytdl_worker import HEADER, encode
+
+logger = logging.getLogger(__name__)
+
+PROFILES = {'yt': YT_COOKIES, 'insta': INSTA_COOKIES, 'none': None} # cookie profile -> cookies.txt contents
+MAX_INFOS = 256 # extracted info dicts kept for YTDL_INFO_TTL
+TRACKING_PARAMS = {'si', 'feature', 'igsh', 'igshid', 'fbclid', 'gclid', 'pp'}
+
+
+class YtdlError(Exception):
+    """yt-dlp failed inside a worker; the message is the worker's error."""
+
+
+def normalize_url(url: str) -> str:
+    """
+    Cache key for a link: lowercase host without www./m., no fragment, tracking parameters dropped
+    and the query sorted; youtu.be and /shorts/ links become youtube.com/watch?v=.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip('/') or '/'
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k not in TRACKING_PARAMS and not k.startswith('utm_')]
+    if host == 'youtu.be' and path != '/':
+        host, query, path = 'youtube.com', [('v', path.lstrip('/'))] + query, '/watch'
+    elif host == 'youtube.com' and path.startswith('/shorts/'):
+        query, path = [('v', path[len('/shorts/'):])] + query, '/watch'
+    return urlunsplit(('https', host, path, urlencode(sorted(query)), ''))
+
+
+# --- Event loop side; the worker itself lives in utils/ytdl_worker.py ---
+
+class _Worker:
+    """One `python -m utils.ytdl_worker` process, talking length-prefixed pickles over stdin/stdout."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+
+    @classmethod
+    async def start(cls, cookie_files: Dict[str, Optional[str]]) -> "_Worker":
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, (root, os.environ.get('PYTHONPATH'))))}
+        # A fresh interpreter running only the worker module: the bot's __main__ and clients are never imported
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'utils.ytdl_worker', json.dumps(cookie_files),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, env=env,
+        )
+        return cls(process)
+
+    async def send(self, message: Any):
+        self.process.stdin.write(encode(message))
+        await self.process.stdin.drain()
+
+    async def recv(self) -> Any:
+        # IncompleteReadError (an EOFError) when the worker exits
+        (length,) = HEADER.unpack(await self.process.stdout.readexactly(HEADER.size))
+        return pickle.loads(await self.process.stdout.readexactly(length))
+
+    def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+
+    async def stop(self, timeout: float = 5):
+        try:
+            await self.send(None)
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.kill()
+            await self.process.wait()
+
+
+class YtdlPool:
+    """
+    A fixed number of yt-dlp worker processes, started on first use. Extraction, downloads and audio
+    tagging run there, so they never hold the event loop or the GIL of the bot process. Progress
+    events stream back over each worker's pipe while its job runs.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.cookie_files: Dict[str, Optional[str]] = {}
+        self.workers: List[_Worker] = []
+        self.idle: Optional[asyncio.Queue] = None
+        self.starting: Set[asyncio.Task] = set() # Replacements for killed workers
+        self._start_lock = asyncio.Lock()
+        self.infos: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict() # {(profile, url): (expiry, info)}
+        self.extracting: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def _start(self):
+        async with self._start_lock:
+            if self.idle is not None:
+                return
+            self._write_cookies()
+            self.idle = asyncio.Queue()
+            await asyncio.gather(*(self._add_worker() for _ in range(self.size)))
+        logger.info(f"Started {len(self.workers)} yt-dlp worker processes")
+
+    def _write_cookies(self):
+        for name, cookies in PROFILES.items():
+            path = None
+            if cookies:
+                with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.txt') as cookie_file:
+                    cookie_file.write(cookies)
+                    path = cookie_file.name
+            self.cookie_files[name] = path
+
+    async def _add_worker(self):
+        try:
+            worker = await _Worker.start(self.cookie_files)
+        except OSError as e:
+            logger.error(f"Could not start a yt-dlp worker: {e}")
+            return
+        if self.idle is None: # Closed meanwhile
+            await worker.stop()
+            return
+        self.workers.append(worker)
+        self.idle.put_nowait(worker)
+
+    def _replace(self, worker: _Worker):
+        worker.kill()
+        self.workers.remove(worker)
+        task = asyncio.create_task(self._add_worker())
+        self.starting.add(task)
+        task.add_done_callback(self.starting.discard)
+
+    async def run(self, job: Dict[str, Any], on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Any:
+        """Runs a job ({'op': 'extract' | 'download' | 'tag_audio', ...}) on an idle worker and returns its result."""
+        await self._start()
+        if not self.workers and not self.starting:
+            raise YtdlError('No yt-dlp worker is running')
+        worker = await self.idle.get()
+        try:
+            await worker.send(job)
+            while True:
+                kind, payload = await worker.recv()
+                if kind == 'progress':
+                    if on_progress:
+                        try:
+                            await on_progress(payload)
+                        except Exception as e:
+                            logger.debug(f"yt-dlp progress callback failed: {e}")
+                    continue
+                if kind == 'error':
+                    raise YtdlError(payload)
+                return payload
+        except (EOFError, OSError, asyncio.CancelledError) as e:
+            # A cancelled job cannot be interrupted inside the worker; the process is replaced instead
+            self._replace(worker)
+            worker = None
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise YtdlError(f'yt-dlp worker exited: {e}') from e
+        finally:
+            if worker is not None and self.idle is not None:
+                self.idle.put_nowait(worker)
+
+    async def extract(self, url: str, profile: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Info dict of a link, extracted once per YTDL_INFO_TTL; concurrent callers for the same link share
+        one extraction. Pass it as 'info' of a download job so the download skips extraction.
+        The returned dict is shared and must not be modified.
+        """
+        key = (profile or 'none', normalize_url(url))
+        entry = self.infos.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.infos.move_to_end(key)
+            return entry[1]
+        task = self.extracting.get(key)
+        if task is None:
+            task = asyncio.create_task(self.run({'op': 'extract', 'url': url, 'profile': profile}))
+            self.extracting[key] = task
+            task.add_done_callback(lambda t: self._extracted(key, t))
+        return await asyncio.shield(task)
+
+    def _extracted(self, key: Tuple[str, str], task: asyncio.Task):
+        self.extracting.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.infos[key] = (time.monotonic() + YTDL_INFO_TTL, task.result())
+        self.infos.move_to_end(key)
+        while len(self.infos) > MAX_INFOS:
+            self.infos.popitem(last=False)
+
+    async def close(self):
+        self.idle = None
+        for task in list(self.starting):
+            task.cancel()
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        self.workers.clear()
+        self.infos.clear()
+        for path in self.cookie_files.values():
+            if path and os.path.exists(path):
+                os.remove(path)
+        self.cookie_files.clear()
+
+
+ytdl_pool = YtdlPool(YTDL_WORKERS)
@@ -0,0 +1,121 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""
+yt-dlp worker process, started by utils.ytdl_pool as `python -m utils.ytdl_worker <cookie files>`.
+It imports only yt_dlp and mutagen, never the bot's config or clients. Jobs arrive on stdin and
+progress events and results go back on stdout, as length-prefixed pickles.
+"""
+
+import json
+import os
+import pickle
+import struct
+import sys
+import time
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+HEADER = struct.Struct('>I') # Frame length
+PROGRESS_INTERVAL = 1.0 # seconds between 'downloading' events sent by a worker
+
+
+def encode(message: Any) -> bytes:
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data)) + data
+
+
+def _read(stream: BinaryIO) -> Any:
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise EOFError
+    (length,) = HEADER.unpack(header)
+    return pickle.loads(stream.read(length))
+
+
+def _send_progress(send: Callable[[Any], None]) -> Callable[[Dict[str, Any]], None]:
+    last = [0.0]
+
+    def hook(d: Dict[str, Any]):
+        now = time.monotonic()
+        if d.get('status') == 'downloading' and now - last[0] < PROGRESS_INTERVAL:
+            return
+        last[0] = now
+        send(('progress', {k: d.get(k) for k in ('status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'speed', 'eta')}))
+    return hook
+
+
+def _send_postprocessing(send: Callable[[Any], None]) -> Callable[[Dict[str, Any]], None]:
+    def hook(d: Dict[str, Any]):
+        if d.get('status') == 'started':
+            send(('progress', {'status': 'postprocessing', 'postprocessor': d.get('postprocessor')}))
+    return hook
+
+
+def _tag_audio(path: str, title: str, artist: str, comment: str, cover: Optional[bytes] = None):
+    """Writes ID3 title/artist/comment and the cover image bytes into an MP3."""
+    from mutagen.id3 import ID3, TIT2, TPE1, COMM, APIC
+    from mutagen.mp3 import MP3
+    audio_file = MP3(path, ID3=ID3)
+    try:
+        audio_file.add_tags()
+    except Exception:
+        pass
+    audio_file.tags["TIT2"] = TIT2(encoding=3, text=title)
+    audio_file.tags["TPE1"] = TPE1(encoding=3, text=artist)
+    audio_file.tags["COMM"] = COMM(encoding=3, lang="eng", desc="Comment", text=comment)
+    if cover:
+        mime = 'image/png' if cover.startswith(b'\x89PNG') else 'image/webp' if cover[8:12] == b'WEBP' else 'image/jpeg'
+        audio_file.tags["APIC"] = APIC(encoding=3, mime=mime, type=3, desc='Cover', data=cover)
+    audio_file.save()
+
+
+def _run_job(yt_dlp, warm: Dict[str, Any], cookie_files: Dict[str, Optional[str]], job: Dict[str, Any], send: Callable[[Any], None]) -> Any:
+    op, profile = job['op'], job.get('profile') or 'none'
+    if op == 'extract':
+        ydl = warm[profile]
+        return ydl.sanitize_info(ydl.extract_info(job['url'], download=False))
+    if op == 'download':
+        opts = {**job.get('opts', {}), 'cookiefile': cookie_files[profile],
+                'progress_hooks': [_send_progress(send)], 'postprocessor_hooks': [_send_postprocessing(send)]}
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            if job.get('info'):
+                # Reuse an earlier extraction: formats are re-selected with these options, the page is not fetched again
+                return ydl.sanitize_info(ydl.process_ie_result(job['info'], download=True))
+            return ydl.sanitize_info(ydl.extract_info(job['url'], download=True))
+    if op == 'tag_audio':
+        _tag_audio(**job['args'])
+        return None
+    raise ValueError(f'Unknown yt-dlp job {op}')
+
+
+def main(cookie_files: Dict[str, Optional[str]]):
+    # stdout carries the protocol; anything yt-dlp or ffmpeg prints goes to stderr instead
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    jobs = sys.stdin.buffer
+
+    def send(message: Any):
+        out.write(encode(message))
+        out.flush()
+
+    import yt_dlp
+    # One long-lived YoutubeDL per cookie profile; extractors and cookie jars stay loaded between jobs
+    warm = {name: yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'noplaylist': True, 'cookiefile': path})
+            for name, path in cookie_files.items()}
+    while True:
+        try:
+            job = _read(jobs)
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        try:
+            send(('result', _run_job(yt_dlp, warm, cookie_files, job, send)))
+        except Exception as e:
+            send(('error', f'{type(e).__name__}: {e}'))
+
+
+if __name__ == '__main__':
+    main(json.loads(sys.argv[1]))